@@ -1,15 +1,11 @@
 import os
 from google.adk.agents.llm_agent import Agent
 from google.adk.models.lite_llm import LiteLlm
-from .sub_agents import Gente_Montaña
-from .sub_agents.agentHierba.agent import root_agent as PastoBogotano
-from .sub_agents.datar_a_gente.agent import root_agent as DiarioIntuitivo
-from .sub_agents.GuatilaM.agent import root_agent as SequentialPipelineAgent
-from .sub_agents.LinaPuerto.agent import root_agent as agente_bosque
-from .sub_agents.Sebastian1022.agent import root_agent as agente_sonido
-from .sub_agents.ZolsemiYa.agent import root_agent as horaculo
+from . import config
+from .sub_agent_registry import SubAgentRegistry, SubAgentSpec
 
-root_agent = Agent(
+# Agente raíz sin sub-agentes: el registro los cuelga al materializarlos
+root_agent_core = Agent(
     model=LiteLlm(
         model="openrouter/minimax/minimax-m2:free",  # Especifica el modelo con prefijo 'openrouter/'
         api_key=os.getenv("OPENROUTER_API_KEY"),  # Lee la API key del entorno
@@ -18,13 +14,38 @@ root_agent = Agent(
     name='root_agent',
     description='Agente raíz DATAR - Estructura Ecológica Principal de Bogotá',
     instruction='Reflexiona y responde preguntas de manera clara y concisa siempre haciendo una primera pregunta sobre La Estructura Ecológica Principal de Bogotá.',
-    sub_agents=[
-        Gente_Montaña,
-        PastoBogotano,
-        DiarioIntuitivo,
-        SequentialPipelineAgent,
-        agente_bosque,
-        agente_sonido,
-        horaculo
+)
+
+# Sub-agentes por ruta de importación, en el orden en que ADK los ofrece para delegar
+SUB_AGENTS = SubAgentRegistry(
+    root_agent_core,
+    [
+        SubAgentSpec("Gente_Montaña", ".sub_agents.agent:root_agent"),
+        SubAgentSpec("PastoBogotano", ".sub_agents.agentHierba.agent:root_agent", ("pydub",)),
+        SubAgentSpec(
+            "DiarioIntuitivo",
+            ".sub_agents.datar_a_gente.agent:root_agent",
+            ("numpy", "PIL.Image", "matplotlib.pyplot"),
+        ),
+        SubAgentSpec("SequentialPipelineAgent", ".sub_agents.GuatilaM.agent:root_agent", ("google.genai",)),
+        SubAgentSpec(
+            "agente_bosque",
+            ".sub_agents.LinaPuerto.agent:root_agent",
+            ("mcp", "google.adk.tools.mcp_tool.mcp_toolset"),
+        ),
+        SubAgentSpec("agente_sonido", ".sub_agents.Sebastian1022.agent:root_agent"),
+        SubAgentSpec("horaculo", ".sub_agents.ZolsemiYa.agent:root_agent"),
     ],
+    package=__package__,
 )
+
+if not config.SUB_AGENTS_LAZY:
+    SUB_AGENTS.load_all()
+
+
+def __getattr__(name):
+    # `root_agent` (adk web, evaluaciones) es el árbol completo: se materializa al pedirlo
+    if name == "root_agent":
+        SUB_AGENTS.load_all()
+        return root_agent_core
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
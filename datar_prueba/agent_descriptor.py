@@ -0,0 +1,232 @@
+"""
+Descriptor inmutable del agente raíz para DATAR
+
+Los metadatos del agente (parámetros LiteLLM resueltos, nombre del modelo,
+árbol de sub-agentes y descripciones) no cambian entre peticiones, así que se
+calculan una sola vez al arrancar. Los endpoints de metadatos sirven bytes JSON
+ya serializados con su ETag; `build_agent_descriptor` se vuelve a llamar solo
+cuando se recarga la configuración de forma explícita o cuando el registro
+perezoso materializa un sub-agente.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from . import config
+
+
+# Atributos del objeto de modelo que pueden contener el identificador del modelo
+_MODEL_NAME_ATTRS = ("model", "model_name", "model_id", "_model", "name")
+
+
+@dataclass(frozen=True)
+class SubAgentDescriptor:
+    """Nodo del árbol de sub-agentes."""
+
+    name: str
+    description: str
+    sub_agents: Tuple["SubAgentDescriptor", ...] = ()
+    loaded: bool = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "sub_agents": [child.to_dict() for child in self.sub_agents],
+            "loaded": self.loaded,
+        }
+
+
+@dataclass(frozen=True)
+class JSONPayload:
+    """Cuerpo JSON serializado una vez, con su ETag fuerte."""
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_data(cls, data: Any) -> "JSONPayload":
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+@dataclass(frozen=True)
+class AgentDescriptor:
+    """Foto inmutable de los metadatos del agente raíz."""
+
+    name: str
+    description: str
+    instruction: Optional[str]
+    system_instruction: Optional[str]
+    model_repr: str
+    model_name: str
+    has_model: bool
+    litellm_params: Mapping[str, Any]
+    sub_agents: Tuple[SubAgentDescriptor, ...]
+    payloads: Mapping[str, JSONPayload]
+
+    @property
+    def model(self) -> str:
+        """Modelo LiteLLM efectivo para las llamadas de chat."""
+        return self.litellm_params.get("model", "")
+
+    def params(self) -> Dict[str, Any]:
+        """Copia mutable de los parámetros LiteLLM resueltos."""
+        return dict(self.litellm_params)
+
+
+def _extract_model_name(model_info: Any) -> str:
+    """Busca el identificador del modelo en sus atributos o, si no, en su `repr`."""
+    if model_info is None:
+        return "N/D"
+
+    for attr in _MODEL_NAME_ATTRS:
+        value = getattr(model_info, attr, None)
+        if value and isinstance(value, str) and value != "N/D":
+            return value
+
+    # Parsear: model='openrouter/minimax/minimax-m2:free' ...
+    model_str = str(model_info)
+    marker = "model='"
+    start = model_str.find(marker)
+    if start >= 0:
+        start += len(marker)
+        end = model_str.find("'", start)
+        if end > start:
+            return model_str[start:end]
+    return "N/D"
+
+
+def _resolve_litellm_params(agent: Any) -> Dict[str, Any]:
+    """Obtiene la configuración del modelo LiteLLM a partir del agente o del entorno."""
+    params: Dict[str, Any] = {}
+
+    agent_model = getattr(agent, "model", None)
+    if agent_model is not None:
+        for attr in ("model", "api_key", "api_base", "temperature", "max_tokens"):
+            value = getattr(agent_model, attr, None)
+            if value is not None:
+                params[attr] = value
+
+    if "model" not in params:
+        params["model"] = getattr(config, "AGENT_MODEL", "gpt-3.5-turbo")
+
+    if "api_key" not in params:
+        params["api_key"] = (
+            os.getenv("OPENROUTER_API_KEY")
+            or os.getenv("LITELLM_API_KEY")
+            or os.getenv("GOOGLE_API_KEY")
+        )
+
+    if "api_base" not in params:
+        api_base_env = (
+            os.getenv("LITELLM_API_BASE")
+            or os.getenv("OPENROUTER_API_BASE")
+            or os.getenv("LITELLM_API_URL")
+        )
+        if api_base_env:
+            params["api_base"] = api_base_env
+
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def _describe_sub_agents(agent: Any) -> Tuple[SubAgentDescriptor, ...]:
+    return tuple(
+        SubAgentDescriptor(
+            name=sub_agent.name,
+            description=getattr(sub_agent, "description", None) or "Sin descripción",
+            sub_agents=_describe_sub_agents(sub_agent),
+        )
+        for sub_agent in (getattr(agent, "sub_agents", None) or [])
+    )
+
+
+def _build_payloads(
+    agent: Any,
+    instruction: Optional[str],
+    model_repr: str,
+    model_name: str,
+    has_model: bool,
+    sub_agents: Tuple[SubAgentDescriptor, ...],
+) -> Dict[str, JSONPayload]:
+    """Cuerpos de `/agents`, `/agent/info` y `/root_agent/status`."""
+    sub_agent_dicts: List[Dict[str, Any]] = [sub_agent.to_dict() for sub_agent in sub_agents]
+    short_instruction = (
+        instruction[:100] + "..." if instruction and len(instruction) > 100 else instruction
+    )
+    return {
+        "agents": JSONPayload.from_data([{
+            "name": agent.name,
+            "description": agent.description,
+            "sub_agents": [sub_agent.name for sub_agent in sub_agents],
+        }]),
+        "agent_info": JSONPayload.from_data({
+            "name": agent.name,
+            "description": agent.description,
+            "instruction": instruction,
+            "model": model_repr,
+            "model_name": model_name,
+            "has_model": has_model,
+            "sub_agents": sub_agent_dicts,
+        }),
+        "root_agent_status": JSONPayload.from_data({
+            "status": "active",
+            "agent_name": agent.name,
+            "description": agent.description,
+            "instruction": short_instruction,
+            "has_model": has_model,
+            "model": model_repr,
+            "model_name": model_name,
+            "has_sub_agents": bool(sub_agents),
+            "sub_agents_count": len(sub_agents),
+            "is_root_agent": agent.name == "root_agent",
+        }),
+    }
+
+
+def build_agent_descriptor(agent: Any, pending: Sequence[str] = ()) -> AgentDescriptor:
+    """
+    Calcula el descriptor del agente leyendo su modelo, el entorno y `config.py`.
+
+    `pending` son sub-agentes declarados que aún no se han importado: se listan
+    por nombre, sin descripción ni sub-árbol.
+    """
+    model_info = getattr(agent, "model", None)
+    model_repr = str(model_info) if model_info else "N/D"
+    model_name = _extract_model_name(model_info)
+    instruction = getattr(agent, "instruction", None)
+    if instruction is not None and not isinstance(instruction, str):
+        instruction = str(instruction)
+    sub_agents = _describe_sub_agents(agent) + tuple(
+        SubAgentDescriptor(name=name, description="Sin cargar", loaded=False) for name in pending
+    )
+
+    return AgentDescriptor(
+        name=agent.name,
+        description=agent.description,
+        instruction=instruction,
+        system_instruction=instruction or getattr(config, "AGENT_INSTRUCTION", None),
+        model_repr=model_repr,
+        model_name=model_name,
+        has_model=model_info is not None,
+        litellm_params=MappingProxyType(_resolve_litellm_params(agent)),
+        sub_agents=sub_agents,
+        payloads=MappingProxyType(_build_payloads(
+            agent, instruction, model_repr, model_name, model_info is not None, sub_agents,
+        )),
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara la cabecera `If-None-Match` (lista, `*` o ETags débiles) con un ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
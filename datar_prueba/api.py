@@ -3,20 +3,56 @@ Servidor FastAPI para DATAR - Sistema Agéntico Ambiental
 Estructura Ecológica Principal de Bogotá
 """
 
+import asyncio
+import json
 import os
+import time
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.concurrency import run_in_threadpool
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from litellm import completion
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from litellm import token_counter
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 from datetime import datetime
 import uuid
 
 # PASO 1: Importar el agente raíz
-from .agent import root_agent
+from .agent import SUB_AGENTS, root_agent_core as root_agent
 from . import config
+from .agent_descriptor import build_agent_descriptor, etag_matches
+from .context_window import (
+    MESSAGE_OVERHEAD_TOKENS,
+    build_summary_request,
+    count_text_tokens,
+    ensure_token_count,
+    select_window,
+)
+from .hedging import Hedger
+from .intent_router import IntentRouter
+from .llm_client import LLMClient
+from .metrics import (
+    CHAT_FALLBACKS,
+    CHAT_STAGE_LATENCY,
+    CHAT_TIME_TO_FIRST_TOKEN,
+    LLM_IN_FLIGHT,
+    LLM_QUEUE_DEPTH,
+    REGISTRY,
+    RESPONSE_CACHE_LOOKUPS,
+    SESSION_CACHE_BYTES,
+    SESSIONS_CACHED,
+    MetricsMiddleware,
+    record_usage,
+)
+from .prompt_cache import PromptCacheStats, cache_hints, extract_cache_usage
+from .rate_limit import InMemoryRateLimitStorage, RateLimitMiddleware, SQLiteRateLimitStorage
+from .resilience import ResilientCaller
+from .response_cache import ResponseCache, make_cache_key
+from .singleflight import SingleFlight
+from .session_cache import SessionCache
+from .session_index import SessionIndex, decode_cursor, encode_cursor
+from .session_store import create_session_backend
+from .sub_agent_runner import SubAgentDispatcher, SubAgentNotFound
 
 # Validar que root_agent está correctamente inicializado
 if not root_agent:
@@ -27,13 +63,31 @@ if root_agent.name != 'root_agent':
 else:
     print(f"✅ root_agent inicializado correctamente: {root_agent.name}")
 
-# PASO 2: Sistema de gestión de sesiones en memoria
-# En producción, esto debería estar en una base de datos
-sessions_store: Dict[str, Dict[str, Any]] = {}
+# Metadatos del agente calculados una sola vez (ver POST /agent/reload); los
+# sub-agentes aún sin importar aparecen solo por nombre
+agent_descriptor = build_agent_descriptor(root_agent, pending=SUB_AGENTS.pending())
+
+# PASO 2: Sistema de gestión de sesiones
+# `sessions_store` es la caché caliente en memoria (acotada por TTL, LRU y bytes);
+# `session_backend` guarda la copia durable (SQLite con escritura diferida)
+sessions_store = SessionCache(
+    max_sessions=config.SESSION_MAX_COUNT,
+    max_bytes=config.SESSION_MAX_BYTES,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+)
 
 # PASO 3: Configuración del servidor
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
-SESSION_DB_URL = "sqlite:///memory.db"  # Base de datos para sesiones
+SESSION_DB_URL = config.SESSION_DB_URL  # Base de datos para sesiones
+session_backend = create_session_backend(
+    SESSION_DB_URL,
+    flush_interval_ms=config.SESSION_FLUSH_INTERVAL_MS,
+    max_batch=config.SESSION_FLUSH_MAX_BATCH,
+    # Con varios workers, sin ventana de agrupación (ver `_await_session_writes`)
+    write_through=config.SHARED_STATE,
+)
+# Resumen de todas las sesiones ordenado por `last_activity` (paginación de /sessions)
+session_index = SessionIndex()
 ALLOWED_ORIGINS = [
     "http://localhost:5500",      # Frontend en desarrollo
     "http://127.0.0.1:5500",      # Alternativa localhost
@@ -42,6 +96,71 @@ ALLOWED_ORIGINS = [
     "*"                           # Permitir todos los orígenes (en desarrollo)
 ]
 
+# Cliente LLM asíncrono compartido (pool keep-alive + semáforo de concurrencia)
+llm_client = LLMClient.from_config()
+
+# Deadlines, reintentos con jitter y circuit breaker alrededor de cada llamada
+llm_resilience = ResilientCaller.from_config()
+
+# Hedging opcional contra un modelo secundario para recortar la cola de latencia
+llm_hedger = Hedger.from_config()
+
+# Tokens de entrada servidos desde la caché de prompts del proveedor, por agente
+prompt_cache_stats = PromptCacheStats()
+
+# Ejecución directa de sub-agentes con Runner de ADK (sin el salto de enrutamiento del raíz)
+sub_agent_dispatcher = SubAgentDispatcher(
+    SUB_AGENTS,
+    timeout=config.SUB_AGENT_TIMEOUT,
+    cache_stats=prompt_cache_stats,
+    session_db_url=config.SUB_AGENT_SESSION_DB_URL if config.SHARED_STATE else None,
+)
+
+
+def _on_session_evicted(session_id: str) -> None:
+    """Libera lo asociado a una sesión que sale de la caché."""
+    # El índice solo sigue a las sesiones en caché: sin backend durable, una
+    # sesión expulsada deja de existir; con backend, `/sessions` pagina desde él
+    session_index.discard(session_id)
+    sub_agent_dispatcher.forget(session_id)
+
+
+sessions_store.on_evict = _on_session_evicted
+
+# Enrutador local que puede delegar a un sub-agente sin la llamada de decisión del raíz
+# (solo conoce los sub-agentes ya importados; se reconstruye a medida que se cargan)
+intent_router = IntentRouter.from_agent(root_agent) if config.ROUTER_MODE != "off" else None
+
+
+def _on_sub_agent_loaded(name: str, agent: Any) -> None:
+    """Actualiza descriptor y enrutador cuando el registro importa un sub-agente."""
+    global agent_descriptor, intent_router
+    agent_descriptor = build_agent_descriptor(root_agent, pending=SUB_AGENTS.pending())
+    if config.ROUTER_MODE != "off":
+        intent_router = IntentRouter.from_agent(root_agent)
+    timing = SUB_AGENTS.timings.get(name, {})
+    print(f"🧩 Sub-agente cargado: {name} ({timing.get('total_ms', 0):.0f} ms)")
+
+
+SUB_AGENTS.on_load = _on_sub_agent_loaded
+
+# Caché de respuestas exactas para conversaciones repetidas
+response_cache = ResponseCache(
+    max_entries=config.RESPONSE_CACHE_MAX_ENTRIES if config.RESPONSE_CACHE_ENABLED else 0,
+    ttl_seconds=config.RESPONSE_CACHE_TTL,
+    sqlite_path=config.RESPONSE_CACHE_DB_PATH or (config.SHARED_STATE_DB_PATH if config.SHARED_STATE else ""),
+    sweep_interval=config.RESPONSE_CACHE_SWEEP_INTERVAL,
+)
+
+# Coalescencia de llamadas idénticas en curso (doble envío, kioscos simultáneos)
+llm_singleflight = SingleFlight()
+
+# Gauges que se calculan en el momento del scrape de /metrics
+SESSIONS_CACHED.set_callback(lambda: len(sessions_store))
+SESSION_CACHE_BYTES.set_callback(lambda: sessions_store.total_bytes)
+LLM_IN_FLIGHT.set_callback(lambda: llm_client.in_flight)
+LLM_QUEUE_DEPTH.set_callback(lambda: llm_client.waiting)
+
 # PASO 4: Crear la aplicación FastAPI
 app = FastAPI(
     title="DATAR API",
@@ -49,6 +168,26 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Limitar solicitudes por IP y por sesión (se registra antes que CORS para que
+# las respuestas 429 también lleven las cabeceras CORS)
+rate_limit_storage = (
+    SQLiteRateLimitStorage(config.SHARED_STATE_DB_PATH) if config.SHARED_STATE
+    else InMemoryRateLimitStorage()
+)
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        storage=rate_limit_storage,
+        requests=config.RATE_LIMIT_REQUESTS,
+        period=config.RATE_LIMIT_PERIOD,
+        exempt_paths=("/health", "/metrics", "/docs", "/openapi.json"),
+        cleanup_interval=config.RATE_LIMIT_CLEANUP_INTERVAL,
+        max_body_bytes=config.RATE_LIMIT_MAX_BODY_BYTES,
+    )
+
+# Latencia, estado y solicitudes en curso por ruta (incluye las respuestas 429)
+app.add_middleware(MetricsMiddleware)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -56,18 +195,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Paginación de GET /sessions legible desde el navegador
 )
 
 # PASO 5: Modelos Pydantic para requests/responses
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    bypass_cache: bool = False  # Forzar una respuesta nueva aunque exista en caché
     
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest]
+
 class ChatResponse(BaseModel):
     response: str
     agent_name: str
     session_id: str
     timestamp: str
+    model: Optional[str] = None  # Modelo que respondió (None si vino de caché o del fallback)
 
 class AgentInfo(BaseModel):
     name: str
@@ -85,6 +230,145 @@ class SessionHistoryResponse(BaseModel):
     messages: List[Dict[str, Any]]
     created_at: str
     message_count: int
+    last_seq: int = 0        # `seq` del último mensaje incluido (para el siguiente `after_seq`)
+    has_more: bool = False   # Quedan mensajes posteriores a `last_seq`
+
+
+def _read_shared_changes(session_id: str, known_messages: int) -> Any:
+    """
+    Lee (en un hilo) lo que otros workers hayan escrito en la sesión desde que se
+    cargó en caché: "reload" si hay que recargarla completa, None si fue eliminada,
+    o (mensajes nuevos, `last_activity`).
+    """
+    if session_backend.take_resequenced(session_id):
+        # Otro worker escribió los mismos `seq` a la vez: se recarga la sesión completa
+        return "reload"
+    version = session_backend.session_version(session_id)
+    if version is None:
+        return None
+    last_seq, last_activity = version
+    new_messages = []
+    if last_seq > known_messages:
+        new_messages = session_backend.load_messages(session_id, after_seq=known_messages)
+    return new_messages, last_activity
+
+
+def _apply_shared_changes(session_id: str, session_data: Dict[str, Any], changes: Any) -> Optional[Dict[str, Any]]:
+    """Pone al día (en el event loop) la copia en caché con el resultado de `_read_shared_changes`."""
+    if changes == "reload":
+        sessions_store.pop(session_id, None)
+        return None
+    if changes is None:
+        sessions_store.pop(session_id, None)
+        session_index.discard(session_id)
+        return None
+    new_messages, last_activity = changes
+    messages = session_data["messages"]
+    for message in new_messages:
+        # Otra corrutina pudo agregar mensajes mientras se leía en el hilo
+        if message["seq"] == len(messages) + 1:
+            messages.append(message)
+            sessions_store.message_added(session_id, message)
+    if last_activity > session_data["last_activity"]:
+        session_data["last_activity"] = last_activity
+    return session_data
+
+
+async def _aget_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Como `_get_session`, pero las lecturas de SQLite van en un hilo. Con estado
+    compartido, además pone al día la copia en caché con lo que hayan escrito
+    otros workers. Se usa al comenzar cada turno o lectura de la sesión.
+    """
+    session_data = sessions_store.get(session_id)
+    if session_data is not None and config.SHARED_STATE:
+        changes = await asyncio.to_thread(_read_shared_changes, session_id, len(session_data["messages"]))
+        session_data = _apply_shared_changes(session_id, session_data, changes)
+    if session_data is None and session_backend.is_persistent:
+        loaded = await asyncio.to_thread(session_backend.load_session, session_id)
+        # Otra corrutina pudo cargarla mientras tanto: se conserva esa copia
+        session_data = sessions_store.get(session_id)
+        if session_data is None and loaded is not None:
+            session_data = loaded
+            sessions_store[session_id] = session_data
+    return session_data
+
+
+def _get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna la sesión desde la caché en memoria o, si no está, desde el backend persistente.
+
+    No la pone al día con otros workers: dentro de un turno ya lo hizo `_aget_session`.
+    """
+    session_data = sessions_store.get(session_id)
+    if session_data is None and session_backend.is_persistent:
+        session_data = session_backend.load_session(session_id)
+        if session_data is not None:
+            sessions_store[session_id] = session_data
+    return session_data
+
+
+def _create_session(session_id: str, timestamp: str) -> Dict[str, Any]:
+    """Crea una sesión vacía en la caché y la registra en el backend."""
+    session_data = {
+        "created_at": timestamp,
+        "messages": [],
+        "last_activity": timestamp
+    }
+    sessions_store[session_id] = session_data
+    session_backend.create_session(session_id, timestamp)
+    session_index.upsert(session_id, timestamp, timestamp, 0)
+    return session_data
+
+
+def _append_message(
+    session_id: str,
+    role: str,
+    content: str,
+    timestamp: Optional[str] = None,
+    model: Optional[str] = None,
+    agent: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Agrega un mensaje numerado (`seq`) a la sesión y lo encola para persistirlo."""
+    session_data = _get_session(session_id)
+    if session_data is None:
+        # La sesión fue expulsada de la caché y no hay backend persistente
+        session_data = _create_session(session_id, datetime.now().isoformat())
+    message = {
+        "role": role,
+        "content": content,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "seq": len(session_data["messages"]) + 1,
+    }
+    if model:
+        message["model"] = model
+    if agent:
+        message["agent"] = agent
+    if role in ("user", "assistant"):
+        # El conteo de tokens se calcula una sola vez, al agregar el mensaje
+        ensure_token_count(message, agent_descriptor.model)
+    session_data["messages"].append(message)
+    sessions_store.message_added(session_id, message)
+    session_backend.append_message(session_id, message)
+    session_index.set_message_count(session_id, message["seq"])
+    return message
+
+
+async def _await_session_writes() -> None:
+    """Con estado compartido, espera en un hilo a que el turno esté en disco para los demás workers."""
+    if config.SHARED_STATE:
+        await asyncio.to_thread(session_backend.flush)
+
+
+def _touch_session(session_id: str) -> None:
+    """Actualiza `last_activity` en la caché y en el backend."""
+    session_data = _get_session(session_id)
+    if session_data is None:
+        return
+    last_activity = datetime.now().isoformat()
+    session_data["last_activity"] = last_activity
+    session_backend.touch_session(session_id, last_activity)
+    session_index.touch(session_id, last_activity)
 
 
 def _as_serializable_dict(obj: Any) -> Any:
@@ -125,62 +409,105 @@ def _flatten_content(content: Any) -> str:
 
 
 def _resolve_litellm_params() -> Dict[str, Any]:
-    """Obtiene la configuración del modelo LiteLLM a partir del agente o del entorno."""
-    params: Dict[str, Any] = {}
-
-    agent_model = getattr(root_agent, "model", None)
-    if agent_model is not None:
-        for attr in ("model", "api_key", "api_base", "temperature", "max_tokens" ):
-            value = getattr(agent_model, attr, None)
-            if value is not None:
-                key = "model" if attr == "model" else attr
-                params[key] = value
-
-    if "model" not in params:
-        params["model"] = getattr(config, "AGENT_MODEL", "gpt-3.5-turbo")
-
-    if "api_key" not in params:
-        params["api_key"] = (
-            os.getenv("OPENROUTER_API_KEY")
-            or os.getenv("LITELLM_API_KEY")
-            or os.getenv("GOOGLE_API_KEY")
-        )
-
-    if "api_base" not in params:
-        api_base_env = (
-            os.getenv("LITELLM_API_BASE")
-            or os.getenv("OPENROUTER_API_BASE")
-            or os.getenv("LITELLM_API_URL")
-        )
-        if api_base_env:
-            params["api_base"] = api_base_env
-
-    return {k: v for k, v in params.items() if v is not None}
+    """Copia de los parámetros LiteLLM resueltos al arrancar (o en la última recarga)."""
+    return agent_descriptor.params()
 
 
 def _build_conversation(session_id: str) -> List[Dict[str, str]]:
-    """Construye el historial de mensajes en formato compatible con LiteLLM."""
+    """
+    Construye el historial de mensajes en formato compatible con LiteLLM.
+
+    Solo se envían los turnos más recientes que caben en `CONTEXT_TOKEN_BUDGET`;
+    los anteriores se representan con el resumen acumulado de la sesión.
+    """
     conversation: List[Dict[str, str]] = []
+    model = agent_descriptor.model
+    reserved_tokens = 0
 
-    system_instruction = (
-        getattr(root_agent, "instruction", None)
-        or getattr(config, "AGENT_INSTRUCTION", None)
-    )
+    system_instruction = agent_descriptor.system_instruction
     if system_instruction:
         conversation.append({"role": "system", "content": system_instruction})
+        reserved_tokens += count_text_tokens(model, system_instruction) + MESSAGE_OVERHEAD_TOKENS
 
-    session_data = sessions_store.get(session_id)
-    if session_data and session_data.get("messages"):
-        for msg in session_data["messages"]:
-            if msg.get("role") in ("user", "assistant"):
-                conversation.append({
-                    "role": msg["role"],
-                    "content": msg["content"],
-                })
+    session_data = _get_session(session_id)
+    if not session_data or not session_data.get("messages"):
+        return conversation
+
+    history = [
+        msg for msg in session_data["messages"]
+        if msg.get("role") in ("user", "assistant")
+    ]
+    summary = session_data.get("summary")
+    if summary:
+        reserved_tokens += summary["tokens"] + MESSAGE_OVERHEAD_TOKENS
+
+    window = select_window(history, model, config.CONTEXT_TOKEN_BUDGET, reserved_tokens)
+
+    if window.dropped_upto_seq:
+        if summary:
+            conversation.append({
+                "role": "system",
+                "content": f"Resumen de la conversación anterior:\n{summary['content']}",
+            })
+        if not summary or summary["upto_seq"] < window.dropped_upto_seq:
+            _schedule_summary_refresh(session_id, window.dropped_upto_seq)
+
+    for msg in window.messages:
+        conversation.append({
+            "role": msg["role"],
+            "content": msg["content"],
+        })
 
     return conversation
 
 
+# Tareas de resumen en curso, una por sesión como máximo
+_summary_tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+
+def _schedule_summary_refresh(session_id: str, upto_seq: int) -> None:
+    """Programa (sin esperar) la actualización del resumen acumulado de la sesión."""
+    if not config.CONTEXT_SUMMARY_ENABLED or session_id in _summary_tasks:
+        return
+    task = asyncio.get_running_loop().create_task(_refresh_summary(session_id, upto_seq))
+    _summary_tasks[session_id] = task
+    task.add_done_callback(lambda _task: _summary_tasks.pop(session_id, None))
+
+
+async def _refresh_summary(session_id: str, upto_seq: int) -> None:
+    """Resume en segundo plano los turnos que quedaron fuera de la ventana de contexto."""
+    session_data = await _aget_session(session_id)
+    if session_data is None:
+        return
+
+    summary = session_data.get("summary") or {}
+    previous_upto = summary.get("upto_seq", 0)
+    dropped = [
+        msg for msg in session_data["messages"]
+        if msg.get("role") in ("user", "assistant") and previous_upto < msg.get("seq", 0) <= upto_seq
+    ]
+    if not dropped:
+        return
+
+    params = _resolve_litellm_params()
+    try:
+        raw_response = await llm_resilience.call(params["model"], lambda: llm_client.completion_in_slot(
+            messages=build_summary_request(summary.get("content"), dropped),
+            **{**params, "max_tokens": config.CONTEXT_SUMMARY_MAX_TOKENS},
+        ), slot=llm_client.slot)
+    except Exception as e:
+        print(f"⚠️  No se pudo actualizar el resumen de la sesión {session_id}: {e}")
+        return
+
+    summary_text = _extract_text_from_response(raw_response).strip()
+    if summary_text:
+        session_data["summary"] = {
+            "content": summary_text,
+            "upto_seq": upto_seq,
+            "tokens": count_text_tokens(params.get("model", ""), summary_text),
+        }
+
+
 def _extract_text_from_response(model_response: Any) -> str:
     """Extrae el texto de la primera respuesta del modelo LiteLLM."""
     if model_response is None:
@@ -239,9 +566,47 @@ def _extract_text_from_response(model_response: Any) -> str:
     return "Sin respuesta del modelo"
 
 
-async def _generate_agent_reply(session_id: str) -> str:
-    """Invoca LiteLLM de forma no bloqueante y retorna el texto de respuesta."""
-    params = _resolve_litellm_params()
+def _extract_delta_text(chunk: Any) -> str:
+    """Extrae el fragmento de texto incremental de un chunk de streaming de LiteLLM."""
+    chunk_obj = _as_serializable_dict(chunk)
+    if not isinstance(chunk_obj, dict):
+        return ""
+
+    choices = chunk_obj.get("choices") or []
+    if not choices:
+        return ""
+
+    first_choice = _as_serializable_dict(choices[0])
+    if not isinstance(first_choice, dict):
+        return ""
+
+    delta = _as_serializable_dict(first_choice.get("delta"))
+    if isinstance(delta, dict):
+        return _flatten_content(delta.get("content"))
+    return ""
+
+
+def _extract_usage(model_response: Any) -> Optional[Dict[str, int]]:
+    """Obtiene el bloque de uso de tokens (prompt/completion/total y caché de prompts) si existe."""
+    response_obj = _as_serializable_dict(model_response)
+    usage = response_obj.get("usage") if isinstance(response_obj, dict) else None
+    usage = _as_serializable_dict(usage)
+    if not isinstance(usage, dict) or not usage:
+        return None
+
+    return {
+        **{
+            key: int(usage.get(key) or 0)
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+        },
+        **extract_cache_usage(usage),
+    }
+
+
+def _prepare_litellm_call(session_id: str) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Resuelve y valida los parámetros del modelo junto con la conversación a enviar."""
+    with CHAT_STAGE_LATENCY.time("resolve_params"):
+        params = _resolve_litellm_params()
 
     if not params.get("model"):
         raise RuntimeError("Modelo de LiteLLM no configurado.")
@@ -251,16 +616,157 @@ async def _generate_agent_reply(session_id: str) -> str:
             "No se encontró una API key válida para LiteLLM. Define OPENROUTER_API_KEY o LITELLM_API_KEY."
         )
 
-    messages = _build_conversation(session_id)
+    with CHAT_STAGE_LATENCY.time("build_conversation"):
+        messages = _build_conversation(session_id)
+    return params, messages
+
+
+def _response_cache_key(params: Dict[str, Any], messages: List[Dict[str, str]], use_cache: bool) -> Optional[str]:
+    """Clave de la caché de respuestas, o None si no debe usarse para esta petición."""
+    if not use_cache or not response_cache.enabled:
+        return None
+    return make_cache_key(params, messages)
 
-    raw_response = await run_in_threadpool(
-        completion,
-        messages=messages,
-        **params,
-    )
 
-    response_text = _extract_text_from_response(raw_response)
-    return response_text.strip()
+async def _generate_agent_reply(session_id: str, use_cache: bool = True) -> Tuple[str, Optional[str]]:
+    """
+    Invoca LiteLLM de forma no bloqueante y retorna (texto, modelo que respondió).
+
+    Las peticiones concurrentes con la misma huella de conversación comparten una
+    sola llamada al proveedor; cada una guarda luego el resultado en su sesión.
+    Con hedging activo, la llamada puede duplicarse hacia el modelo secundario.
+    El modelo es None cuando la respuesta sale de la caché.
+    """
+    params, messages = _prepare_litellm_call(session_id)
+    fingerprint = make_cache_key(params, messages)
+
+    if use_cache and response_cache.enabled:
+        cached_text = await response_cache.aget(fingerprint)
+        RESPONSE_CACHE_LOOKUPS.inc(1, "miss" if cached_text is None else "hit")
+        if cached_text is not None:
+            return cached_text, None
+
+    async def _complete_with(model_params: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        with CHAT_STAGE_LATENCY.time("provider_call"):
+            raw_response = await llm_resilience.call(model_params["model"], lambda: llm_client.completion_in_slot(
+                messages=messages,
+                **cache_hints(model_params["model"], messages),
+                **model_params,
+            ), slot=llm_client.slot)
+        usage = _extract_usage(raw_response)
+        record_usage(model_params["model"], usage)
+        prompt_cache_stats.record_usage(root_agent.name, usage, time.perf_counter() - started)
+        with CHAT_STAGE_LATENCY.time("extract_text"):
+            response_text = _extract_text_from_response(raw_response).strip()
+        if not response_text:
+            # Una respuesta vacía no cuenta como completa (no gana el hedge)
+            raise ValueError("La respuesta del agente llegó vacía.")
+        return response_text
+
+    async def _call_provider() -> Tuple[str, str]:
+        if not llm_hedger.enabled:
+            return await _complete_with(params), params["model"]
+        secondary_params = {**params, "model": llm_hedger.secondary_model}
+        response_text, winner = await llm_hedger.call(
+            lambda: _complete_with(params),
+            lambda: _complete_with(secondary_params),
+        )
+        return response_text, (secondary_params if winner == "secondary" else params)["model"]
+
+    if not use_cache:
+        # Respuestas que deben variar: ni caché ni coalescencia
+        return await _call_provider()
+
+    response_text, answered_by = await llm_singleflight.do(fingerprint, _call_provider)
+    if response_cache.enabled and response_text:
+        await response_cache.aset(fingerprint, response_text)
+    return response_text, answered_by
+
+
+async def _stream_agent_reply(
+    session_id: str,
+    usage_sink: Dict[str, Any],
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Invoca LiteLLM en modo streaming y produce los fragmentos de texto a medida que llegan.
+
+    Al terminar deja en `usage_sink["usage"]` el uso de tokens reportado por el proveedor
+    o, si no lo envía, una estimación local con `token_counter`. Si la conversación
+    ya está en la caché de respuestas se emite completa en un solo fragmento.
+    Con hedging activo, el primer fragmento puede llegar del modelo secundario y
+    `usage_sink["model"]` indica cuál respondió.
+    """
+    params, messages = _prepare_litellm_call(session_id)
+
+    cache_key = _response_cache_key(params, messages, use_cache)
+    if cache_key:
+        cached_text = await response_cache.aget(cache_key)
+        RESPONSE_CACHE_LOOKUPS.inc(1, "miss" if cached_text is None else "hit")
+        if cached_text is not None:
+            usage_sink["usage"] = None
+            usage_sink["cached"] = True
+            yield cached_text
+            return
+
+    def _open_stream(model_params: Dict[str, Any]) -> AsyncIterator[Any]:
+        return llm_resilience.stream(model_params["model"], lambda: llm_client.stream_in_slot(
+            messages=messages,
+            stream_options={"include_usage": True},
+            **cache_hints(model_params["model"], messages),
+            **model_params,
+        ), slot=llm_client.slot)
+
+    async def _provider_chunks() -> AsyncIterator[Any]:
+        if not llm_hedger.enabled:
+            async for chunk in _open_stream(params):
+                yield chunk
+            return
+        # Se cubre el tiempo hasta el primer fragmento; luego se sigue al ganador
+        secondary_params = {**params, "model": llm_hedger.secondary_model}
+        async for chunk, winner in llm_hedger.stream(
+            lambda: _open_stream(params),
+            lambda: _open_stream(secondary_params),
+        ):
+            usage_sink["model"] = (secondary_params if winner == "secondary" else params)["model"]
+            yield chunk
+
+    usage_sink["model"] = params["model"]
+    parts: List[str] = []
+    started = time.perf_counter()
+    first_token_after: Optional[float] = None
+    with CHAT_STAGE_LATENCY.time("provider_stream"):
+        async for chunk in _provider_chunks():
+            usage = _extract_usage(chunk)
+            if usage:
+                usage_sink["usage"] = usage
+            delta = _extract_delta_text(chunk)
+            if delta:
+                if first_token_after is None:
+                    first_token_after = time.perf_counter() - started
+                parts.append(delta)
+                yield delta
+
+    answered_by = usage_sink["model"]
+    if not usage_sink.get("usage"):
+        try:
+            prompt_tokens = token_counter(model=answered_by, messages=messages)
+            completion_tokens = token_counter(model=answered_by, text="".join(parts))
+            usage_sink["usage"] = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "estimated": True,
+            }
+        except Exception:
+            usage_sink["usage"] = None
+    record_usage(answered_by, usage_sink.get("usage"))
+    prompt_cache_stats.record_usage(root_agent.name, usage_sink.get("usage"), first_token_after)
+
+    response_text = "".join(parts).strip()
+    if cache_key and response_text:
+        await response_cache.aset(cache_key, response_text)
 
 
 def _fallback_agent_reply(user_message: str) -> str:
@@ -282,8 +788,449 @@ def _fallback_agent_reply(user_message: str) -> str:
     # Si todo falla, retornar un mensaje informativo
     return f"[Sistema] El agente procesó tu mensaje pero la respuesta está vacía. Modelo: {getattr(root_agent, 'model', 'desconocido')}. Por favor, intenta de nuevo."
 
+
+async def _start_chat_turn(request: ChatRequest) -> str:
+    """Valida el mensaje, inicializa la sesión si hace falta y registra el turno del usuario."""
+    # Validar que el mensaje no esté vacío
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
+
+    # Validar longitud del mensaje
+    if len(request.message) > config.MAX_MESSAGE_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El mensaje no puede exceder {config.MAX_MESSAGE_LENGTH} caracteres"
+        )
+
+    # Generar o usar session_id existente
+    session_id = request.session_id or str(uuid.uuid4())
+    timestamp = datetime.now().isoformat()
+
+    # Inicializar sesión si no existe (ni en memoria ni en el backend)
+    if request.session_id is None or await _aget_session(session_id) is None:
+        _create_session(session_id, timestamp)
+
+    # Guardar mensaje del usuario en la sesión
+    _append_message(session_id, "user", request.message, timestamp)
+    _touch_session(session_id)
+    return session_id
+
+
+def _record_fallback_note(session_id: str, agent_error: Exception) -> None:
+    """Deja constancia en la sesión de que se usó la respuesta alternativa."""
+    CHAT_FALLBACKS.inc()
+    error_details = str(agent_error).strip()
+    if error_details and len(error_details) > 200:
+        error_details = f"{error_details[:200]}..."
+    fallback_note = "[fallback] LiteLLM no respondió, se usó una respuesta alternativa."
+    if error_details:
+        fallback_note = f"{fallback_note} Detalle: {error_details}"
+    _append_message(session_id, "system", fallback_note)
+
+
+def _store_assistant_reply(
+    session_id: str,
+    response_text: str,
+    model: Optional[str] = None,
+    agent: Optional[str] = None,
+) -> str:
+    """Guarda la respuesta del agente (y el modelo o sub-agente que la generó) en la sesión y retorna su timestamp."""
+    assistant_timestamp = datetime.now().isoformat()
+
+    try:
+        # Guardar respuesta del agente en la sesión
+        _append_message(session_id, "assistant", response_text, assistant_timestamp, model=model, agent=agent)
+        _touch_session(session_id)
+    except Exception as e:
+        error_message = f"Error al almacenar la respuesta del agente: {str(e)}"
+        _append_message(session_id, "error", error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+
+    return assistant_timestamp
+
+
+async def _routed_reply(session_id: str, user_message: str) -> Optional[Tuple[str, str]]:
+    """
+    Consulta el enrutador local y, en modo `route`, ejecuta el sub-agente elegido.
+
+    Retorna (texto, nombre del sub-agente) o None si el turno debe ir a `root_agent`
+    (sin decisión, modo `shadow` o error del sub-agente).
+    """
+    if intent_router is None:
+        return None
+
+    decision = intent_router.route(user_message)
+    print(
+        f"🧭 Enrutador: {decision.label} (fuente={decision.source}, "
+        f"confianza={decision.confidence:.2f}, candidato={decision.candidate})"
+    )
+    if config.ROUTER_MODE != "route" or decision.agent is None:
+        return None
+
+    try:
+        response_text = await sub_agent_dispatcher.run(decision.agent, session_id, user_message)
+    except Exception as e:
+        print(f"⚠️  El sub-agente {decision.agent} falló, responde root_agent: {e}")
+        return None
+    return (response_text, decision.agent) if response_text else None
+
+
+async def _complete_chat_turn(request: ChatRequest) -> ChatResponse:
+    """Ejecuta un turno completo de `/chat`: registra el mensaje, llama al modelo y guarda la respuesta."""
+    session_id = await _start_chat_turn(request)
+
+    routed = await _routed_reply(session_id, request.message)
+    if routed is not None:
+        response_text, routed_agent = routed
+        assistant_timestamp = _store_assistant_reply(session_id, response_text, agent=routed_agent)
+        await _await_session_writes()
+        return ChatResponse(
+            response=response_text[:config.MAX_RESPONSE_LENGTH],
+            agent_name=routed_agent,
+            session_id=session_id,
+            timestamp=assistant_timestamp,
+        )
+
+    try:
+        response_text, answered_by = await _generate_agent_reply(
+            session_id, use_cache=not request.bypass_cache
+        )
+        if not response_text:
+            raise ValueError("La respuesta del agente llegó vacía.")
+    except Exception as agent_error:
+        response_text, answered_by = _fallback_agent_reply(request.message), None
+        _record_fallback_note(session_id, agent_error)
+
+    assistant_timestamp = _store_assistant_reply(session_id, response_text, model=answered_by)
+    await _await_session_writes()
+
+    response_text = response_text[:config.MAX_RESPONSE_LENGTH]
+
+    return ChatResponse(
+        response=response_text,
+        agent_name=root_agent.name,
+        session_id=session_id,
+        timestamp=assistant_timestamp,
+        model=answered_by,
+    )
+
+
+async def _rate_limit_retry_after(client_ip: str, session_id: Optional[str]) -> Optional[int]:
+    """
+    Aplica el rate limit HTTP a un turno que no pasa por el middleware (mensajes del
+    WebSocket, elementos de `/chat/batch`); retorna segundos de espera o None.
+    """
+    if not config.RATE_LIMIT_ENABLED:
+        return None
+    capacity = float(config.RATE_LIMIT_REQUESTS)
+    refill_rate = capacity / config.RATE_LIMIT_PERIOD
+    keys = [f"ip:{client_ip}"]
+    if session_id:
+        keys.append(f"session:{session_id}")
+    for key in keys:
+        allowed, tokens = await rate_limit_storage.aconsume(key, capacity, refill_rate, time.time())
+        if not allowed:
+            return max(1, int((1 - tokens) / refill_rate + 0.999))
+    return None
+
+
+async def _chat_batch_lines(items: List[ChatRequest], client_ip: str) -> AsyncIterator[str]:
+    """
+    Ejecuta los turnos de un lote con concurrencia acotada y produce una línea
+    NDJSON por elemento en orden de finalización.
+
+    Los elementos con el mismo `session_id` forman una cadena que se ejecuta en
+    orden; cada cadena corre en paralelo con las demás. Cada elemento consume su
+    token de la IP y de la sesión, como una petición a `/chat`; si no hay, su
+    línea es un error 429 con `retry_after`.
+    """
+    semaphore = asyncio.Semaphore(config.CHAT_BATCH_CONCURRENCY)
+    results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    chains: Dict[str, List[int]] = {}
+    for index, item in enumerate(items):
+        # Sin session_id cada elemento abre su propia sesión y es independiente
+        chain_key = item.session_id if item.session_id is not None else f"#{index}"
+        chains.setdefault(chain_key, []).append(index)
+
+    async def run_chain(indexes: List[int]) -> None:
+        for index in indexes:
+            async with semaphore:
+                try:
+                    retry_after = await _rate_limit_retry_after(client_ip, items[index].session_id)
+                    if retry_after is not None:
+                        raise HTTPException(
+                            status_code=429,
+                            detail=f"Demasiadas solicitudes. Intenta de nuevo en {retry_after} segundos.",
+                            headers={"Retry-After": str(retry_after)},
+                        )
+                    reply = await _complete_chat_turn(items[index])
+                    result = {"index": index, "status": "ok", **reply.model_dump()}
+                except HTTPException as error:
+                    result = {
+                        "index": index,
+                        "status": "error",
+                        "status_code": error.status_code,
+                        "detail": error.detail,
+                        "session_id": items[index].session_id,
+                    }
+                    if error.status_code == 429:
+                        result["retry_after"] = int(error.headers["Retry-After"])
+                except Exception as error:
+                    # Un fallo inesperado no debe dejar el lote esperando este resultado
+                    result = {
+                        "index": index,
+                        "status": "error",
+                        "status_code": 500,
+                        "detail": str(error),
+                        "session_id": items[index].session_id,
+                    }
+            await results.put(result)
+
+    tasks = [asyncio.create_task(run_chain(indexes)) for indexes in chains.values()]
+    try:
+        for _ in range(len(items)):
+            result = await results.get()
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    finally:
+        # Si el cliente se desconecta, no seguir gastando llamadas al modelo
+        for task in tasks:
+            task.cancel()
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def _chat_events(
+    session_id: str,
+    user_message: str,
+    use_cache: bool = True,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Genera los eventos (nombre, datos) de un turno de chat: `start`, un `token` por
+    fragmento, `fallback` si LiteLLM falla y `done` con tiempos y uso de tokens.
+    Los comparten `/chat/stream` (SSE) y `/ws/chat` (WebSocket).
+
+    La respuesta ensamblada se guarda en la sesión al cerrar el generador, incluso
+    si el cliente se desconecta antes de terminar.
+    """
+    started_at = time.perf_counter()
+    first_token_at: Optional[float] = None
+    usage_sink: Dict[str, Any] = {}
+    parts: List[str] = []
+    stored = False
+    routed_agent: Optional[str] = None
+
+    yield "start", {"session_id": session_id, "agent_name": root_agent.name}
+
+    try:
+        try:
+            routed = await _routed_reply(session_id, user_message)
+            if routed is not None:
+                # Los sub-agentes de ADK responden completos: un solo fragmento
+                routed_text, routed_agent = routed
+                first_token_at = time.perf_counter()
+                parts.append(routed_text)
+                yield "token", {"text": routed_text}
+            else:
+                async for delta in _stream_agent_reply(session_id, usage_sink, use_cache):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        CHAT_TIME_TO_FIRST_TOKEN.observe(first_token_at - started_at)
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+
+            response_text = "".join(parts).strip()
+            if not response_text:
+                raise ValueError("La respuesta del agente llegó vacía.")
+            answered_by = usage_sink.get("model")
+        except Exception as agent_error:
+            response_text, answered_by = _fallback_agent_reply(user_message), None
+            _record_fallback_note(session_id, agent_error)
+            yield "fallback", {"text": response_text}
+
+        stored = True
+        assistant_timestamp = _store_assistant_reply(
+            session_id, response_text, model=answered_by, agent=routed_agent
+        )
+        await _await_session_writes()
+        finished_at = time.perf_counter()
+
+        yield "done", {
+            "response": response_text[:config.MAX_RESPONSE_LENGTH],
+            "agent_name": routed_agent or root_agent.name,
+            "session_id": session_id,
+            "timestamp": assistant_timestamp,
+            "timing": {
+                "time_to_first_token_ms": (
+                    round((first_token_at - started_at) * 1000, 1)
+                    if first_token_at is not None else None
+                ),
+                "total_ms": round((finished_at - started_at) * 1000, 1),
+            },
+            "usage": usage_sink.get("usage"),
+            "cached": usage_sink.get("cached", False),
+            "model": answered_by,
+            "last_seq": len((_get_session(session_id) or {"messages": []})["messages"]),
+        }
+    finally:
+        # Cliente desconectado a mitad de la generación: conservar lo recibido
+        partial_text = "".join(parts).strip()
+        if not stored and partial_text:
+            _store_assistant_reply(session_id, partial_text, model=usage_sink.get("model"))
+
+async def _chat_event_stream(
+    session_id: str,
+    user_message: str,
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    """Eventos del turno con formato Server-Sent Events para `/chat/stream`."""
+    events = _chat_events(session_id, user_message, use_cache)
+    try:
+        async for event, data in events:
+            yield _sse_event(event, data)
+    finally:
+        # Cierra el generador interno de inmediato para que guarde la respuesta parcial
+        await events.aclose()
+
+# Turnos de /ws/chat por sesión: siguen aunque el kiosco se desconecte y una
+# reconexión con el mismo `session_id` recibe la respuesta cuando terminan
+_ws_turns: Dict[str, "asyncio.Task[None]"] = {}
+
+
+class _ChatSocket:
+    """Conexión de `/ws/chat`: envíos tolerantes a desconexión y latido."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.open = True
+        self.last_seen = time.monotonic()
+
+    async def send(self, frame_type: str, data: Optional[Dict[str, Any]] = None, **extra: Any) -> None:
+        """Envía una trama JSON; tras una desconexión se descarta en silencio."""
+        if not self.open:
+            return
+        try:
+            await self.websocket.send_text(
+                json.dumps({"type": frame_type, **(data or {}), **extra}, ensure_ascii=False)
+            )
+        except Exception:
+            self.open = False
+
+    async def heartbeat(self) -> None:
+        """Ping periódico; cierra la conexión si el cliente lleva demasiado tiempo en silencio."""
+        while self.open:
+            await asyncio.sleep(config.WS_HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > config.WS_HEARTBEAT_TIMEOUT:
+                self.open = False
+                try:
+                    await self.websocket.close(code=1001, reason="Sin latido del cliente")
+                except Exception:
+                    pass
+                return
+            await self.send("ping", ts=time.time())
+
+
+async def _ws_sync_frame(session_id: str, after_seq: int) -> Dict[str, Any]:
+    """Mensajes de la sesión posteriores a `after_seq` (reanudación tras reconectar)."""
+    session_data = await _aget_session(session_id)
+    messages = session_data["messages"] if session_data else []
+    return {
+        "session_id": session_id,
+        "last_seq": len(messages),
+        "messages": messages[after_seq:],
+        "turn_in_progress": session_id in _ws_turns,
+    }
+
+
+async def _ws_run_turn(
+    socket: _ChatSocket,
+    previous: Optional["asyncio.Task[None]"],
+    request: ChatRequest,
+    turn_id: Optional[str],
+) -> None:
+    """Ejecuta un turno después del anterior de la misma sesión y reenvía sus eventos."""
+    if previous is not None:
+        try:
+            await asyncio.shield(previous)
+        except Exception:
+            pass
+
+    try:
+        session_id = await _start_chat_turn(request)
+    except HTTPException as error:
+        await socket.send("error", id=turn_id, status_code=error.status_code, detail=error.detail)
+        return
+
+    events = _chat_events(session_id, request.message, use_cache=not request.bypass_cache)
+    try:
+        async for event, data in events:
+            await socket.send(event, data, id=turn_id)
+    finally:
+        await events.aclose()
+
+
+async def _ws_forward_when_done(socket: _ChatSocket, turn: "asyncio.Task[None]", session_id: str, after_seq: int) -> None:
+    """Tras reconectar con un turno aún en curso, envía lo que produjo al terminar."""
+    try:
+        await asyncio.shield(turn)
+    except Exception:
+        pass
+    await socket.send("sync", await _ws_sync_frame(session_id, after_seq))
+
+
 # PASO 6: Definir los endpoints del API
 
+@app.on_event("startup")
+async def startup_llm_client():
+    """Abre el pool de conexiones compartido hacia el proveedor LLM."""
+    await llm_client.start()
+
+@app.on_event("startup")
+async def startup_sub_agents():
+    """Importa los sub-agentes pendientes en segundo plano (el servidor ya acepta peticiones)."""
+    if config.SUB_AGENTS_WARMUP and SUB_AGENTS.pending():
+        SUB_AGENTS.warm_up(on_done=lambda: print(SUB_AGENTS.format_report()))
+
+@app.on_event("startup")
+async def startup_session_backend():
+    """Abre la base de datos de sesiones y arranca el hilo de escritura diferida."""
+    # No se carga el índice: con backend persistente `/sessions` pagina desde la base,
+    # así que la memoria no crece con el número de sesiones guardadas
+    session_backend.start()
+
+async def _session_sweeper() -> None:
+    """Barre periódicamente la caché de sesiones aplicando TTL y límites."""
+    while True:
+        await asyncio.sleep(config.SESSION_SWEEP_INTERVAL)
+        evicted = sessions_store.sweep()
+        if evicted:
+            detalle = ", ".join(f"{reason}={count}" for reason, count in evicted.items())
+            print(f"🧹 Sesiones expulsadas de la caché: {detalle} (quedan {len(sessions_store)})")
+
+@app.on_event("startup")
+async def startup_session_sweeper():
+    """Arranca el barrido en segundo plano de la caché de sesiones."""
+    app.state.session_sweeper = asyncio.create_task(_session_sweeper())
+
+@app.on_event("shutdown")
+async def shutdown_session_sweeper():
+    """Detiene el barrido de la caché de sesiones."""
+    app.state.session_sweeper.cancel()
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    """Cierra el pool de conexiones compartido."""
+    await llm_client.close()
+
+@app.on_event("shutdown")
+async def shutdown_session_backend():
+    """Vacía las escrituras pendientes de sesiones antes de salir."""
+    session_backend.close()
+
 @app.get("/")
 async def root():
     """Endpoint raíz - Información del API"""
@@ -295,10 +1242,16 @@ async def root():
         "endpoints": {
             "raiz": "/",
             "salud": "/health",
+            "metricas": "/metrics",
             "root_agent_status": "/root_agent/status",
             "agentes": "/agents",
             "chat": "/chat",
+            "chat_stream": "POST /chat/stream",
+            "chat_websocket": "WS /ws/chat",
+            "chat_lote": "POST /chat/batch",
+            "chat_sub_agente": "POST /agents/{name}/chat",
             "info_agente": "/agent/info",
+            "recargar_agente": "POST /agent/reload",
             "sesiones": "/sessions",
             "sesion_especifica": "/sessions/{session_id}",
             "eliminar_sesion": "DELETE /sessions/{session_id}",
@@ -314,70 +1267,61 @@ async def health_check():
         "status": "healthy",
         "message": "DATAR está operativo",
         "agente_activo": root_agent.name,
-        "database": SESSION_DB_URL
+        "database": SESSION_DB_URL,
+        "worker": {"pid": os.getpid(), "shared_state": config.SHARED_STATE},
+        "session_cache": sessions_store.stats(),
+        "session_backend": session_backend.stats(),
+        "response_cache": response_cache.stats(),
+        "singleflight": llm_singleflight.stats(),
+        "rate_limit": {
+            "enabled": config.RATE_LIMIT_ENABLED,
+            "active_buckets": len(rate_limit_storage),
+        },
+        "llm": llm_client.stats(),
+        "hedging": llm_hedger.stats(),
+        "resilience": llm_resilience.stats(),
+        "sub_agents": sub_agent_dispatcher.stats(),
+        "sub_agent_imports": SUB_AGENTS.import_report(),
+        "prompt_cache": prompt_cache_stats.stats(),
+        "router_mode": config.ROUTER_MODE,
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto Prometheus (latencias por etapa, tokens, sesiones)"""
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+def _metadata_response(request: Request, name: str) -> Response:
+    """Sirve un cuerpo JSON precalculado del descriptor, o 304 si el ETag coincide."""
+    payload = agent_descriptor.payloads[name]
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
 @app.get("/agents", response_model=List[AgentInfo])
-async def list_agents():
+async def list_agents(request: Request):
     """Lista todos los agentes disponibles"""
-    sub_agent_names = []
-    if hasattr(root_agent, 'sub_agents') and root_agent.sub_agents:
-        sub_agent_names = [agent.name for agent in root_agent.sub_agents]
-    
-    return [
-        AgentInfo(
-            name=root_agent.name,
-            description=root_agent.description,
-            sub_agents=sub_agent_names
-        )
-    ]
+    return _metadata_response(request, "agents")
 
 @app.get("/agent/info")
-async def agent_info():
+async def agent_info(request: Request):
     """Información detallada del agente principal"""
-    sub_agents_info = []
-    if hasattr(root_agent, 'sub_agents') and root_agent.sub_agents:
-        for agent in root_agent.sub_agents:
-            sub_agents_info.append({
-                "name": agent.name,
-                "description": getattr(agent, 'description', 'Sin descripción')
-            })
-    
-    # Obtener información del modelo
-    model_info = getattr(root_agent, "model", None)
-    model_str = str(model_info) if model_info else "N/D"
-    model_name = "N/D"
-    
-    # Si el modelo existe, intentar extraer el nombre
-    if model_info:
-        # Buscar en los atributos del objeto
-        possible_attrs = ['model', 'model_name', 'model_id', '_model', 'name']
-        for attr in possible_attrs:
-            if hasattr(model_info, attr):
-                value = getattr(model_info, attr, None)
-                if value and isinstance(value, str) and value != "N/D":
-                    model_name = value
-                    break
-        
-        # Si no encontró en atributos, intentar parsear del string
-        if model_name == "N/D" and "model=" in model_str:
-            try:
-                # Parsear: model='openrouter/minimax/minimax-m2:free' ...
-                start = model_str.find("model='") + len("model='")
-                end = model_str.find("'", start)
-                if start > len("model='") - 1 and end > start:
-                    model_name = model_str[start:end]
-            except Exception:
-                pass
-    
+    return _metadata_response(request, "agent_info")
+
+@app.post("/agent/reload")
+async def reload_agent_descriptor():
+    """Recalcula los metadatos del agente (modelo, API key/base del entorno, sub-agentes)"""
+    global agent_descriptor
+    previous_etag = agent_descriptor.payloads["agent_info"].etag
+    agent_descriptor = build_agent_descriptor(root_agent, pending=SUB_AGENTS.pending())
     return {
-        "name": root_agent.name,
-        "description": root_agent.description,
-        "instruction": root_agent.instruction,
-        "model": model_str,
-        "model_name": model_name,
-        "has_model": model_info is not None,
-        "sub_agents": sub_agents_info,
+        "message": "Metadatos del agente recargados",
+        "model_name": agent_descriptor.model_name,
+        "changed": agent_descriptor.payloads["agent_info"].etag != previous_etag,
     }
 
 @app.post("/chat", response_model=ChatResponse)
@@ -387,120 +1331,257 @@ async def chat_with_agent(request: ChatRequest):
     
     - **message**: El mensaje que quieres enviar al agente
     - **session_id**: (Opcional) ID de sesión para mantener contexto. Si no se proporciona, se crea uno nuevo.
+    - **bypass_cache**: (Opcional) Ignora la caché de respuestas y fuerza una llamada al modelo.
+    """
+    return await _complete_chat_turn(request)
+
+@app.post("/agents/{name}/chat", response_model=ChatResponse)
+async def chat_with_sub_agent(name: str, request: ChatRequest):
+    """
+    Envía un mensaje directamente a un sub-agente (p. ej. `PastoBogotano`, `DiarioIntuitivo`, `horaculo`).
+
+    El sub-agente se ejecuta con su propio Runner de ADK, sus herramientas y su estado
+    de sesión, sin pasar por la decisión de delegación de `root_agent`.
     """
-    # Validar que el mensaje no esté vacío
-    if not request.message or not request.message.strip():
-        raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
-    
-    # Validar longitud del mensaje
-    if len(request.message) > config.MAX_MESSAGE_LENGTH:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"El mensaje no puede exceder {config.MAX_MESSAGE_LENGTH} caracteres"
-        )
-    
-    # Generar o usar session_id existente
-    session_id = request.session_id or str(uuid.uuid4())
-    timestamp = datetime.now().isoformat()
-    
-    # Inicializar sesión si no existe
-    if session_id not in sessions_store:
-        sessions_store[session_id] = {
-            "created_at": timestamp,
-            "messages": [],
-            "last_activity": timestamp
-        }
-    
-    # Guardar mensaje del usuario en la sesión
-    sessions_store[session_id]["messages"].append({
-        "role": "user",
-        "content": request.message,
-        "timestamp": timestamp
-    })
-    
     try:
-        response_text = await _generate_agent_reply(session_id)
-        if not response_text:
-            raise ValueError("La respuesta del agente llegó vacía.")
-    except Exception as agent_error:
-        response_text = _fallback_agent_reply(request.message)
-        error_details = str(agent_error).strip()
-        if error_details and len(error_details) > 200:
-            error_details = f"{error_details[:200]}..."
-        fallback_note = "[fallback] LiteLLM no respondió, se usó una respuesta alternativa."
-        if error_details:
-            fallback_note = f"{fallback_note} Detalle: {error_details}"
-        sessions_store[session_id]["messages"].append({
-            "role": "system",
-            "content": fallback_note,
-            "timestamp": datetime.now().isoformat()
-        })
-    
-    assistant_timestamp = datetime.now().isoformat()
+        await sub_agent_dispatcher.resolve(name)
+    except SubAgentNotFound as error:
+        raise HTTPException(status_code=404, detail=str(error))
+    except Exception as error:
+        raise HTTPException(status_code=503, detail=f"No se pudo cargar el sub-agente '{name}': {error}")
+
+    session_id = await _start_chat_turn(request)
 
     try:
-        # Guardar respuesta del agente en la sesión
-        sessions_store[session_id]["messages"].append({
-            "role": "assistant",
-            "content": response_text,
-            "timestamp": assistant_timestamp
-        })
-        sessions_store[session_id]["last_activity"] = datetime.now().isoformat()
-    except Exception as e:
-        error_message = f"Error al almacenar la respuesta del agente: {str(e)}"
-        sessions_store[session_id]["messages"].append({
-            "role": "error",
-            "content": error_message,
-            "timestamp": datetime.now().isoformat()
-        })
-        raise HTTPException(status_code=500, detail=error_message)
+        response_text = await sub_agent_dispatcher.run(name, session_id, request.message)
+        if not response_text:
+            raise ValueError("La respuesta del sub-agente llegó vacía.")
+    except asyncio.TimeoutError:
+        detail = f"El sub-agente '{name}' no respondió en {config.SUB_AGENT_TIMEOUT:.0f} segundos"
+        _append_message(session_id, "error", detail)
+        raise HTTPException(status_code=504, detail=detail)
+    except Exception as agent_error:
+        detail = f"Error del sub-agente '{name}': {agent_error}"
+        _append_message(session_id, "error", detail)
+        raise HTTPException(status_code=502, detail=detail)
 
-    response_text = response_text[:config.MAX_RESPONSE_LENGTH]
+    assistant_timestamp = _store_assistant_reply(session_id, response_text, agent=name)
+    await _await_session_writes()
 
     return ChatResponse(
-        response=response_text,
-        agent_name=root_agent.name,
+        response=response_text[:config.MAX_RESPONSE_LENGTH],
+        agent_name=name,
         session_id=session_id,
-        timestamp=assistant_timestamp
+        timestamp=assistant_timestamp,
     )
 
+@app.post("/chat/batch")
+async def chat_batch(request: ChatBatchRequest, http_request: Request):
+    """
+    Ejecuta varios mensajes en paralelo (hasta `CHAT_BATCH_CONCURRENCY` a la vez).
+
+    La respuesta es NDJSON: una línea por elemento en orden de finalización, con su
+    `index` en el lote y `status` (`ok` con los campos de `/chat`, o `error` con `detail`).
+    Los elementos que comparten `session_id` se procesan en el orden del lote.
+    Cada elemento cuenta para el rate limit de la IP y de su sesión; los que lo
+    exceden devuelven `status_code` 429 y `retry_after`.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="El lote no puede estar vacío")
+    if len(request.items) > config.CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote no puede exceder {config.CHAT_BATCH_MAX_ITEMS} elementos"
+        )
+
+    return StreamingResponse(
+        _chat_batch_lines(
+            request.items,
+            http_request.client.host if http_request.client else "desconocido",
+        ),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: ChatRequest):
+    """
+    Igual que `/chat`, pero transmite la respuesta token a token como Server-Sent Events.
+
+    Eventos emitidos: `start`, `token` (uno por fragmento), `fallback` (si LiteLLM falla)
+    y `done` con la respuesta completa, tiempos (`time_to_first_token_ms`, `total_ms`) y uso de tokens.
+    """
+    session_id = await _start_chat_turn(request)
+
+    return StreamingResponse(
+        _chat_event_stream(session_id, request.message, use_cache=not request.bypass_cache),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita que proxies como nginx acumulen el stream
+        },
+    )
+
+@app.websocket("/ws/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    after_seq: int = Query(0, ge=0),
+):
+    """
+    Canal de chat persistente: varios turnos de una sesión sobre una sola conexión.
+
+    Tramas del cliente (JSON): `{"type": "message", "message": ..., "id": ..., "bypass_cache": false}`,
+    `{"type": "ping"}` y `{"type": "pong"}` (respuesta al latido del servidor).
+
+    Tramas del servidor: `sync` (al conectar con `?session_id=...&after_seq=N`, con los
+    mensajes posteriores a N), `start`, `token`, `fallback`, `done` (con `last_seq`),
+    `error`, `ping` cada `WS_HEARTBEAT_INTERVAL` segundos y `pong`. Las tramas de un
+    turno llevan el `id` que envió el cliente. Los turnos de la sesión se ejecutan en
+    orden y terminan aunque la conexión se caiga.
+    """
+    await websocket.accept()
+    socket = _ChatSocket(websocket)
+    client_ip = websocket.client.host if websocket.client else "desconocido"
+    background: List["asyncio.Task[None]"] = [asyncio.create_task(socket.heartbeat())]
+
+    if session_id:
+        await socket.send("sync", await _ws_sync_frame(session_id, after_seq))
+        pending_turn = _ws_turns.get(session_id)
+        if pending_turn is not None:
+            background.append(asyncio.create_task(
+                _ws_forward_when_done(socket, pending_turn, session_id, after_seq)
+            ))
+
+    try:
+        while socket.open:
+            raw = await websocket.receive_text()
+            socket.last_seen = time.monotonic()
+            try:
+                frame = json.loads(raw)
+                frame_type = frame.get("type")
+            except (ValueError, AttributeError):
+                await socket.send("error", status_code=400, detail="Trama JSON inválida")
+                continue
+
+            if frame_type == "ping":
+                await socket.send("pong", ts=frame.get("ts"))
+                continue
+            if frame_type == "pong":
+                continue
+            if frame_type != "message":
+                await socket.send("error", status_code=400, detail=f"Tipo de trama desconocido: {frame_type}")
+                continue
+
+            turn_id = frame.get("id")
+            requested = frame.get("session_id")
+            if requested and session_id and requested != session_id:
+                await socket.send(
+                    "error", id=turn_id, status_code=400,
+                    detail="La conexión ya está asociada a otra sesión; abre un WebSocket nuevo",
+                )
+                continue
+            # La sesión se fija en el primer mensaje para encadenar los turnos siguientes
+            session_id = session_id or requested or str(uuid.uuid4())
+
+            retry_after = await _rate_limit_retry_after(client_ip, session_id)
+            if retry_after is not None:
+                await socket.send(
+                    "error", id=turn_id, status_code=429, retry_after=retry_after,
+                    detail=f"Demasiadas solicitudes. Intenta de nuevo en {retry_after} segundos.",
+                )
+                continue
+
+            request = ChatRequest(
+                message=str(frame.get("message") or ""),
+                session_id=session_id,
+                bypass_cache=bool(frame.get("bypass_cache", False)),
+            )
+            turn = asyncio.create_task(_ws_run_turn(socket, _ws_turns.get(session_id), request, turn_id))
+            _ws_turns[session_id] = turn
+            turn.add_done_callback(
+                lambda done, sid=session_id: _ws_turns.pop(sid, None) if _ws_turns.get(sid) is done else None
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        socket.open = False
+        for task in background:
+            task.cancel()
+
 @app.get("/sessions", response_model=List[SessionInfo])
-async def list_sessions():
-    """Lista todas las sesiones activas"""
-    sessions = []
-    for session_id, data in sessions_store.items():
-        sessions.append(SessionInfo(
-            session_id=session_id,
-            created_at=data["created_at"],
-            last_activity=data["last_activity"],
-            message_count=len(data["messages"])
-        ))
-    return sessions
+async def list_sessions(
+    response: Response,
+    limit: int = Query(config.SESSIONS_PAGE_SIZE, ge=1, le=config.SESSIONS_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    """
+    Lista las sesiones de la más reciente a la más antigua, paginadas por cursor.
+
+    - **limit**: Número máximo de sesiones por página.
+    - **cursor**: Valor de la cabecera `X-Next-Cursor` de la página anterior.
+    """
+    try:
+        if session_backend.is_persistent:
+            # El índice en memoria solo conoce las sesiones en caché de este worker
+            items, has_more = await asyncio.to_thread(
+                session_backend.page_sessions, limit, decode_cursor(cursor) if cursor else None
+            )
+            next_cursor = (
+                encode_cursor((items[-1]["last_activity"], items[-1]["session_id"]))
+                if has_more and items else None
+            )
+        else:
+            items, next_cursor = session_index.page(limit, cursor)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 @app.get("/sessions/{session_id}", response_model=SessionHistoryResponse)
-async def get_session_history(session_id: str):
-    """Obtiene el historial completo de una sesión"""
-    if session_id not in sessions_store:
+async def get_session_history(
+    session_id: str,
+    after_seq: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=config.SESSIONS_PAGE_MAX),
+):
+    """
+    Obtiene el historial de una sesión.
+
+    - **after_seq**: (Opcional) Solo mensajes con `seq` mayor a este valor (sincronización incremental).
+    - **limit**: (Opcional) Número máximo de mensajes a devolver.
+    """
+    session_data = await _aget_session(session_id)
+    if session_data is None:
         return {
             "session_id": session_id,
             "messages": [],
             "created_at": "",
             "message_count": 0
         }
-    
-    session_data = sessions_store[session_id]
+
+    # `seq` empieza en 1 y es consecutivo, así que coincide con la posición en la lista
+    messages = session_data["messages"]
+    end = len(messages) if limit is None else min(len(messages), after_seq + limit)
+    page = messages[after_seq:end]
+
     return SessionHistoryResponse(
         session_id=session_id,
-        messages=session_data["messages"],
+        messages=page,
         created_at=session_data["created_at"],
-        message_count=len(session_data["messages"])
+        message_count=len(messages),
+        last_seq=page[-1]["seq"] if page else min(after_seq, len(messages)),
+        has_more=end < len(messages),
     )
 
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """Elimina una sesión específica"""
-    if session_id in sessions_store:
-        del sessions_store[session_id]
+    in_memory = sessions_store.pop(session_id, None) is not None
+    persisted = await asyncio.to_thread(session_backend.delete_session, session_id)
+    session_index.discard(session_id)
+    sub_agent_dispatcher.forget(session_id, deleted=True)
+    if in_memory or persisted:
         return {"message": f"Sesión {session_id} eliminada exitosamente"}
     return {"message": f"Sesión {session_id} no encontrada"}
 
@@ -514,45 +1595,9 @@ async def say_hello():
     }
 
 @app.get("/root_agent/status")
-async def root_agent_status():
+async def root_agent_status(request: Request):
     """Endpoint de diagnóstico - Verifica el estado de root_agent"""
-    model_info = getattr(root_agent, "model", None)
-    model_str = str(model_info) if model_info else "N/D"
-    model_name = "N/D"
-    
-    if model_info:
-        # Buscar en los atributos del objeto
-        possible_attrs = ['model', 'model_name', 'model_id', '_model', 'name']
-        for attr in possible_attrs:
-            if hasattr(model_info, attr):
-                value = getattr(model_info, attr, None)
-                if value and isinstance(value, str) and value != "N/D":
-                    model_name = value
-                    break
-        
-        # Si no encontró en atributos, intentar parsear del string
-        if model_name == "N/D" and "model=" in model_str:
-            try:
-                # Parsear: model='openrouter/minimax/minimax-m2:free' ...
-                start = model_str.find("model='") + len("model='")
-                end = model_str.find("'", start)
-                if start > len("model='") - 1 and end > start:
-                    model_name = model_str[start:end]
-            except Exception:
-                pass
-    
-    return {
-        "status": "active",
-        "agent_name": root_agent.name,
-        "description": root_agent.description,
-        "instruction": root_agent.instruction[:100] + "..." if root_agent.instruction and len(root_agent.instruction) > 100 else root_agent.instruction,
-        "has_model": model_info is not None,
-        "model": model_str,
-        "model_name": model_name,
-        "has_sub_agents": hasattr(root_agent, "sub_agents") and bool(root_agent.sub_agents),
-        "sub_agents_count": len(root_agent.sub_agents) if hasattr(root_agent, "sub_agents") and root_agent.sub_agents else 0,
-        "is_root_agent": root_agent.name == 'root_agent'
-    }
+    return _metadata_response(request, "root_agent_status")
 
 # PASO 7: Punto de entrada (para ejecución directa)
 if __name__ == "__main__":
@@ -564,9 +1609,15 @@ if __name__ == "__main__":
     print(f"\n🔗 Endpoints disponibles:")
     print(f"   - GET    /                     (Información del API)")
     print(f"   - GET    /health               (Estado del servidor)")
+    print(f"   - GET    /metrics              (Métricas Prometheus)")
     print(f"   - GET    /agents               (Lista de agentes)")
     print(f"   - GET    /agent/info           (Info detallada del agente)")
+    print(f"   - POST   /agent/reload         (Recargar metadatos del agente)")
     print(f"   - POST   /chat                 (Chatear con el agente)")
+    print(f"   - POST   /chat/stream          (Chat con streaming SSE)")
+    print(f"   - WS     /ws/chat              (Chat persistente por WebSocket)")
+    print(f"   - POST   /chat/batch           (Lote de mensajes, NDJSON)")
+    print(f"   - POST   /agents/{{name}}/chat    (Chat directo con un sub-agente)")
     print(f"   - GET    /sessions             (Listar todas las sesiones)")
     print(f"   - GET    /sessions/{{id}}        (Ver historial de sesión)")
     print(f"   - DELETE /sessions/{{id}}        (Eliminar sesión)")
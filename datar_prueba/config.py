@@ -38,6 +38,99 @@ AGENT_NAME: str = os.getenv("AGENT_NAME", "root_agent")
 AGENT_DESCRIPTION: str = os.getenv("AGENT_DESCRIPTION", "A helpful assistant for user questions.")
 AGENT_INSTRUCTION: str = os.getenv("AGENT_INSTRUCTION", "Answer user questions to the best of your knowledge")
 
+# Sub-agentes: se importan al primer uso (False = todos al importar agent.py, como antes)
+SUB_AGENTS_LAZY: bool = os.getenv("SUB_AGENTS_LAZY", "True").lower() == "true"
+# Al arrancar el API, importarlos en un hilo de fondo sin bloquear las peticiones
+SUB_AGENTS_WARMUP: bool = os.getenv("SUB_AGENTS_WARMUP", "True").lower() == "true"
+
+# ============= SESIONES =============
+
+# Backend durable de sesiones: "sqlite:///ruta.db" o "memory" (sin persistencia)
+SESSION_DB_URL: str = os.getenv("SESSION_DB_URL", "sqlite:///memory.db")
+SESSION_FLUSH_INTERVAL_MS: int = int(os.getenv("SESSION_FLUSH_INTERVAL_MS", "5"))   # Ventana de agrupación del write-behind
+SESSION_FLUSH_MAX_BATCH: int = int(os.getenv("SESSION_FLUSH_MAX_BATCH", "500"))     # Operaciones máximas por transacción
+
+# Caché de sesiones en memoria (0 = sin límite)
+SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "3600"))            # Inactividad máxima
+SESSION_MAX_COUNT: int = int(os.getenv("SESSION_MAX_COUNT", "1000"))                # Límite LRU de sesiones
+SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", str(50 * 1024 * 1024))) # Presupuesto de contenido
+SESSION_SWEEP_INTERVAL: int = int(os.getenv("SESSION_SWEEP_INTERVAL", "60"))        # Segundos entre barridos
+SESSIONS_PAGE_SIZE: int = int(os.getenv("SESSIONS_PAGE_SIZE", "50"))                # Página por defecto de GET /sessions
+SESSIONS_PAGE_MAX: int = int(os.getenv("SESSIONS_PAGE_MAX", "500"))                 # Tope de `limit` en listados e historial
+
+# ============= VENTANA DE CONTEXTO =============
+
+# Presupuesto de tokens del prompt (instrucción + resumen + turnos recientes); 0 = sin recorte
+CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Resumen acumulado (en segundo plano) de los turnos que quedan fuera de la ventana
+CONTEXT_SUMMARY_ENABLED: bool = os.getenv("CONTEXT_SUMMARY_ENABLED", "True").lower() == "true"
+CONTEXT_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+
+# ============= CACHÉ DE RESPUESTAS =============
+
+# Respuestas exactas por (parámetros del modelo, conversación normalizada)
+RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))                 # Segundos
+RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_DB_PATH: str = os.getenv("RESPONSE_CACHE_DB_PATH", "")                 # Vacío = solo en memoria
+RESPONSE_CACHE_SWEEP_INTERVAL: int = int(os.getenv("RESPONSE_CACHE_SWEEP_INTERVAL", "300"))  # Segundos entre purgas de SQLite
+
+# ============= CLIENTE LLM =============
+
+# Concurrencia global de llamadas al modelo (semáforo compartido)
+LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))       # Segundos en cola (0 = sin límite)
+
+# Timeouts de la llamada HTTP al proveedor
+LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))   # Segundos (timeout HTTP; con reintentos manda el menor con LLM_ATTEMPT_TIMEOUT)
+LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))   # Segundos
+
+# Pool de conexiones keep-alive compartido
+LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))  # Segundos
+
+# Resiliencia: deadlines, reintentos con jitter y circuit breaker por modelo
+LLM_ATTEMPT_TIMEOUT: float = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))    # Segundos por intento
+LLM_OVERALL_TIMEOUT: float = float(os.getenv("LLM_OVERALL_TIMEOUT", "60"))    # Segundos en total, con reintentos
+LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_BASE: float = float(os.getenv("LLM_RETRY_BACKOFF_BASE", "0.5"))  # Segundos
+LLM_RETRY_BACKOFF_MAX: float = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "4"))      # Segundos
+LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))  # Fallos seguidos
+LLM_BREAKER_RECOVERY_TIMEOUT: float = float(os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", "30"))  # Segundos abierto
+
+# Hedging: si el modelo principal tarda más que el percentil indicado de su
+# latencia observada, se envía la misma conversación a LLM_HEDGE_MODEL
+LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "False").lower() == "true"
+LLM_HEDGE_MODEL: str = os.getenv("LLM_HEDGE_MODEL", "")                          # Modelo LiteLLM secundario
+LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))       # Muestras antes de usar el percentil
+LLM_HEDGE_INITIAL_DELAY: float = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "8"))  # Segundos mientras no hay muestras
+LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))        # Piso de la espera en segundos
+
+# ============= CACHÉ DE PROMPTS DEL PROVEEDOR =============
+
+# Marca la instrucción de sistema y el historial ya visto con `cache_control`
+# "auto" = solo modelos con soporte según LiteLLM, "on" = siempre, "off" = nunca
+PROMPT_CACHE_MODE: str = os.getenv("PROMPT_CACHE_MODE", "auto").lower()
+# Caché de contexto de ADK para los sub-agentes sobre Gemini
+PROMPT_CACHE_MIN_TOKENS: int = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Prompt mínimo para cachear
+PROMPT_CACHE_TTL: int = int(os.getenv("PROMPT_CACHE_TTL", "1800"))                # Segundos
+PROMPT_CACHE_INTERVALS: int = int(os.getenv("PROMPT_CACHE_INTERVALS", "10"))      # Turnos antes de renovarla
+
+# ============= VARIOS WORKERS =============
+
+# Workers de uvicorn para `run_api.py --prod` (0 = uno por núcleo disponible)
+API_WORKERS: int = int(os.getenv("API_WORKERS", "0"))
+# Estado compartido entre procesos: sesiones escritas de forma síncrona en
+# SESSION_DB_URL y revalidadas por cada worker; buckets del rate limit y caché
+# de respuestas en SHARED_STATE_DB_PATH. `run_api.py` lo activa con más de un worker.
+SHARED_STATE: bool = os.getenv("SHARED_STATE", "False").lower() == "true"
+SHARED_STATE_DB_PATH: str = os.getenv("SHARED_STATE_DB_PATH", "shared_state.db")
+# Sesiones ADK de los sub-agentes con SHARED_STATE (DatabaseSessionService); archivo
+# propio porque ADK crea su tabla `sessions` y chocaría con la de SESSION_DB_URL
+SUB_AGENT_SESSION_DB_URL: str = os.getenv("SUB_AGENT_SESSION_DB_URL", "sqlite:///adk_sessions.db")
+
 # ============= LÍMITES Y VALIDACIÓN =============
 
 # Chat
@@ -45,10 +138,30 @@ MAX_MESSAGE_LENGTH: int = int(os.getenv("MAX_MESSAGE_LENGTH", "2000"))
 MIN_MESSAGE_LENGTH: int = int(os.getenv("MIN_MESSAGE_LENGTH", "1"))
 MAX_RESPONSE_LENGTH: int = int(os.getenv("MAX_RESPONSE_LENGTH", "10000"))
 
-# Rate limiting (futuro)
+# Chat por lotes (POST /chat/batch)
+CHAT_BATCH_MAX_ITEMS: int = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+CHAT_BATCH_CONCURRENCY: int = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))  # Turnos simultáneos por lote
+
+# Chat directo con un sub-agente (POST /agents/{name}/chat)
+SUB_AGENT_TIMEOUT: float = float(os.getenv("SUB_AGENT_TIMEOUT", "120"))  # Segundos por turno, incluidas herramientas
+
+# Enrutador local de intención (antes de cualquier llamada al modelo)
+# "off" = desactivado, "shadow" = solo registra la decisión, "route" = delega al sub-agente elegido
+ROUTER_MODE: str = os.getenv("ROUTER_MODE", "shadow").lower()
+ROUTER_MIN_SCORE: float = float(os.getenv("ROUTER_MIN_SCORE", "0.15"))    # Similitud TF-IDF mínima
+ROUTER_MIN_MARGIN: float = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))  # Ventaja mínima sobre el segundo
+ROUTER_RULES_PATH: str = os.getenv("ROUTER_RULES_PATH", "")               # JSON con reglas; vacío = predeterminadas
+
+# Canal WebSocket de chat (/ws/chat) para kioscos con conversaciones de horas
+WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))  # Segundos entre pings del servidor
+WS_HEARTBEAT_TIMEOUT: float = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "90"))    # Silencio del cliente antes de cerrar
+
+# Rate limiting (token bucket por IP y por session_id)
 RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "False").lower() == "true"
 RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))  # Requests
 RATE_LIMIT_PERIOD: int = int(os.getenv("RATE_LIMIT_PERIOD", "60"))     # Segundos
+RATE_LIMIT_CLEANUP_INTERVAL: int = int(os.getenv("RATE_LIMIT_CLEANUP_INTERVAL", "300"))  # Segundos entre purgas
+RATE_LIMIT_MAX_BODY_BYTES: int = int(os.getenv("RATE_LIMIT_MAX_BODY_BYTES", str(64 * 1024)))  # Cuerpo leído para hallar session_id
 
 # ============= VALIDACIÓN =============
 
@@ -68,6 +181,62 @@ def validate_config():
     if MAX_RESPONSE_LENGTH < 1:
         issues.append(f"MAX_RESPONSE_LENGTH debe ser mayor que 0")
     
+    if min(SESSION_TTL_SECONDS, SESSION_MAX_COUNT, SESSION_MAX_BYTES) < 0:
+        issues.append(f"SESSION_TTL_SECONDS, SESSION_MAX_COUNT y SESSION_MAX_BYTES no pueden ser negativos")
+    
+    if SESSION_SWEEP_INTERVAL < 1:
+        issues.append(f"SESSION_SWEEP_INTERVAL debe ser mayor que 0")
+    
+    if CHAT_BATCH_MAX_ITEMS < 1 or CHAT_BATCH_CONCURRENCY < 1:
+        issues.append(f"CHAT_BATCH_MAX_ITEMS y CHAT_BATCH_CONCURRENCY deben ser mayores que 0")
+    
+    if LLM_ATTEMPT_TIMEOUT <= 0 or LLM_OVERALL_TIMEOUT <= 0:
+        issues.append(f"LLM_ATTEMPT_TIMEOUT y LLM_OVERALL_TIMEOUT deben ser mayores que 0")
+    
+    if LLM_MAX_RETRIES < 0 or LLM_BREAKER_FAILURE_THRESHOLD < 1:
+        issues.append(f"LLM_MAX_RETRIES no puede ser negativo y LLM_BREAKER_FAILURE_THRESHOLD debe ser mayor que 0")
+    
+    if ROUTER_MODE not in ["off", "shadow", "route"]:
+        issues.append(f"ROUTER_MODE debe ser 'off', 'shadow' o 'route', no '{ROUTER_MODE}'")
+    
+    if WS_HEARTBEAT_INTERVAL <= 0 or WS_HEARTBEAT_TIMEOUT <= WS_HEARTBEAT_INTERVAL:
+        issues.append(f"WS_HEARTBEAT_INTERVAL debe ser mayor que 0 y menor que WS_HEARTBEAT_TIMEOUT")
+    
+    if LLM_HEDGE_ENABLED and not LLM_HEDGE_MODEL:
+        issues.append(f"LLM_HEDGE_ENABLED requiere definir LLM_HEDGE_MODEL")
+    
+    if not 0 < LLM_HEDGE_PERCENTILE <= 100:
+        issues.append(f"LLM_HEDGE_PERCENTILE debe estar entre 0 y 100")
+    
+    if SESSIONS_PAGE_SIZE < 1 or SESSIONS_PAGE_MAX < SESSIONS_PAGE_SIZE:
+        issues.append(f"SESSIONS_PAGE_SIZE debe ser mayor que 0 y no superar SESSIONS_PAGE_MAX")
+    
+    if PROMPT_CACHE_MODE not in ["auto", "on", "off"]:
+        issues.append(f"PROMPT_CACHE_MODE debe ser 'auto', 'on' u 'off', no '{PROMPT_CACHE_MODE}'")
+    
+    if PROMPT_CACHE_MIN_TOKENS < 0 or PROMPT_CACHE_TTL < 1 or not 1 <= PROMPT_CACHE_INTERVALS <= 100:
+        issues.append(f"PROMPT_CACHE_MIN_TOKENS no puede ser negativo, PROMPT_CACHE_TTL debe ser mayor que 0 y PROMPT_CACHE_INTERVALS estar entre 1 y 100")
+    
+    if CONTEXT_TOKEN_BUDGET < 0:
+        issues.append(f"CONTEXT_TOKEN_BUDGET no puede ser negativo")
+    
+    if RATE_LIMIT_ENABLED and (RATE_LIMIT_REQUESTS < 1 or RATE_LIMIT_PERIOD < 1):
+        issues.append(f"RATE_LIMIT_REQUESTS y RATE_LIMIT_PERIOD deben ser mayores que 0")
+    
+    if SHARED_STATE and not SESSION_DB_URL.startswith("sqlite:///"):
+        issues.append(f"SHARED_STATE requiere un SESSION_DB_URL sqlite:/// compartido, no '{SESSION_DB_URL}'")
+    if SHARED_STATE and SUB_AGENT_SESSION_DB_URL == SESSION_DB_URL:
+        issues.append("SUB_AGENT_SESSION_DB_URL debe ser distinto de SESSION_DB_URL (ambos usan una tabla `sessions`)")
+    
+    if API_WORKERS < 0:
+        issues.append(f"API_WORKERS no puede ser negativo (0 = uno por núcleo)")
+    
+    if LLM_MAX_CONCURRENCY < 1:
+        issues.append(f"LLM_MAX_CONCURRENCY debe ser mayor que 0")
+    
+    if LLM_REQUEST_TIMEOUT <= 0 or LLM_CONNECT_TIMEOUT <= 0:
+        issues.append(f"LLM_REQUEST_TIMEOUT y LLM_CONNECT_TIMEOUT deben ser mayores que 0")
+    
     if issues:
         print("⚠️  Problemas de configuración detectados:")
         for issue in issues:
@@ -0,0 +1,112 @@
+"""
+Ventana de contexto con presupuesto de tokens para DATAR
+
+En lugar de reenviar todo el historial en cada turno, se conservan los turnos más
+recientes que caben en `CONTEXT_TOKEN_BUDGET` y los anteriores se reemplazan por
+un resumen acumulado que se refresca en segundo plano.
+
+El conteo de tokens de cada mensaje se calcula una sola vez al agregarlo y se
+guarda en el propio mensaje (`tokens`).
+"""
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from litellm import token_counter
+
+
+# Tokens extra que cada mensaje añade por rol y delimitadores del formato chat
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Resume de forma concisa la siguiente conversación entre un usuario y el agente DATAR. "
+    "Conserva nombres, lugares, preferencias del usuario, preguntas abiertas y acuerdos; "
+    "omite saludos y repeticiones. Escribe en español, en un solo párrafo."
+)
+
+
+@lru_cache(maxsize=256)
+def count_text_tokens(model: str, text: str) -> int:
+    """Cuenta los tokens de un texto con el tokenizador del modelo (o una estimación)."""
+    if not text:
+        return 0
+    try:
+        return token_counter(model=model, text=text)
+    except Exception:
+        # Aproximación habitual: ~4 caracteres por token
+        return max(1, len(text) // 4)
+
+
+def ensure_token_count(message: Dict[str, Any], model: str) -> int:
+    """Retorna los tokens del mensaje, calculándolos y guardándolos si aún no existen."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        content = message.get("content") or ""
+        try:
+            tokens = token_counter(model=model, text=content) if content else 0
+        except Exception:
+            tokens = max(1, len(content) // 4) if content else 0
+        message["tokens"] = tokens
+    return tokens
+
+
+@dataclass
+class ContextWindow:
+    """Resultado de la selección: mensajes a enviar y lo que quedó fuera."""
+
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    total_tokens: int = 0
+    # `seq` del último mensaje que quedó fuera de la ventana (0 si no se descartó nada)
+    dropped_upto_seq: int = 0
+
+
+def select_window(
+    history: List[Dict[str, Any]],
+    model: str,
+    budget: int,
+    reserved_tokens: int = 0,
+) -> ContextWindow:
+    """
+    Elige los mensajes más recientes de `history` que caben en `budget - reserved_tokens`.
+
+    Siempre incluye al menos el último mensaje. Si `budget` es 0 no se recorta nada.
+    """
+    window = ContextWindow()
+    if not history:
+        return window
+
+    available = budget - reserved_tokens if budget else None
+    kept: List[Dict[str, Any]] = []
+
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        cost = ensure_token_count(message, model) + MESSAGE_OVERHEAD_TOKENS
+        if available is not None and kept and window.total_tokens + cost > available:
+            window.dropped_upto_seq = message.get("seq", index + 1)
+            break
+        kept.append(message)
+        window.total_tokens += cost
+
+    kept.reverse()
+    window.messages = kept
+    return window
+
+
+def build_summary_request(
+    previous_summary: Optional[str],
+    dropped_messages: List[Dict[str, Any]],
+) -> List[Dict[str, str]]:
+    """Arma los mensajes para pedirle al modelo que actualice el resumen acumulado."""
+    lines: List[str] = []
+    if previous_summary:
+        lines.append(f"Resumen previo:\n{previous_summary}\n")
+    lines.append("Nuevos turnos:")
+    for message in dropped_messages:
+        speaker = "Usuario" if message.get("role") == "user" else "Agente"
+        lines.append(f"{speaker}: {message.get('content', '')}")
+
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n".join(lines)},
+    ]
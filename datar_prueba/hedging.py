@@ -0,0 +1,223 @@
+"""
+Peticiones cubiertas (hedging) contra un modelo secundario para DATAR
+
+Si el modelo principal no responde dentro de un percentil de su latencia
+observada, se envía la misma conversación al modelo secundario. Gana la
+primera respuesta completa y la otra llamada se cancela. En los streams la
+carrera es por el primer fragmento (tiempo hasta el primer token).
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from . import config
+from .metrics import LLM_HEDGE_CALLS, LLM_HEDGES
+
+
+T = TypeVar("T")
+
+# Marca de un stream que terminó sin emitir ningún fragmento
+_EXHAUSTED = object()
+
+
+async def _first_chunk(iterator: AsyncIterator[Any]) -> Any:
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+async def _aclose(iterator: Any) -> None:
+    aclose: Optional[Callable[[], Awaitable[None]]] = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            # p. ej. el stream perdedor sigue cancelándose: se cierra solo al terminar
+            pass
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias (segundos) con percentiles bajo demanda."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Percentil por rango más cercano; None si no hay muestras."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+
+class Hedger:
+    """Decide cuándo disparar la llamada secundaria y lleva la cuenta de su costo."""
+
+    def __init__(
+        self,
+        secondary_model: str,
+        percentile: float,
+        min_samples: int,
+        initial_delay: float,
+        min_delay: float,
+        window: int = 200,
+    ):
+        self.secondary_model = secondary_model
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.latencies = LatencyTracker(window)
+        # Tiempo hasta el primer fragmento de los streams (otra distribución)
+        self.first_chunk_latencies = LatencyTracker(window)
+
+        self.calls = 0
+        self.hedged = 0
+        self.wins = {"primary": 0, "secondary": 0}
+
+    @classmethod
+    def from_config(cls) -> "Hedger":
+        """Crea el hedger con los valores de `config.py` (inactivo si no hay modelo secundario)."""
+        return cls(
+            secondary_model=config.LLM_HEDGE_MODEL if config.LLM_HEDGE_ENABLED else "",
+            percentile=config.LLM_HEDGE_PERCENTILE,
+            min_samples=config.LLM_HEDGE_MIN_SAMPLES,
+            initial_delay=config.LLM_HEDGE_INITIAL_DELAY,
+            min_delay=config.LLM_HEDGE_MIN_DELAY,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secondary_model)
+
+    def delay(self, latencies: Optional[LatencyTracker] = None) -> float:
+        """Espera antes de cubrir: el percentil observado o, sin muestras suficientes, el inicial."""
+        latencies = latencies if latencies is not None else self.latencies
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, latencies.percentile(self.percentile) or 0.0)
+
+    async def call(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        secondary: Callable[[], Awaitable[T]],
+    ) -> Tuple[T, str]:
+        """
+        Ejecuta `primary` y, si tarda más que `delay()`, también `secondary`.
+
+        Retorna (resultado, "primary" | "secondary"). Un error de una de las dos
+        llamadas no gana: se espera a la otra y solo se propaga si ambas fallan.
+        Si `primary` falla antes de `delay()`, `secondary` se lanza de inmediato.
+        """
+        return await self._race(primary, secondary, self.latencies)
+
+    async def stream(
+        self,
+        primary: Callable[[], AsyncIterator[T]],
+        secondary: Callable[[], AsyncIterator[T]],
+    ) -> AsyncIterator[Tuple[T, str]]:
+        """
+        Cubre el tiempo hasta el primer fragmento de un stream.
+
+        Produce (fragmento, "primary" | "secondary"). La carrera es solo por el
+        primer fragmento: el stream que lo emite primero se sigue hasta el final
+        y el otro se cierra. Un error posterior al primer fragmento se propaga.
+        """
+        iterators: Dict[str, AsyncIterator[T]] = {}
+
+        def _opener(label: str, factory: Callable[[], AsyncIterator[T]]) -> Callable[[], Awaitable[Any]]:
+            def _open() -> Awaitable[Any]:
+                iterators[label] = factory().__aiter__()
+                return _first_chunk(iterators[label])
+            return _open
+
+        first, winner = await self._race(
+            _opener("primary", primary),
+            _opener("secondary", secondary),
+            self.first_chunk_latencies,
+        )
+        for label, iterator in iterators.items():
+            if label != winner:
+                await _aclose(iterator)
+
+        iterator = iterators[winner]
+        try:
+            if first is _EXHAUSTED:
+                return
+            yield first, winner
+            async for chunk in iterator:
+                yield chunk, winner
+        finally:
+            await _aclose(iterator)
+
+    async def _race(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        secondary: Callable[[], Awaitable[Any]],
+        latencies: LatencyTracker,
+    ) -> Tuple[Any, str]:
+        self.calls += 1
+        LLM_HEDGE_CALLS.inc()
+        started = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        secondary_task: "Optional[asyncio.Future[Any]]" = None
+
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.delay(latencies))
+            if done and primary_task.exception() is None:
+                latencies.observe(time.perf_counter() - started)
+                return primary_task.result(), "primary"
+
+            # La principal va lenta o ya falló: se cubre con la secundaria sin esperar más
+            self.hedged += 1
+            secondary_task = asyncio.ensure_future(secondary())
+            labels = {primary_task: "primary", secondary_task: "secondary"}
+            pending = {task for task in labels if not task.done()}
+            first_error: Optional[BaseException] = (
+                primary_task.exception() if primary_task.done() else None
+            )
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    winner = labels[task]
+                    if winner == "primary":
+                        latencies.observe(time.perf_counter() - started)
+                    self.wins[winner] += 1
+                    LLM_HEDGES.inc(1, winner)
+                    return task.result(), winner
+
+            LLM_HEDGES.inc(1, "failed")
+            raise first_error
+        finally:
+            # La llamada perdedora (o ambas, si quien espera fue cancelado) se cancela
+            for task in (primary_task, secondary_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tasa de cobertura y ganadores para `/health`."""
+        return {
+            "enabled": self.enabled,
+            "secondary_model": self.secondary_model or None,
+            "current_delay_s": round(self.delay(), 3),
+            "current_stream_delay_s": round(self.delay(self.first_chunk_latencies), 3),
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            "wins": dict(self.wins),
+        }
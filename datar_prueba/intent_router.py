@@ -0,0 +1,285 @@
+"""
+Enrutador local de intención para DATAR
+
+Elige un sub-agente (o deja el turno a `root_agent`) antes de cualquier
+llamada al modelo:
+
+1. Reglas configurables (p. ej. mensajes con muchos emojis → DiarioIntuitivo,
+   peticiones de sonido → PastoBogotano).
+2. Índice TF-IDF construido al arrancar con el nombre, la `description` y la
+   `instruction` de cada sub-agente (y de sus propios sub-agentes).
+
+Si ninguna señal supera los umbrales, la decisión es `None` y responde el raíz.
+
+Evaluación offline contra un archivo JSONL etiquetado
+(`{"message": "...", "agent": "PastoBogotano"}`; `root_agent` = sin delegar):
+
+    python -m datar_prueba.intent_router datos_etiquetados.jsonl
+"""
+
+import json
+import math
+import re
+import unicodedata
+from collections import Counter as TermCounter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import config
+from .metrics import ROUTER_CONFIDENCE, ROUTER_DECISIONS
+
+
+ROOT_LABEL = "root_agent"
+
+# Palabras demasiado comunes en las instrucciones para distinguir agentes
+STOPWORDS = frozenset("""
+    que los las del una por con para como sus mas pero este esta estos estas eres
+    tus son ser sobre entre cada desde hasta cuando donde puede pueden siempre
+    usuario usuaria respuesta respuestas responde agente agentes tambien muy sin
+    todo toda todos todas otro otra otros otras hace hacer tiene tener nos les
+""".split())
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"agent": "DiarioIntuitivo", "min_emoji_ratio": 0.3, "confidence": 0.95},
+    {
+        "agent": "PastoBogotano",
+        "keywords": [
+            "sonido", "sonidos", "suena", "sonar", "sonoro", "sonora", "escuchar",
+            "escucha", "oir", "audio", "ruido", "canto", "cantar", "melodia",
+        ],
+        "confidence": 0.9,
+    },
+]
+
+_TOKEN_RE = re.compile(r"[a-zñ]{3,}")
+
+
+def _strip_accents(text: str) -> str:
+    """Quita tildes y diéresis, pero conserva la ñ."""
+    return "".join(
+        ch if ch in "ñÑ" else "".join(
+            part for part in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(part)
+        )
+        for ch in text
+    )
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin tildes, palabras de 3+ letras y sin palabras vacías."""
+    return [
+        token for token in _TOKEN_RE.findall(_strip_accents(text.lower()))
+        if token not in STOPWORDS
+    ]
+
+
+def _is_emoji(ch: str) -> bool:
+    code = ord(ch)
+    return code >= 0x1F300 or 0x2600 <= code <= 0x27BF
+
+
+def emoji_ratio(text: str) -> float:
+    """Fracción de caracteres (sin espacios) que son emojis."""
+    # Selectores de variación y ZWJ acompañan a los emojis pero no cuentan aparte
+    visible = [
+        ch for ch in text
+        if not ch.isspace() and ch not in ("\ufe0f", "\u200d") and not unicodedata.combining(ch)
+    ]
+    if not visible:
+        return 0.0
+    return sum(1 for ch in visible if _is_emoji(ch)) / len(visible)
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """Resultado del enrutamiento: `agent` es None cuando responde el raíz."""
+
+    agent: Optional[str]
+    confidence: float
+    source: str                 # "rule", "tfidf" o "fallback"
+    candidate: Optional[str] = None  # Mejor sub-agente aunque no supere el umbral
+
+    @property
+    def label(self) -> str:
+        return self.agent or ROOT_LABEL
+
+
+def _agent_text(agent: Any) -> str:
+    """Nombre, descripción e instrucción del agente y de todo su sub-árbol."""
+    parts = [agent.name.replace("_", " "), getattr(agent, "description", "") or ""]
+    instruction = getattr(agent, "instruction", None)
+    if isinstance(instruction, str):
+        parts.append(instruction)
+    for sub_agent in getattr(agent, "sub_agents", None) or []:
+        parts.append(_agent_text(sub_agent))
+    return "\n".join(parts)
+
+
+class IntentRouter:
+    """Reglas + índice TF-IDF sobre los sub-agentes directos de `root_agent`."""
+
+    def __init__(
+        self,
+        documents: Dict[str, str],
+        rules: Sequence[Dict[str, Any]] = (),
+        min_score: float = 0.15,
+        min_margin: float = 0.05,
+    ):
+        self.rules = list(rules)
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+        tokenized = {name: tokenize(text) for name, text in documents.items()}
+        doc_freq: TermCounter = TermCounter()
+        for tokens in tokenized.values():
+            doc_freq.update(set(tokens))
+        total = len(tokenized)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in doc_freq.items()}
+        self.vectors = {name: self._vectorize(tokens) for name, tokens in tokenized.items()}
+
+    @classmethod
+    def from_agent(cls, root_agent: Any) -> "IntentRouter":
+        """Construye el índice con los sub-agentes directos y las reglas de `config.py`."""
+        documents = {
+            sub_agent.name: _agent_text(sub_agent)
+            for sub_agent in getattr(root_agent, "sub_agents", None) or []
+        }
+        return cls(
+            documents,
+            rules=load_rules(config.ROUTER_RULES_PATH),
+            min_score=config.ROUTER_MIN_SCORE,
+            min_margin=config.ROUTER_MIN_MARGIN,
+        )
+
+    def _vectorize(self, tokens: Iterable[str]) -> Dict[str, float]:
+        counts = TermCounter(tokens)
+        vector = {
+            term: (1 + math.log(count)) * self.idf[term]
+            for term, count in counts.items() if term in self.idf
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def scores(self, message: str) -> List[Tuple[str, float]]:
+        """Similitud coseno del mensaje con cada sub-agente, de mayor a menor."""
+        query = self._vectorize(tokenize(message))
+        ranked = [
+            (name, sum(weight * vector.get(term, 0.0) for term, weight in query.items()))
+            for name, vector in self.vectors.items()
+        ]
+        return sorted(ranked, key=lambda item: item[1], reverse=True)
+
+    def _apply_rules(self, message: str) -> Optional[RouteDecision]:
+        tokens = set(tokenize(message))
+        for rule in self.rules:
+            agent = rule.get("agent")
+            if agent not in self.vectors:
+                continue
+            confidence = float(rule.get("confidence", 0.9))
+            min_ratio = rule.get("min_emoji_ratio")
+            if min_ratio is not None and emoji_ratio(message) >= float(min_ratio):
+                return RouteDecision(agent, confidence, "rule", agent)
+            keywords = {_strip_accents(word.lower()) for word in rule.get("keywords", ())}
+            if keywords and tokens & keywords:
+                return RouteDecision(agent, confidence, "rule", agent)
+        return None
+
+    def route(self, message: str) -> RouteDecision:
+        """Decide a qué sub-agente enviar el mensaje (None = `root_agent`)."""
+        decision = self._apply_rules(message)
+        if decision is None:
+            ranked = self.scores(message)
+            if not ranked:
+                decision = RouteDecision(None, 0.0, "fallback")
+            else:
+                best, best_score = ranked[0]
+                runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+                if best_score >= self.min_score and best_score - runner_up >= self.min_margin:
+                    decision = RouteDecision(best, round(best_score, 4), "tfidf", best)
+                else:
+                    decision = RouteDecision(None, round(best_score, 4), "fallback", best)
+
+        ROUTER_DECISIONS.inc(1, decision.label, decision.source)
+        ROUTER_CONFIDENCE.observe(decision.confidence, decision.source)
+        return decision
+
+
+def load_rules(path: str) -> List[Dict[str, Any]]:
+    """Reglas desde un archivo JSON (lista de objetos) o, si no hay ruta, las predeterminadas."""
+    if not path:
+        return list(DEFAULT_RULES)
+    with open(path, "r", encoding="utf-8") as rules_file:
+        rules = json.load(rules_file)
+    if not isinstance(rules, list):
+        raise ValueError(f"{path} debe contener una lista de reglas")
+    return rules
+
+
+def evaluate(router: IntentRouter, examples: Sequence[Dict[str, str]]) -> Dict[str, Any]:
+    """Exactitud global, precisión/recall por etiqueta y errores de enrutamiento."""
+    confusion: Dict[Tuple[str, str], int] = TermCounter()
+    errors: List[Dict[str, Any]] = []
+    for example in examples:
+        expected = example.get("agent") or ROOT_LABEL
+        decision = router.route(example["message"])
+        confusion[(expected, decision.label)] += 1
+        if decision.label != expected:
+            errors.append({
+                "message": example["message"],
+                "expected": expected,
+                "predicted": decision.label,
+                "confidence": decision.confidence,
+                "source": decision.source,
+            })
+
+    labels = sorted({label for pair in confusion for label in pair})
+    per_label = {}
+    for label in labels:
+        true_positives = confusion[(label, label)]
+        predicted = sum(count for (_, got), count in confusion.items() if got == label)
+        actual = sum(count for (want, _), count in confusion.items() if want == label)
+        per_label[label] = {
+            "support": actual,
+            "precision": round(true_positives / predicted, 3) if predicted else 0.0,
+            "recall": round(true_positives / actual, 3) if actual else 0.0,
+        }
+
+    total = sum(confusion.values())
+    correct = sum(count for (want, got), count in confusion.items() if want == got)
+    return {
+        "examples": total,
+        "accuracy": round(correct / total, 3) if total else 0.0,
+        "per_label": per_label,
+        "errors": errors,
+    }
+
+
+def _main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evalúa el enrutador local contra un JSONL etiquetado.")
+    parser.add_argument("labelled", help='Archivo JSONL con {"message": ..., "agent": ...} por línea')
+    parser.add_argument("--errors", type=int, default=10, help="Errores de ejemplo a mostrar")
+    args = parser.parse_args(argv)
+
+    with open(args.labelled, "r", encoding="utf-8") as labelled_file:
+        examples = [json.loads(line) for line in labelled_file if line.strip()]
+
+    from .agent import root_agent
+
+    report = evaluate(IntentRouter.from_agent(root_agent), examples)
+    print(f"\n🧭 Exactitud: {report['accuracy']:.1%} ({report['examples']} ejemplos)")
+    for label, metrics in report["per_label"].items():
+        print(
+            f"   - {label:<26} precisión {metrics['precision']:.2f} · "
+            f"recall {metrics['recall']:.2f} · n={metrics['support']}"
+        )
+    for error in report["errors"][:args.errors]:
+        print(
+            f"   ✗ {error['message'][:60]!r}: esperado {error['expected']}, "
+            f"obtenido {error['predicted']} ({error['source']}, {error['confidence']:.2f})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
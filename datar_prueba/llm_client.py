@@ -0,0 +1,165 @@
+"""
+Cliente LiteLLM asíncrono compartido para DATAR
+
+Todas las llamadas al modelo pasan por una única instancia de `LLMClient`, que:
+- usa `litellm.acompletion` (corrutinas, no hilos del threadpool)
+- reutiliza un pool de conexiones HTTP keep-alive compartido
+- limita la concurrencia global con un semáforo y expone la profundidad de la cola
+
+`completion`/`stream` reservan el cupo por sí mismos; `ResilientCaller` usa en
+cambio `slot()` más `completion_in_slot`/`stream_in_slot`, para que la espera en
+cola no consuma el deadline de cada intento.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import litellm
+from litellm import acompletion
+
+from . import config
+from .metrics import LLM_QUEUE_WAIT
+
+
+class LLMQueueTimeout(RuntimeError):
+    """La petición esperó demasiado por un cupo de concurrencia libre."""
+
+
+class LLMClient:
+    """Cliente asíncrono con pool de conexiones y concurrencia acotada."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        request_timeout: float,
+        connect_timeout: float,
+        queue_timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.queue_timeout = queue_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+        # Métricas de la cola (solo se modifican desde el event loop)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.total_requests = 0
+        self.queue_timeouts = 0
+        self.total_wait_seconds = 0.0
+
+    @classmethod
+    def from_config(cls) -> "LLMClient":
+        """Crea el cliente con los valores definidos en `config.py`."""
+        return cls(
+            max_concurrency=config.LLM_MAX_CONCURRENCY,
+            request_timeout=config.LLM_REQUEST_TIMEOUT,
+            connect_timeout=config.LLM_CONNECT_TIMEOUT,
+            queue_timeout=config.LLM_QUEUE_TIMEOUT,
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+        )
+
+    async def start(self) -> None:
+        """Abre el pool HTTP compartido y lo registra como sesión async de LiteLLM."""
+        if self._http_client is not None:
+            return
+        self._http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        litellm.aclient_session = self._http_client
+
+    async def close(self) -> None:
+        """Cierra el pool HTTP compartido."""
+        if self._http_client is None:
+            return
+        if litellm.aclient_session is self._http_client:
+            litellm.aclient_session = None
+        await self._http_client.aclose()
+        self._http_client = None
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Reserva un cupo del semáforo global, contabilizando la espera en cola."""
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        queued_at = time.perf_counter()
+        try:
+            if self.queue_timeout > 0:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise LLMQueueTimeout(
+                f"No hubo cupo libre para llamar al modelo tras {self.queue_timeout:.0f}s en cola."
+            )
+        finally:
+            waited = time.perf_counter() - queued_at
+            self.waiting -= 1
+            self.total_wait_seconds += waited
+            LLM_QUEUE_WAIT.observe(waited)
+
+        self.in_flight += 1
+        self.total_requests += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def completion(self, **kwargs: Any) -> Any:
+        """Ejecuta `acompletion` dentro de un cupo de concurrencia."""
+        async with self.slot():
+            return await self.completion_in_slot(**kwargs)
+
+    async def completion_in_slot(self, **kwargs: Any) -> Any:
+        """Ejecuta `acompletion`; quien llama ya tiene un cupo de `slot()`."""
+        kwargs.setdefault("timeout", self.request_timeout)
+        return await acompletion(**kwargs)
+
+    async def stream(self, **kwargs: Any) -> AsyncIterator[Any]:
+        """Ejecuta `acompletion(stream=True)` y produce los chunks; el cupo se mantiene hasta cerrar el stream."""
+        async with self.slot():
+            async for chunk in self.stream_in_slot(**kwargs):
+                yield chunk
+
+    async def stream_in_slot(self, **kwargs: Any) -> AsyncIterator[Any]:
+        """Como `stream`, pero quien llama ya tiene un cupo de `slot()`."""
+        kwargs.setdefault("timeout", self.request_timeout)
+        response = await acompletion(stream=True, **kwargs)
+        async for chunk in response:
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumen del estado de la cola y del pool para `/health`."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "total_requests": self.total_requests,
+            "queue_timeouts": self.queue_timeouts,
+            "avg_queue_wait_ms": round(
+                (self.total_wait_seconds / self.total_requests) * 1000, 2
+            ) if self.total_requests else 0.0,
+            "pool_open": self._http_client is not None,
+        }
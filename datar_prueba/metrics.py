@@ -0,0 +1,310 @@
+"""
+Métricas en formato de texto Prometheus para DATAR
+
+Contadores, gauges e histogramas mínimos (sin dependencias externas) y el
+middleware ASGI que mide latencia y solicitudes en curso por ruta.
+
+Todas las actualizaciones ocurren en el hilo del event loop, así que los
+valores se modifican sin locks: registrar una observación es un par de sumas
+sobre enteros/floats y nunca compite con el scrape.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Buckets (segundos) pensados para llamadas a LLM: de milisegundos a un minuto
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monótono, opcionalmente con etiquetas."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja; con `callback` se calcula en el momento del scrape."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, amount: float = 1, *labelvalues: str) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) - amount
+
+    def set_callback(self, callback: Callable[[], float]) -> None:
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception:
+                return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Histograma con buckets fijos; guarda conteos por bucket y los acumula al exportar."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str) -> Iterator[None]:
+        """Mide la duración del bloque y la registra en segundos."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        for labels, (counts, total_sum, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{base} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas que se exportan juntas en `/metrics`."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------- Métricas HTTP ----------
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "datar_http_requests_total", "Solicitudes HTTP atendidas.", ("method", "route", "status"),
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "datar_http_request_duration_seconds", "Latencia de las solicitudes HTTP.", ("method", "route"),
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "datar_http_requests_in_flight", "Solicitudes HTTP en curso.",
+))
+
+# ---------- Métricas del flujo de chat ----------
+
+CHAT_STAGE_LATENCY = REGISTRY.register(Histogram(
+    "datar_chat_stage_duration_seconds", "Latencia de cada etapa del turno de chat.", ("stage",),
+))
+CHAT_TIME_TO_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "datar_chat_time_to_first_token_seconds", "Tiempo hasta el primer token en /chat/stream.",
+))
+CHAT_FALLBACKS = REGISTRY.register(Counter(
+    "datar_chat_fallbacks_total", "Respuestas servidas por _fallback_agent_reply.",
+))
+LLM_PROMPT_TOKENS = REGISTRY.register(Counter(
+    "datar_llm_prompt_tokens_total", "Tokens de prompt reportados por LiteLLM.", ("model",),
+))
+LLM_COMPLETION_TOKENS = REGISTRY.register(Counter(
+    "datar_llm_completion_tokens_total", "Tokens de respuesta reportados por LiteLLM.", ("model",),
+))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "datar_llm_requests_in_flight", "Llamadas al proveedor LLM en curso.",
+))
+LLM_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "datar_llm_queue_depth", "Peticiones esperando cupo en el semáforo del cliente LLM.",
+))
+LLM_HEDGE_CALLS = REGISTRY.register(Counter(
+    "datar_llm_hedge_eligible_total", "Llamadas al proveedor sujetas a hedging.",
+))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "datar_llm_hedges_total", "Llamadas duplicadas al modelo secundario, por ganador.", ("winner",),
+))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "datar_llm_retries_total", "Reintentos tras errores transitorios del proveedor.", ("model",),
+))
+LLM_BREAKER_REJECTIONS = REGISTRY.register(Counter(
+    "datar_llm_breaker_rejections_total", "Llamadas rechazadas con el circuito abierto.", ("model",),
+))
+LLM_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "datar_llm_queue_wait_seconds", "Espera por un cupo del semáforo del cliente LLM.",
+))
+LLM_AGENT_PROMPT_TOKENS = REGISTRY.register(Counter(
+    "datar_llm_agent_prompt_tokens_total", "Tokens de entrada por agente.", ("agent",),
+))
+LLM_AGENT_CACHED_TOKENS = REGISTRY.register(Counter(
+    "datar_llm_agent_cached_tokens_total", "Tokens de entrada leídos de la caché de prompts del proveedor.", ("agent",),
+))
+LLM_AGENT_CACHE_WRITE_TOKENS = REGISTRY.register(Counter(
+    "datar_llm_agent_cache_write_tokens_total", "Tokens de entrada escritos en la caché de prompts del proveedor.", ("agent",),
+))
+LLM_AGENT_CALL_LATENCY = REGISTRY.register(Histogram(
+    "datar_llm_agent_call_duration_seconds",
+    "Latencia de la llamada al proveedor (hasta el primer token en streaming) según la caché de prompts.",
+    ("agent", "prompt_cache"),
+))
+
+ROUTER_DECISIONS = REGISTRY.register(Counter(
+    "datar_router_decisions_total", "Decisiones del enrutador local de intención.", ("agent", "source"),
+))
+ROUTER_CONFIDENCE = REGISTRY.register(Histogram(
+    "datar_router_confidence", "Confianza de las decisiones del enrutador local.", ("source",),
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+))
+
+# ---------- Métricas de estado ----------
+
+SESSIONS_CACHED = REGISTRY.register(Gauge(
+    "datar_sessions_cached", "Sesiones en la caché en memoria.",
+))
+SESSION_CACHE_BYTES = REGISTRY.register(Gauge(
+    "datar_session_cache_bytes", "Bytes aproximados de contenido en la caché de sesiones.",
+))
+RESPONSE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "datar_response_cache_lookups_total", "Consultas a la caché de respuestas.", ("result",),
+))
+
+
+def record_usage(model: str, usage: Optional[Dict[str, int]]) -> None:
+    """Suma los tokens del bloque `usage` de LiteLLM a los contadores del modelo."""
+    if not usage:
+        return
+    LLM_PROMPT_TOKENS.inc(usage.get("prompt_tokens", 0), model)
+    LLM_COMPLETION_TOKENS.inc(usage.get("completion_tokens", 0), model)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide latencia, estado y solicitudes en curso por ruta."""
+
+    def __init__(self, app: Any, exempt_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exempt_paths = tuple(exempt_paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # La ruta plantilla (p. ej. /sessions/{session_id}) la fija el router de FastAPI
+            route = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            HTTP_LATENCY.observe(time.perf_counter() - started, scope["method"], route)
+            HTTP_REQUESTS.inc(1, scope["method"], route, str(status["code"]))
@@ -0,0 +1,145 @@
+"""
+Caché de prompts del proveedor para DATAR
+
+Las instrucciones de sistema de varios agentes son largas y no cambian entre
+turnos; el historial ya enviado tampoco. Los proveedores que lo soportan
+(Anthropic, Gemini, DeepSeek, OpenAI...) pueden reutilizar ese prefijo si la
+petición lo marca con `cache_control`. Este módulo:
+
+1. Decide si el modelo admite las marcas (`supports_prompt_caching` de LiteLLM,
+   o `PROMPT_CACHE_MODE` para forzarlo).
+2. Construye los `cache_control_injection_points` que LiteLLM traduce al
+   dialecto de cada proveedor: la instrucción de sistema y el último mensaje
+   ya visto antes del turno nuevo.
+3. Acumula por agente los tokens de entrada servidos desde la caché, para
+   comparar costo y latencia con y sin ella (`/health` y `/metrics`).
+
+Los sub-agentes de ADK sobre Gemini usan en cambio la caché de contexto de ADK
+(`ContextCacheConfig`); sus tokens cacheados llegan en `usage_metadata`.
+"""
+
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from . import config
+from .metrics import (
+    LLM_AGENT_CACHED_TOKENS,
+    LLM_AGENT_CACHE_WRITE_TOKENS,
+    LLM_AGENT_CALL_LATENCY,
+    LLM_AGENT_PROMPT_TOKENS,
+)
+
+
+# Familias que aceptan `cache_control` aunque el mapa de modelos de LiteLLM no
+# las reporte (p. ej. Claude a través de OpenRouter)
+_CACHE_CONTROL_FAMILIES = ("anthropic/", "claude")
+
+
+@lru_cache(maxsize=64)
+def supports_cache_control(model: str) -> bool:
+    """True si conviene marcar el prefijo estable para `model` según `PROMPT_CACHE_MODE`."""
+    if config.PROMPT_CACHE_MODE == "off" or not model:
+        return False
+    if config.PROMPT_CACHE_MODE == "on":
+        return True
+    if any(family in model.lower() for family in _CACHE_CONTROL_FAMILIES):
+        return True
+    try:
+        from litellm.utils import supports_prompt_caching
+
+        return bool(supports_prompt_caching(model=model))
+    except Exception:
+        return False
+
+
+def cache_hints(model: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Parámetros extra para LiteLLM que marcan el prefijo estable de `messages`.
+
+    Se aplican después de calcular la clave de la caché de respuestas, así que
+    no la alteran. Retorna un dict vacío si el modelo no admite las marcas.
+    """
+    if not supports_cache_control(model):
+        return {}
+    points: List[Dict[str, Any]] = [{"location": "message", "role": "system"}]
+    # El último mensaje antes del turno nuevo cierra el historial ya procesado
+    seen = len(messages) - 2
+    if seen > 0 and messages[-1].get("role") == "user" and messages[seen].get("role") != "system":
+        points.append({"location": "message", "index": seen})
+    return {"cache_control_injection_points": points}
+
+
+def extract_cache_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Tokens de entrada leídos y escritos en la caché del proveedor.
+
+    LiteLLM normaliza las lecturas en `prompt_tokens_details.cached_tokens`;
+    Anthropic reporta además `cache_read_input_tokens` y `cache_creation_input_tokens`.
+    """
+    details = usage.get("prompt_tokens_details") or {}
+    if not isinstance(details, dict):
+        details = getattr(details, "__dict__", {}) or {}
+    cached = int(details.get("cached_tokens") or 0) or int(usage.get("cache_read_input_tokens") or 0)
+    return {
+        "cached_tokens": cached,
+        "cache_write_tokens": int(usage.get("cache_creation_input_tokens") or 0),
+    }
+
+
+class PromptCacheStats:
+    """Tokens de entrada y aciertos de la caché de prompts, acumulados por agente."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents: Dict[str, Dict[str, int]] = {}
+
+    def record(
+        self,
+        agent: str,
+        prompt_tokens: int,
+        cached_tokens: int = 0,
+        cache_write_tokens: int = 0,
+        latency: Optional[float] = None,
+    ) -> None:
+        """Suma una llamada del agente; `latency` (segundos) se separa por acierto o fallo."""
+        with self._lock:
+            totals = self._agents.setdefault(agent, {
+                "calls": 0,
+                "cache_hits": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "cache_write_tokens": 0,
+            })
+            totals["calls"] += 1
+            totals["cache_hits"] += 1 if cached_tokens else 0
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["cache_write_tokens"] += cache_write_tokens
+
+        LLM_AGENT_PROMPT_TOKENS.inc(prompt_tokens, agent)
+        LLM_AGENT_CACHED_TOKENS.inc(cached_tokens, agent)
+        LLM_AGENT_CACHE_WRITE_TOKENS.inc(cache_write_tokens, agent)
+        if latency is not None:
+            LLM_AGENT_CALL_LATENCY.observe(latency, agent, "hit" if cached_tokens else "miss")
+
+    def record_usage(self, agent: str, usage: Optional[Dict[str, Any]], latency: Optional[float] = None) -> None:
+        """Registra un bloque `usage` de `_extract_usage` (se ignoran las estimaciones locales)."""
+        if not usage or usage.get("estimated"):
+            return
+        self.record(
+            agent,
+            int(usage.get("prompt_tokens") or 0),
+            int(usage.get("cached_tokens") or 0),
+            int(usage.get("cache_write_tokens") or 0),
+            latency,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Totales por agente con la fracción de tokens de entrada servidos desde la caché."""
+        with self._lock:
+            agents = {name: dict(totals) for name, totals in self._agents.items()}
+        for totals in agents.values():
+            prompt_tokens = totals["prompt_tokens"]
+            totals["cached_ratio"] = round(totals["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+        return {"mode": config.PROMPT_CACHE_MODE, "agents": agents}
@@ -0,0 +1,306 @@
+"""
+Limitador de peticiones (token bucket) para DATAR
+
+Middleware ASGI que aplica `RATE_LIMIT_REQUESTS` por `RATE_LIMIT_PERIOD` segundos
+a cada IP de cliente y, cuando la petición lo incluye, a cada `session_id`.
+
+El estado de los buckets vive detrás de `RateLimitStorage`:
+
+- `InMemoryRateLimitStorage`: dict del proceso (un solo worker, pruebas).
+- `SQLiteRateLimitStorage`: tabla SQLite en disco local compartida por todos los
+  workers del host (`SHARED_STATE=True`). Sus operaciones pueden esperar el
+  bloqueo de escritura de otro worker, así que desde código async se usan
+  `aconsume`/`acleanup`, que las ejecutan en un hilo.
+"""
+
+import asyncio
+import json
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+
+class RateLimitStorage(ABC):
+    """Almacén de buckets: cada operación es O(1) por clave."""
+
+    @abstractmethod
+    def consume(self, key: str, capacity: float, refill_rate: float, now: float) -> Tuple[bool, float]:
+        """
+        Intenta gastar un token del bucket `key`.
+
+        Retorna (permitido, tokens_restantes). Si no se permite, `tokens_restantes`
+        es el saldo actual (< 1).
+        """
+
+    @abstractmethod
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        """Elimina los buckets sin uso por más de `idle_seconds`. Retorna cuántos borró."""
+
+    async def aconsume(self, key: str, capacity: float, refill_rate: float, now: float) -> Tuple[bool, float]:
+        """`consume` para código async; los almacenes que bloquean lo ejecutan fuera del event loop."""
+        return self.consume(key, capacity, refill_rate, now)
+
+    async def acleanup(self, idle_seconds: float, now: float) -> int:
+        """`cleanup` para código async."""
+        return self.cleanup(idle_seconds, now)
+
+    def __len__(self) -> int:
+        return 0
+
+
+class InMemoryRateLimitStorage(RateLimitStorage):
+    """Buckets en un dict del proceso (un solo worker)."""
+
+    def __init__(self):
+        # clave -> [tokens, último_relleno]
+        self._buckets: Dict[str, List[float]] = {}
+
+    def consume(self, key: str, capacity: float, refill_rate: float, now: float) -> Tuple[bool, float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return True, bucket[0]
+        bucket[0] = tokens
+        return False, tokens
+
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        idle = [key for key, (_, last) in self._buckets.items() if now - last > idle_seconds]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteRateLimitStorage(RateLimitStorage):
+    """
+    Buckets en SQLite (WAL) compartidos entre procesos.
+
+    Cada `consume` es una transacción `BEGIN IMMEDIATE` de una fila: el bloqueo de
+    escritura de SQLite serializa a los workers, así que un cliente no puede
+    gastar el mismo token en dos procesos a la vez.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+        " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL"
+        ") WITHOUT ROWID"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Conteo aproximado para `/health`: se refresca en `cleanup`, nunca en el event loop
+        self._count = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def consume(self, key: str, capacity: float, refill_rate: float, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    tokens = capacity
+                else:
+                    tokens = min(capacity, row[0] + max(0.0, now - row[1]) * refill_rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens
+
+    async def aconsume(self, key: str, capacity: float, refill_rate: float, now: float) -> Tuple[bool, float]:
+        # BEGIN IMMEDIATE puede esperar hasta `busy_timeout` a otro worker
+        return await asyncio.to_thread(self.consume, key, capacity, refill_rate, now)
+
+    async def acleanup(self, idle_seconds: float, now: float) -> int:
+        return await asyncio.to_thread(self.cleanup, idle_seconds, now)
+
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - idle_seconds,)
+            )
+            self._count = conn.execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        # Sin SQLite ni lock: `/health` no debe esperar a `busy_timeout` de otro worker
+        return self._count
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI que responde 429 con `Retry-After` y cabeceras `X-RateLimit-*`."""
+
+    def __init__(
+        self,
+        app: Any,
+        storage: RateLimitStorage,
+        requests: int,
+        period: float,
+        exempt_paths: Iterable[str] = (),
+        cleanup_interval: float = 300,
+        max_body_bytes: int = 64 * 1024,
+    ):
+        self.app = app
+        self.storage = storage
+        self.capacity = float(requests)
+        self.period = float(period)
+        self.refill_rate = self.capacity / self.period
+        self.exempt_paths = tuple(exempt_paths)
+        self.cleanup_interval = cleanup_interval
+        # Tope del cuerpo que se lee para buscar `session_id`; si es mayor, solo cuenta la IP
+        self.max_body_bytes = max_body_bytes
+        self._last_cleanup = time.time()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or self._is_exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        # Reloj de pared: los buckets compartidos los comparan procesos distintos
+        now = time.time()
+        await self._maybe_cleanup(now)
+
+        receive, session_id = await self._extract_session_id(scope, receive)
+        client_ip = scope.get("client")[0] if scope.get("client") else "desconocido"
+
+        keys = [f"ip:{client_ip}"]
+        if session_id:
+            keys.append(f"session:{session_id}")
+
+        remaining = self.capacity
+        for key in keys:
+            allowed, tokens = await self.storage.aconsume(key, self.capacity, self.refill_rate, now)
+            if not allowed:
+                await self._reject(send, tokens)
+                return
+            remaining = min(remaining, tokens)
+
+        headers = self._limit_headers(remaining)
+
+        async def send_with_headers(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _is_exempt(self, path: str) -> bool:
+        return any(path == exempt or path.startswith(f"{exempt}/") for exempt in self.exempt_paths)
+
+    async def _maybe_cleanup(self, now: float) -> None:
+        """Purga periódica de buckets inactivos (un bucket inactivo un periodo ya está lleno)."""
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        await self.storage.acleanup(self.period, now)
+
+    async def _extract_session_id(self, scope: Dict[str, Any], receive: Any) -> Tuple[Any, Optional[str]]:
+        """
+        Busca `session_id` en la query string o en el cuerpo JSON.
+
+        Solo se leen hasta `max_body_bytes`: con un cuerpo mayor no se busca la
+        sesión y se limita únicamente por IP. Si se lee el cuerpo (o su comienzo),
+        retorna un `receive` que lo reproduce para la aplicación.
+        """
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("session_id"):
+            return receive, query["session_id"][0]
+
+        headers = dict(scope.get("headers") or [])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if scope["method"] != "POST" or "application/json" not in content_type:
+            return receive, None
+        declared = headers.get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_body_bytes:
+            return receive, None
+
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body and size <= self.max_body_bytes:
+            message = await receive()
+            if message["type"] != "http.request":
+                more_body = False
+                break
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            size += len(chunk)
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        session_id = None
+        if not more_body and size <= self.max_body_bytes:
+            try:
+                payload = json.loads(body) if body else None
+                if isinstance(payload, dict) and isinstance(payload.get("session_id"), str):
+                    session_id = payload["session_id"]
+            except ValueError:
+                pass
+
+        replayed = False
+
+        async def replay_receive() -> Dict[str, Any]:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                # Con un cuerpo mayor que el tope, el resto sigue llegando de `receive`
+                return {"type": "http.request", "body": body, "more_body": more_body}
+            return await receive()
+
+        return replay_receive, session_id
+
+    def _limit_headers(self, remaining: float) -> List[Tuple[bytes, bytes]]:
+        reset = math.ceil((self.capacity - remaining) / self.refill_rate)
+        return [
+            (b"x-ratelimit-limit", str(int(self.capacity)).encode()),
+            (b"x-ratelimit-remaining", str(int(remaining)).encode()),
+            (b"x-ratelimit-reset", str(reset).encode()),
+        ]
+
+    async def _reject(self, send: Any, tokens: float) -> None:
+        retry_after = max(1, math.ceil((1 - tokens) / self.refill_rate))
+        body = json.dumps({
+            "detail": f"Demasiadas solicitudes. Intenta de nuevo en {retry_after} segundos."
+        }, ensure_ascii=False).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ] + self._limit_headers(tokens)
+        await send({"type": "http.response.start", "status": 429, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,300 @@
+"""
+Capa de resiliencia alrededor de las llamadas al proveedor LLM para DATAR
+
+- Deadline por intento y deadline total de la llamada.
+- Reintentos acotados con backoff exponencial y jitter completo, solo para
+  errores transitorios del proveedor (timeouts, 429, 5xx, conexión).
+- Circuit breaker por modelo: tras varios fallos seguidos rechaza las llamadas
+  de inmediato durante `recovery_timeout` y luego deja pasar una de prueba.
+
+La espera por un cupo local de concurrencia (`slot`, ver `LLMClient.slot`) queda
+fuera del deadline por intento y nunca cuenta como fallo del proveedor.
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import litellm
+
+from . import config
+from .metrics import LLM_BREAKER_REJECTIONS, LLM_RETRIES
+
+
+T = TypeVar("T")
+
+# Fábrica del cupo local que debe obtenerse antes de cada intento
+Slot = Callable[[], AsyncContextManager[None]]
+
+# Errores transitorios del proveedor que justifican reintentar (y cuentan para el breaker)
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    httpx.TransportError,
+    litellm.Timeout,
+    litellm.APIConnectionError,
+    litellm.RateLimitError,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+    litellm.BadGatewayError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del modelo está abierto: la llamada se rechaza sin contactar al proveedor."""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Se agotó el tiempo total disponible para la llamada (incluidos los reintentos)."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True si el error es transitorio (timeout, conexión, 429 o 5xx)."""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+class CircuitBreaker:
+    """Breaker clásico cerrado → abierto → semiabierto."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> None:
+        """Lanza `CircuitOpenError` si la llamada no debe intentarse ahora."""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            # Una sola llamada de prueba decide si el circuito vuelve a cerrarse
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(
+            f"Proveedor LLM no disponible (circuito abierto); reintenta en {retry_in:.0f}s."
+        )
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Libera la llamada de prueba si terminó sin veredicto (p. ej. cancelada)."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class ResilientCaller:
+    """Aplica deadlines, reintentos con jitter y un breaker por modelo a las llamadas LLM."""
+
+    def __init__(
+        self,
+        attempt_timeout: float,
+        overall_timeout: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        failure_threshold: int,
+        recovery_timeout: float,
+    ):
+        self.attempt_timeout = attempt_timeout
+        self.overall_timeout = overall_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_config(cls) -> "ResilientCaller":
+        """Crea la capa de resiliencia con los valores definidos en `config.py`."""
+        return cls(
+            attempt_timeout=config.LLM_ATTEMPT_TIMEOUT,
+            overall_timeout=config.LLM_OVERALL_TIMEOUT,
+            max_retries=config.LLM_MAX_RETRIES,
+            backoff_base=config.LLM_RETRY_BACKOFF_BASE,
+            backoff_max=config.LLM_RETRY_BACKOFF_MAX,
+            failure_threshold=config.LLM_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=config.LLM_BREAKER_RECOVERY_TIMEOUT,
+        )
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker(
+                self.failure_threshold, self.recovery_timeout
+            )
+        return breaker
+
+    def _backoff(self, attempt: int) -> float:
+        """Jitter completo: uniforme entre 0 y el tope exponencial del intento."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _allow(self, model: str) -> CircuitBreaker:
+        breaker = self.breaker(model)
+        try:
+            breaker.allow()
+        except CircuitOpenError:
+            LLM_BREAKER_REJECTIONS.inc(1, model)
+            raise
+        return breaker
+
+    async def _before_retry(self, model: str, attempt: int, error: BaseException, deadline: float) -> None:
+        """Espera el backoff del intento o relanza `error` si ya no quedan intentos ni tiempo."""
+        delay = self._backoff(attempt)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            raise error
+        LLM_RETRIES.inc(1, model)
+        await asyncio.sleep(delay)
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Se agotó el tiempo total de la llamada al modelo.")
+        return min(self.attempt_timeout, remaining)
+
+    async def call(self, model: str, fn: Callable[[], Awaitable[T]], slot: Optional[Slot] = None) -> T:
+        """
+        Ejecuta `fn()` con deadlines, reintentos y breaker; `model` identifica el circuito.
+
+        Con `slot`, cada intento espera primero ese cupo y su deadline empieza al obtenerlo.
+        """
+        deadline = time.monotonic() + self.overall_timeout
+        attempt = 0
+        while True:
+            breaker = self._allow(model)
+            try:
+                async with _acquire(slot):
+                    timeout = self._attempt_timeout(deadline)
+                    result = await asyncio.wait_for(fn(), timeout=timeout)
+            except (asyncio.CancelledError, DeadlineExceeded):
+                # Cancelada, o sin tiempo tras esperar cupo o backoff: no es culpa del proveedor
+                breaker.release()
+                raise
+            except Exception as error:
+                if not is_retryable(error):
+                    # Error de la petición (auth, 400, cola local llena): no es culpa del proveedor
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                await self._before_retry(model, attempt, error, deadline)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    async def stream(
+        self,
+        model: str,
+        factory: Callable[[], AsyncIterator[T]],
+        slot: Optional[Slot] = None,
+    ) -> AsyncIterator[T]:
+        """
+        Itera el stream de `factory()` con la misma política.
+
+        Solo se reintenta mientras no se haya emitido ningún fragmento; después,
+        `attempt_timeout` actúa como tiempo máximo de silencio entre fragmentos.
+        El cupo `slot`, si se indica, se mantiene hasta cerrar el stream.
+        """
+        deadline = time.monotonic() + self.overall_timeout
+        attempt = 0
+        while True:
+            breaker = self._allow(model)
+            emitted = False
+            try:
+                async with _acquire(slot):
+                    timeout = self._attempt_timeout(deadline)
+                    iterator = factory().__aiter__()
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+                            except StopAsyncIteration:
+                                break
+                            if not emitted:
+                                emitted = True
+                                breaker.record_success()
+                                timeout = self.attempt_timeout
+                            yield chunk
+                    finally:
+                        await _aclose(iterator)
+            except (asyncio.CancelledError, DeadlineExceeded):
+                breaker.release()
+                raise
+            except Exception as error:
+                if not is_retryable(error):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                if emitted:
+                    raise
+                await self._before_retry(model, attempt, error, deadline)
+                attempt += 1
+                continue
+            if not emitted:
+                breaker.record_success()
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """Política vigente y estado de cada circuito para `/health`."""
+        return {
+            "attempt_timeout_s": self.attempt_timeout,
+            "overall_timeout_s": self.overall_timeout,
+            "max_retries": self.max_retries,
+            "breakers": {model: breaker.stats() for model, breaker in self._breakers.items()},
+        }
+
+
+@asynccontextmanager
+async def _no_slot() -> AsyncIterator[None]:
+    yield
+
+
+def _acquire(slot: Optional[Slot]) -> AsyncContextManager[None]:
+    return slot() if slot is not None else _no_slot()
+
+
+async def _aclose(iterator: Any) -> None:
+    aclose: Optional[Callable[[], Awaitable[None]]] = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
@@ -0,0 +1,193 @@
+"""
+Caché de respuestas exactas para DATAR
+
+Evita repetir la llamada al proveedor cuando la misma conversación (mismos
+parámetros de modelo y mismos mensajes normalizados) ya fue respondida.
+
+- Nivel 1: dict LRU en memoria con TTL.
+- Nivel 2 (opcional): tabla SQLite compartida entre reinicios. Las filas
+  vencidas se purgan como mucho cada `sweep_interval` segundos, no en cada `set`.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Parámetros que no cambian la respuesta y no deben formar parte de la clave
+_IGNORED_PARAMS = ("api_key",)
+
+
+def _normalize_text(text: str) -> str:
+    """Colapsa espacios y mayúsculas para que "Hola" y " hola " compartan entrada."""
+    return " ".join(str(text).split()).casefold()
+
+
+def make_cache_key(params: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+    """Hash estable de (parámetros resueltos del modelo, conversación normalizada)."""
+    payload = {
+        "params": {
+            k: v for k, v in sorted(params.items())
+            if k not in _IGNORED_PARAMS and isinstance(v, (str, int, float, bool))
+        },
+        "messages": [
+            [msg.get("role", ""), _normalize_text(msg.get("content", ""))]
+            for msg in messages
+        ],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """Caché LRU con TTL, en memoria y con un nivel SQLite opcional."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        sqlite_path: Optional[str] = None,
+        sweep_interval: float = 300,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path or None
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def _sqlite(self) -> Optional[sqlite3.Connection]:
+        if not self.sqlite_path:
+            return None
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")  # Varios workers pueden compartir el archivo
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache (expires_at)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Retorna la respuesta guardada si existe y no ha expirado."""
+        now = time.time()
+        response = self._memory_get(key, now)
+        if response is None and self.sqlite_path:
+            response = self._finish_sqlite_get(key, self._sqlite_get(key), now)
+        return self._count(response)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """`get` para el event loop: la lectura SQLite (que puede esperar a otro worker) va en un hilo."""
+        now = time.time()
+        response = self._memory_get(key, now)
+        if response is None and self.sqlite_path:
+            row = await asyncio.to_thread(self._sqlite_get, key)
+            response = self._finish_sqlite_get(key, row, now)
+        return self._count(response)
+
+    def set(self, key: str, response: str) -> None:
+        """Guarda una respuesta en memoria (y en SQLite si está configurado)."""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, response, expires_at)
+        if self.sqlite_path:
+            self._sqlite_set(key, response, expires_at)
+
+    async def aset(self, key: str, response: str) -> None:
+        """`set` para el event loop: la escritura SQLite va en un hilo."""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, response, expires_at)
+        if self.sqlite_path:
+            await asyncio.to_thread(self._sqlite_set, key, response, expires_at)
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at > now:
+            self._entries.move_to_end(key)
+            return response
+        del self._entries[key]
+        return None
+
+    def _finish_sqlite_get(self, key: str, row: Optional[Tuple[str, float]], now: float) -> Optional[str]:
+        if row is None or row[1] <= now:
+            return None
+        self._remember(key, row[0], row[1])
+        self.sqlite_hits += 1
+        return row[0]
+
+    def _count(self, response: Optional[str]) -> Optional[str]:
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def _sqlite_get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._sqlite().execute(
+                "SELECT response, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _sqlite_set(self, key: str, response: str, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._sqlite()
+            sweep = now - self._last_sweep >= self.sweep_interval
+            if sweep:
+                self._last_sweep = now
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at),
+                )
+                if sweep:
+                    # `get` ya ignora las filas vencidas; la purga solo recupera espacio
+                    conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        conn = self._sqlite()
+        if conn is not None:
+            with self._lock, conn:
+                conn.execute("DELETE FROM response_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Aciertos, fallos y tamaño de la caché para `/health`."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "sqlite_hits": self.sqlite_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "sqlite_path": self.sqlite_path,
+        }
@@ -0,0 +1,149 @@
+"""
+Caché acotada de sesiones en memoria para DATAR
+
+`SessionCache` reemplaza al dict plano `sessions_store` y limita su crecimiento con:
+- TTL de inactividad medido contra `last_activity`
+- límite LRU de número de sesiones
+- presupuesto aproximado de bytes del contenido de los mensajes
+
+Las sesiones expulsadas siguen disponibles en el backend persistente (si lo hay)
+y se recargan de forma transparente en el siguiente acceso.
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    """Tamaño aproximado (bytes UTF-8) del contenido de un mensaje."""
+    content = message.get("content")
+    if not content:
+        return 0
+    return len(str(content).encode("utf-8"))
+
+
+def _session_size(session_data: Dict[str, Any]) -> int:
+    return sum(_message_size(msg) for msg in session_data.get("messages", []))
+
+
+class SessionCache(MutableMapping):
+    """Dict de sesiones con orden LRU, TTL de inactividad y presupuesto de memoria."""
+
+    def __init__(self, max_sessions: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        self.max_sessions = max_sessions    # 0 = sin límite
+        self.max_bytes = max_bytes          # 0 = sin límite
+        self.ttl_seconds = ttl_seconds      # 0 = sin expiración
+
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.evictions: Dict[str, int] = {"ttl": 0, "lru": 0, "memory": 0}
+        # Se invoca con el session_id de cada sesión expulsada
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+    # ---------- Interfaz de dict ----------
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        session_data = self._data[session_id]
+        self._data.move_to_end(session_id)
+        return session_data
+
+    def __setitem__(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        if session_id in self._data:
+            self.total_bytes -= self._sizes[session_id]
+        self._data[session_id] = session_data
+        self._data.move_to_end(session_id)
+        size = _session_size(session_data)
+        self._sizes[session_id] = size
+        self.total_bytes += size
+        self._enforce_limits(protect=session_id)
+
+    def __delitem__(self, session_id: str) -> None:
+        del self._data[session_id]
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._data
+
+    # Recorridos sin alterar el orden LRU
+    def items(self):
+        return self._data.items()
+
+    def values(self):
+        return self._data.values()
+
+    # ---------- Contabilidad y expulsión ----------
+
+    def message_added(self, session_id: str, message: Dict[str, Any]) -> None:
+        """Actualiza el tamaño de la sesión tras agregar un mensaje y aplica el presupuesto."""
+        if session_id not in self._data:
+            return
+        size = _message_size(message)
+        self._sizes[session_id] += size
+        self.total_bytes += size
+        self._data.move_to_end(session_id)
+        self._enforce_limits(protect=session_id)
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        del self[session_id]
+        self.evictions[reason] += 1
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def _enforce_limits(self, protect: Optional[str] = None) -> None:
+        """Expulsa las sesiones menos usadas mientras se superen los límites."""
+        while self.max_sessions and len(self._data) > self.max_sessions:
+            oldest = next(iter(self._data))
+            if oldest == protect:
+                break
+            self._evict(oldest, "lru")
+
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self._data) > 1:
+            oldest = next(iter(self._data))
+            if oldest == protect:
+                break
+            self._evict(oldest, "memory")
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Expulsa las sesiones inactivas más allá del TTL y re-aplica los límites."""
+        before = dict(self.evictions)
+
+        if self.ttl_seconds:
+            now = now if now is not None else time.time()
+            expired = []
+            for session_id, session_data in self._data.items():
+                try:
+                    last_activity = datetime.fromisoformat(session_data["last_activity"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if now - last_activity > self.ttl_seconds:
+                    expired.append(session_id)
+            for session_id in expired:
+                self._evict(session_id, "ttl")
+
+        self._enforce_limits()
+        return {
+            reason: self.evictions[reason] - before[reason]
+            for reason in self.evictions
+            if self.evictions[reason] > before[reason]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumen del estado de la caché para `/health`."""
+        return {
+            "sessions": len(self._data),
+            "approx_bytes": self.total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": dict(self.evictions),
+        }
@@ -0,0 +1,113 @@
+"""
+Índice ordenado de sesiones para DATAR
+
+Mantiene un resumen compacto de cada sesión en caché (fechas y número de
+mensajes) y una lista ordenada por `last_activity`, de modo que `GET /sessions`
+pagine por cursor en O(página) sin recorrer la caché. Solo se usa con el backend
+en memoria: con uno persistente se pagina desde `SessionBackend.page_sessions`
+y el índice no crece con las sesiones guardadas.
+
+Las marcas de tiempo son cadenas ISO 8601 generadas por `datetime.isoformat()`,
+cuyo orden lexicográfico coincide con el cronológico.
+"""
+
+import base64
+import binascii
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+SortKey = Tuple[str, str]  # (last_activity, session_id)
+
+
+def encode_cursor(key: SortKey) -> str:
+    """Cursor opaco a partir de la clave del último elemento de la página."""
+    raw = f"{key[0]}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Inverso de `encode_cursor`; lanza `ValueError` si el cursor no es válido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_activity, session_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor de paginación inválido")
+    return last_activity, session_id
+
+
+class SessionIndex:
+    """Resumen de sesiones ordenado de la más reciente a la más antigua."""
+
+    def __init__(self):
+        # session_id -> [created_at, last_activity, message_count]
+        self._entries: Dict[str, List[Any]] = {}
+        # Claves (last_activity, session_id) en orden ascendente
+        self._order: List[SortKey] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._entries
+
+    def load(self, summaries: Iterable[Dict[str, Any]]) -> None:
+        """Reconstruye el índice a partir de `SessionBackend.list_sessions()`."""
+        self._entries = {
+            item["session_id"]: [item["created_at"], item["last_activity"], item["message_count"]]
+            for item in summaries
+        }
+        self._order = sorted(
+            (entry[1], session_id) for session_id, entry in self._entries.items()
+        )
+
+    def _remove_key(self, key: SortKey) -> None:
+        position = bisect_left(self._order, key)
+        if position < len(self._order) and self._order[position] == key:
+            del self._order[position]
+
+    def upsert(self, session_id: str, created_at: str, last_activity: str, message_count: int) -> None:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self._remove_key((entry[1], session_id))
+        self._entries[session_id] = [created_at, last_activity, message_count]
+        insort(self._order, (last_activity, session_id))
+
+    def touch(self, session_id: str, last_activity: str) -> None:
+        entry = self._entries.get(session_id)
+        if entry is None or entry[1] == last_activity:
+            return
+        self._remove_key((entry[1], session_id))
+        entry[1] = last_activity
+        insort(self._order, (last_activity, session_id))
+
+    def set_message_count(self, session_id: str, message_count: int) -> None:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry[2] = message_count
+
+    def discard(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._remove_key((entry[1], session_id))
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Retorna hasta `limit` sesiones más antiguas que `cursor` (o las más
+        recientes si no hay cursor) y el cursor de la página siguiente.
+        """
+        end = bisect_left(self._order, decode_cursor(cursor)) if cursor else len(self._order)
+        start = max(0, end - limit)
+        keys = self._order[start:end][::-1]
+
+        items = []
+        for last_activity, session_id in keys:
+            created_at, _, message_count = self._entries[session_id]
+            items.append({
+                "session_id": session_id,
+                "created_at": created_at,
+                "last_activity": last_activity,
+                "message_count": message_count,
+            })
+        next_cursor = encode_cursor(keys[-1]) if keys and start > 0 else None
+        return items, next_cursor
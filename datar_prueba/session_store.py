@@ -0,0 +1,544 @@
+"""
+Backends de persistencia de sesiones para DATAR
+
+`sessions_store` (en api.py) sigue siendo la caché caliente en memoria; estos
+backends solo guardan una copia durable del historial para sobrevivir reinicios.
+
+- `MemorySessionBackend`: no persiste nada (comportamiento original).
+- `SQLiteSessionBackend`: SQLite en modo WAL con escritura diferida (write-behind):
+  las operaciones se encolan y un hilo las agrupa en una sola transacción cada
+  pocos milisegundos, de modo que `/chat` nunca espera a un fsync. Las lecturas
+  no esperan a que la cola se vacíe: leen lo ya confirmado y le aplican las
+  escrituras aún pendientes que el backend guarda en memoria.
+
+Con varios workers (`SHARED_STATE=True`) el archivo SQLite es la fuente de
+verdad: el backend escribe sin ventana de agrupación (`write_through`), la API
+espera en un hilo a que el turno esté en disco antes de responder, y cada worker
+revalida su caché con `session_version` antes de usarla. Si dos workers agregan
+a la vez un mensaje con el mismo `seq`, el segundo se guarda al final y su
+sesión se marca para recargarse (`take_resequenced`).
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+SortKey = Tuple[str, str]  # (last_activity, session_id), como en session_index
+
+# Mensaje cuyo `seq` ya ocupó otro worker: se agrega después del último
+_APPEND_AFTER_LAST = (
+    "INSERT INTO messages (session_id, seq, role, content, timestamp, extra) "
+    "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ? FROM messages WHERE session_id = ?"
+)
+
+# Campos del mensaje que tienen columna propia; el resto va a `extra` como JSON
+_MESSAGE_COLUMNS = ("seq", "role", "content", "timestamp")
+
+# Reintentos de un lote cuando otro proceso tiene bloqueada la base (más allá de `busy_timeout`)
+_RETRY_BACKOFF = 0.05
+_RETRY_BACKOFF_MAX = 2.0
+_RETRIES_ON_CLOSE = 3
+
+
+def _is_transient(error: sqlite3.Error) -> bool:
+    """`database is locked` / `busy`: otro proceso escribe; el lote se puede reintentar."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class SessionBackend(ABC):
+    """Interfaz común de los backends de sesiones."""
+
+    def start(self) -> None:
+        """Prepara el backend (conexiones, hilos de escritura)."""
+
+    def close(self) -> None:
+        """Vacía las escrituras pendientes y libera recursos."""
+
+    def flush(self) -> None:
+        """Bloquea hasta que las escrituras pendientes estén en disco."""
+
+    @abstractmethod
+    def create_session(self, session_id: str, created_at: str) -> None:
+        """Registra una sesión nueva."""
+
+    @abstractmethod
+    def append_message(self, session_id: str, message: Dict[str, Any]) -> None:
+        """Agrega un mensaje (con su `seq`) al historial de la sesión."""
+
+    @abstractmethod
+    def touch_session(self, session_id: str, last_activity: str) -> None:
+        """Actualiza la última actividad de la sesión."""
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> bool:
+        """Elimina la sesión y sus mensajes. Retorna True si existía."""
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Carga una sesión completa con el mismo formato que `sessions_store`."""
+
+    @abstractmethod
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """Lista los metadatos (sin mensajes) de todas las sesiones persistidas."""
+
+    def session_version(self, session_id: str) -> Optional[Tuple[int, str]]:
+        """(último `seq`, `last_activity`) persistidos, o None si la sesión no existe."""
+        return None
+
+    def take_resequenced(self, session_id: str) -> bool:
+        """True (una sola vez) si algún mensaje de la sesión se guardó con otro `seq`."""
+        return False
+
+    def load_messages(self, session_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """Mensajes persistidos con `seq` mayor que `after_seq`, en orden."""
+        return []
+
+    def page_sessions(self, limit: int, after: Optional[SortKey] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Hasta `limit` sesiones más antiguas que `after` (de la más reciente a la
+        más antigua) y si quedan más. Por defecto no hay nada que paginar: sin
+        almacenamiento persistente, `/sessions` pagina desde `SessionIndex`.
+        """
+        return [], False
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas propias del backend para `/health`."""
+        return {}
+
+    @property
+    def is_persistent(self) -> bool:
+        return True
+
+
+class MemorySessionBackend(SessionBackend):
+    """Backend nulo: las sesiones solo viven en la caché en memoria."""
+
+    def create_session(self, session_id: str, created_at: str) -> None:
+        pass
+
+    def append_message(self, session_id: str, message: Dict[str, Any]) -> None:
+        pass
+
+    def touch_session(self, session_id: str, last_activity: str) -> None:
+        pass
+
+    def delete_session(self, session_id: str) -> bool:
+        return False
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        return []
+
+    @property
+    def is_persistent(self) -> bool:
+        return False
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Backend SQLite (WAL) con cola de escritura diferida por lotes."""
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id    TEXT PRIMARY KEY,
+            created_at    TEXT NOT NULL,
+            last_activity TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            seq        INTEGER NOT NULL,
+            role       TEXT NOT NULL,
+            content    TEXT NOT NULL,
+            timestamp  TEXT NOT NULL,
+            extra      TEXT,
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions (last_activity)",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval_ms: int = 5,
+        max_batch: int = 500,
+        write_through: bool = False,
+    ):
+        self.path = path
+        # Sin ventana de agrupación: cada operación se confirma en cuanto llega al
+        # hilo escritor (quien necesite verla en disco llama a `flush` fuera del loop)
+        self.write_through = write_through
+        self.flush_interval = 0 if write_through else max(flush_interval_ms, 0) / 1000
+        self.max_batch = max_batch
+
+        self._queue: "queue.Queue[Optional[Tuple[int, str, str, str, tuple]]]" = queue.Queue()
+        # Operaciones encoladas y aún no confirmadas, por sesión: (id, tipo, datos)
+        self._pending: Dict[str, List[Tuple[int, str, Any]]] = {}
+        self._pending_lock = threading.Lock()
+        self._next_op = 0
+        # Sesiones con mensajes re-numerados por un choque de `seq` con otro worker
+        self._resequenced: Set[str] = set()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+
+        # Métricas del write-behind
+        self.batches_written = 0
+        self.ops_written = 0
+        self.write_errors = 0
+        self.write_retries = 0
+        self.resequenced_messages = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def start(self) -> None:
+        if self._writer is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        with conn:
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+        self._read_conn = conn
+
+        self._writer = threading.Thread(
+            target=self._writer_loop,
+            name="sqlite-session-writer",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            # Al cerrar, un lote bloqueado se reintenta pocas veces antes de descartarse
+            self._closing = True
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._read_conn is not None:
+            self._read_conn.close()
+            self._read_conn = None
+
+    def flush(self) -> None:
+        """Bloquea hasta que todas las escrituras encoladas estén en disco (no llamar desde el event loop)."""
+        if self._writer is not None:
+            self._queue.join()
+
+    # ---------- Escritura diferida ----------
+
+    def _enqueue(self, session_id: str, kind: str, data: Any, sql: str, args: tuple) -> None:
+        with self._pending_lock:
+            self._next_op += 1
+            op_id = self._next_op
+            self._pending.setdefault(session_id, []).append((op_id, kind, data))
+        self._queue.put((op_id, session_id, kind, sql, args))
+
+    def _forget(self, batch: List[Tuple[int, str, str, str, tuple]], resequenced: List[str]) -> None:
+        """
+        Descarta del overlay las operaciones del lote (la cola es FIFO: están al
+        frente) y luego marca las sesiones re-numeradas, para que su recarga ya no
+        vea el `seq` antiguo en el overlay.
+        """
+        with self._pending_lock:
+            for op_id, session_id, _, _, _ in batch:
+                ops = self._pending.get(session_id)
+                if ops and ops[0][0] == op_id:
+                    ops.pop(0)
+                if not ops:
+                    self._pending.pop(session_id, None)
+            self._resequenced.update(resequenced)
+            self.resequenced_messages += len(resequenced)
+
+    def _pending_ops(self, session_id: str) -> List[Tuple[int, str, Any]]:
+        with self._pending_lock:
+            return list(self._pending.get(session_id, ()))
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        running = True
+        while running:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                break
+
+            # Esperar unos milisegundos para agrupar más operaciones en la transacción
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+
+            batch = [first]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            # Las operaciones siguen en el overlay (visibles para las lecturas) hasta
+            # que el lote se confirma o falla sin remedio
+            resequenced: List[str] = []
+            attempt = 0
+            try:
+                while True:
+                    try:
+                        resequenced = self._write_batch(conn, batch)
+                        self.batches_written += 1
+                        self.ops_written += len(batch)
+                        break
+                    except sqlite3.Error as e:
+                        if _is_transient(e) and not (self._closing and attempt >= _RETRIES_ON_CLOSE):
+                            attempt += 1
+                            self.write_retries += 1
+                            if attempt == 1:
+                                print(f"⚠️  SQLite ocupado, reintentando lote de sesiones: {e}")
+                            time.sleep(min(_RETRY_BACKOFF * 2 ** (attempt - 1), _RETRY_BACKOFF_MAX))
+                            continue
+                        self.write_errors += 1
+                        print(f"⚠️  Error escribiendo sesiones en SQLite: {e}")
+                        break
+            finally:
+                self._forget(batch, resequenced)
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[int, str, str, str, tuple]]) -> List[str]:
+        """Escribe el lote en una transacción; retorna las sesiones con mensajes re-numerados."""
+        resequenced: List[str] = []
+        with conn:
+            for _, session_id, kind, sql, args in batch:
+                try:
+                    conn.execute(sql, args)
+                except sqlite3.IntegrityError:
+                    if kind != "message":
+                        raise
+                    # Otro worker ya usó este `seq` en la sesión
+                    conn.execute(_APPEND_AFTER_LAST, (session_id, *args[2:], session_id))
+                    resequenced.append(session_id)
+        return resequenced
+
+    def create_session(self, session_id: str, created_at: str) -> None:
+        self._enqueue(
+            session_id, "create", created_at,
+            "INSERT OR IGNORE INTO sessions (session_id, created_at, last_activity) VALUES (?, ?, ?)",
+            (session_id, created_at, created_at),
+        )
+
+    def append_message(self, session_id: str, message: Dict[str, Any]) -> None:
+        extra = {k: v for k, v in message.items() if k not in _MESSAGE_COLUMNS}
+        self._enqueue(
+            session_id, "message", dict(message),
+            "INSERT INTO messages (session_id, seq, role, content, timestamp, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                session_id,
+                message["seq"],
+                message.get("role", ""),
+                message.get("content", ""),
+                message.get("timestamp", ""),
+                json.dumps(extra, ensure_ascii=False) if extra else None,
+            ),
+        )
+
+    def touch_session(self, session_id: str, last_activity: str) -> None:
+        self._enqueue(
+            session_id, "touch", last_activity,
+            "UPDATE sessions SET last_activity = ? WHERE session_id = ?",
+            (last_activity, session_id),
+        )
+
+    def delete_session(self, session_id: str) -> bool:
+        # Espera a la cola: llamar fuera del event loop (`asyncio.to_thread`)
+        self.flush()
+        with self._read_lock, self._read_conn:
+            self._read_conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            cursor = self._read_conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    # ---------- Lectura ----------
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._read_session(session_id, 0)
+
+    def _read_session(self, session_id: str, after_seq: int) -> Optional[Dict[str, Any]]:
+        """
+        Estado confirmado más las operaciones pendientes de la sesión.
+
+        Las pendientes se toman antes de consultar SQLite: si el hilo escritor
+        confirma alguna entre medias, aplicarla otra vez no cambia el resultado.
+        """
+        pending = self._pending_ops(session_id)
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT created_at, last_activity FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            messages = self._select_messages(session_id, after_seq) if row is not None else []
+
+        session = None if row is None else {
+            "created_at": row[0],
+            "last_activity": row[1],
+            "messages": messages,
+        }
+        by_seq: Dict[int, Dict[str, Any]] = {}
+        for _, kind, data in pending:
+            if kind == "create":
+                if session is None:
+                    session = {"created_at": data, "last_activity": data, "messages": []}
+            elif session is None:
+                continue
+            elif kind == "touch":
+                session["last_activity"] = max(session["last_activity"], data)
+            elif kind == "message" and data["seq"] > after_seq:
+                by_seq[data["seq"]] = dict(data)
+        if session is not None and by_seq:
+            merged = {message["seq"]: message for message in session["messages"]}
+            merged.update(by_seq)
+            session["messages"] = [merged[seq] for seq in sorted(merged)]
+        return session
+
+    def _select_messages(self, session_id: str, after_seq: int) -> List[Dict[str, Any]]:
+        rows = self._read_conn.execute(
+            "SELECT seq, role, content, timestamp, extra FROM messages "
+            "WHERE session_id = ? AND seq > ? ORDER BY seq",
+            (session_id, after_seq),
+        ).fetchall()
+
+        messages = []
+        for seq, role, content, timestamp, extra in rows:
+            message = {"role": role, "content": content, "timestamp": timestamp, "seq": seq}
+            if extra:
+                message.update(json.loads(extra))
+            messages.append(message)
+        return messages
+
+    def load_messages(self, session_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        session = self._read_session(session_id, after_seq)
+        return session["messages"] if session is not None else []
+
+    def take_resequenced(self, session_id: str) -> bool:
+        with self._pending_lock:
+            if session_id not in self._resequenced:
+                return False
+            self._resequenced.discard(session_id)
+            return True
+
+    def session_version(self, session_id: str) -> Optional[Tuple[int, str]]:
+        pending = self._pending_ops(session_id)
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT s.last_activity, "
+                "(SELECT COALESCE(MAX(seq), 0) FROM messages m WHERE m.session_id = s.session_id) "
+                "FROM sessions s WHERE s.session_id = ?",
+                (session_id,),
+            ).fetchone()
+        version = None if row is None else (row[1], row[0])
+        for _, kind, data in pending:
+            if kind == "create":
+                version = version or (0, data)
+            elif version is None:
+                continue
+            elif kind == "touch":
+                version = (version[0], max(version[1], data))
+            elif kind == "message":
+                version = (max(version[0], data["seq"]), version[1])
+        return version
+
+    def page_sessions(self, limit: int, after: Optional[SortKey] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        # Espera a la cola: llamar fuera del event loop (`asyncio.to_thread`)
+        self.flush()
+        last_activity, session_id = after or (None, None)
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT s.session_id, s.created_at, s.last_activity, "
+                "(SELECT COUNT(*) FROM messages m WHERE m.session_id = s.session_id) "
+                "FROM sessions s "
+                "WHERE ? IS NULL OR s.last_activity < ? OR (s.last_activity = ? AND s.session_id < ?) "
+                "ORDER BY s.last_activity DESC, s.session_id DESC LIMIT ?",
+                (last_activity, last_activity, last_activity, session_id, limit + 1),
+            ).fetchall()
+        items = [
+            {
+                "session_id": row_id,
+                "created_at": created_at,
+                "last_activity": row_activity,
+                "message_count": message_count,
+            }
+            for row_id, created_at, row_activity, message_count in rows[:limit]
+        ]
+        return items, len(rows) > limit
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT s.session_id, s.created_at, s.last_activity, COUNT(m.seq) "
+                "FROM sessions s LEFT JOIN messages m ON m.session_id = s.session_id "
+                "GROUP BY s.session_id"
+            ).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "created_at": created_at,
+                "last_activity": last_activity,
+                "message_count": message_count,
+            }
+            for session_id, created_at, last_activity, message_count in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "write_through": self.write_through,
+            "pending_writes": self._queue.qsize(),
+            "batches_written": self.batches_written,
+            "ops_written": self.ops_written,
+            "write_errors": self.write_errors,
+            "write_retries": self.write_retries,
+            "resequenced_messages": self.resequenced_messages,
+        }
+
+
+def create_session_backend(
+    url: Optional[str],
+    flush_interval_ms: int = 5,
+    max_batch: int = 500,
+    write_through: bool = False,
+) -> SessionBackend:
+    """
+    Construye el backend a partir de una URL:
+    - `sqlite:///ruta/archivo.db` → `SQLiteSessionBackend`
+    - vacío o `memory` → `MemorySessionBackend`
+    """
+    if not url or url == "memory":
+        return MemorySessionBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionBackend(
+            url[len("sqlite:///"):],
+            flush_interval_ms=flush_interval_ms,
+            max_batch=max_batch,
+            write_through=write_through,
+        )
+    raise ValueError(f"SESSION_DB_URL no soportada: {url}")
@@ -0,0 +1,47 @@
+"""
+Coalescencia single-flight de llamadas idénticas en curso
+
+Si llegan varias peticiones con la misma huella de conversación mientras la
+primera aún espera al proveedor, todas esperan el mismo resultado en lugar de
+disparar llamadas duplicadas.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Task[Any]"] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta `fn()` una sola vez por clave en curso y comparte su resultado.
+
+        La llamada corre en su propia tarea: si el cliente que la inició se
+        desconecta, las demás peticiones que la esperan no se cancelan.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _task: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Llamadas en curso, ejecutadas y ahorradas por coalescencia."""
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,211 @@
+"""
+Registro perezoso de sub-agentes para DATAR
+
+Cada sub-agente se declara con su ruta de importación (`.paquete.modulo:atributo`)
+y solo se importa la primera vez que alguien lo necesita: una petición
+directa, el árbol completo para `adk web` o el calentamiento en segundo plano
+al arrancar. Así el API acepta conexiones sin esperar a matplotlib, pydub o
+el toolset MCP.
+
+Al materializar un sub-agente se cuelga de su agente padre igual que lo haría
+el constructor de ADK (`parent_agent` + `sub_agents`), respetando el orden
+declarado.
+
+Informe de tiempos de importación en un proceso limpio:
+
+    python -m datar_prueba.sub_agent_registry
+"""
+
+import importlib
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class SubAgentSpec:
+    """Declaración de un sub-agente: nombre, ruta `modulo:atributo` y dependencias pesadas."""
+
+    name: str
+    target: str
+    heavy_modules: Tuple[str, ...] = ()
+
+    @property
+    def module(self) -> str:
+        return self.target.partition(":")[0]
+
+    @property
+    def attribute(self) -> str:
+        return self.target.partition(":")[2] or "root_agent"
+
+
+def _timed_import(module: str, package: Optional[str]) -> Tuple[Any, float]:
+    """Importa `module` y retorna (módulo, milisegundos que tomó)."""
+    started = time.perf_counter()
+    imported = importlib.import_module(module, package=package)
+    return imported, round((time.perf_counter() - started) * 1000, 1)
+
+
+class SubAgentRegistry:
+    """Sub-agentes declarados de un agente padre, materializados bajo demanda."""
+
+    def __init__(self, parent: Any, specs: Sequence[SubAgentSpec], package: Optional[str] = None):
+        self.parent = parent
+        self.package = package
+        self.specs: Dict[str, SubAgentSpec] = {spec.name: spec for spec in specs}
+        self._order = {name: index for index, name in enumerate(self.specs)}
+        self._loaded: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._warmup_thread: Optional[threading.Thread] = None
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        # Se invoca (nombre, agente) tras cada materialización, desde el hilo que la hizo
+        self.on_load: Optional[Callable[[str, Any], None]] = None
+
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def pending(self) -> List[str]:
+        """Sub-agentes declarados que aún no se han importado."""
+        return [name for name in self.specs if name not in self._loaded]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def get(self, name: str) -> Any:
+        """Retorna el sub-agente `name`, importándolo si hace falta (`KeyError` si no está declarado)."""
+        agent = self._loaded.get(name)
+        if agent is not None:
+            return agent
+        spec = self.specs[name]
+        with self._lock:
+            agent = self._loaded.get(name)
+            if agent is None:
+                agent = self._materialize(spec)
+        if self.on_load is not None:
+            self.on_load(name, agent)
+        return agent
+
+    def _materialize(self, spec: SubAgentSpec) -> Any:
+        # Las dependencias pesadas se importan primero para atribuirles su propio costo;
+        # None indica que otro módulo ya las había cargado
+        deps_ms: Dict[str, Optional[float]] = {}
+        try:
+            for dependency in spec.heavy_modules:
+                deps_ms[dependency] = (
+                    None if dependency in sys.modules else _timed_import(dependency, None)[1]
+                )
+            module, import_ms = _timed_import(spec.module, self.package)
+            agent = getattr(module, spec.attribute)
+        except Exception as e:
+            self.timings[spec.name] = {"loaded": False, "deps_ms": deps_ms, "error": str(e)}
+            raise
+
+        self._attach(agent)
+        self._loaded[spec.name] = agent
+        self.timings[spec.name] = {
+            "loaded": True,
+            "import_ms": import_ms,
+            "deps_ms": deps_ms,
+            "total_ms": round(import_ms + sum(ms for ms in deps_ms.values() if ms), 1),
+        }
+        return agent
+
+    def _attach(self, agent: Any) -> None:
+        """Cuelga el sub-agente del padre como lo haría `BaseAgent.model_post_init`."""
+        if agent.parent_agent is not None and agent.parent_agent is not self.parent:
+            raise ValueError(
+                f"El agente `{agent.name}` ya tiene padre: `{agent.parent_agent.name}`"
+            )
+        agent.parent_agent = self.parent
+        if agent not in self.parent.sub_agents:
+            # Lista nueva en vez de ordenar en sitio: otros hilos pueden estar recorriéndola
+            self.parent.sub_agents = sorted(
+                [*self.parent.sub_agents, agent],
+                key=lambda sub_agent: self._order.get(sub_agent.name, len(self._order)),
+            )
+
+    def load_all(self) -> List[Any]:
+        """Materializa todos los sub-agentes declarados, en orden."""
+        return [self.get(name) for name in self.specs]
+
+    def find(self, name: str) -> Optional[Any]:
+        """
+        Busca `name` en todo el árbol: primero entre los declarados y, si es un
+        sub-agente anidado que aún no aparece, materializa el resto y reintenta.
+        """
+        if name in self.specs:
+            return self.get(name)
+        agent = self.parent.find_sub_agent(name)
+        if agent is None and self.pending():
+            self.load_all()
+            agent = self.parent.find_sub_agent(name)
+        return agent
+
+    def warm_up(self, on_done: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """Importa los pendientes en un hilo de fondo; un fallo no detiene a los demás."""
+        if self._warmup_thread is not None and self._warmup_thread.is_alive():
+            return self._warmup_thread
+
+        def _run() -> None:
+            for name in self.pending():
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"❌ No se pudo cargar el sub-agente {name}: {e}")
+            if on_done is not None:
+                on_done()
+
+        self._warmup_thread = threading.Thread(target=_run, name="sub-agent-warmup", daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def import_report(self) -> Dict[str, Any]:
+        """Milisegundos de importación por sub-agente y por dependencia pesada."""
+        return {
+            "loaded": len(self._loaded),
+            "declared": len(self.specs),
+            "warming_up": self._warmup_thread is not None and self._warmup_thread.is_alive(),
+            "sub_agents": {
+                name: self.timings.get(name, {"loaded": False})
+                for name in self.specs
+            },
+        }
+
+    def format_report(self) -> str:
+        """Informe legible para la consola."""
+        lines = ["⏱️  Importación de sub-agentes:"]
+        total = 0.0
+        for name, timing in self.import_report()["sub_agents"].items():
+            if "error" in timing:
+                lines.append(f"   ❌ {name:<26} {timing['error']}")
+                continue
+            if not timing["loaded"]:
+                lines.append(f"   ⏳ {name:<26} sin cargar")
+                continue
+            total += timing["total_ms"]
+            lines.append(
+                f"   - {name:<26} {timing['total_ms']:>8.1f} ms (módulo {timing['import_ms']:.1f} ms)"
+            )
+            for module, ms in timing["deps_ms"].items():
+                detail = "ya cargado" if ms is None else f"{ms:.1f} ms"
+                lines.append(f"       · {module:<40} {detail}")
+        lines.append(f"   Total: {total:.1f} ms")
+        return "\n".join(lines)
+
+
+def _main() -> int:
+    from .agent import SUB_AGENTS
+
+    for name in SUB_AGENTS.names():
+        try:
+            SUB_AGENTS.get(name)
+        except Exception:
+            pass
+    print(SUB_AGENTS.format_report())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
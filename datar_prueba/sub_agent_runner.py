@@ -0,0 +1,223 @@
+"""
+Ejecución directa de sub-agentes para DATAR
+
+Cuando el frontend ya sabe con qué personaje quiere hablar el visitante, no
+hace falta que `root_agent` gaste una llamada al modelo para decidir la
+delegación: el sub-agente se busca en el registro perezoso (importándolo si es
+su primer uso) y se ejecuta con su propio `Runner` de ADK (herramientas, estado
+de sesión y artifacts propios).
+
+Cada sub-agente tiene su propia sesión ADK por sesión de la API (clave
+`(agente, session_id)`); `forget` las descarta cuando la sesión de la API se
+elimina o sale de la caché, para que no crezcan sin límite.
+
+Con varios workers (`session_db_url`, ver SHARED_STATE) las sesiones ADK viven
+en un `DatabaseSessionService` compartido: cualquier worker continúa la
+conversación de un personaje. En ese caso salir de la caché de un worker no las
+borra; solo se borran cuando se elimina la sesión de la API.
+
+Con `PROMPT_CACHE_MODE` distinto de "off" los runners activan la caché de
+contexto de ADK: en los modelos Gemini la instrucción larga y el historial se
+guardan en una caché del proveedor y se reutilizan durante varios turnos.
+`App` y `ContextCacheConfig` sólo existen en versiones recientes de google-adk;
+con una versión anterior los runners se crean sin caché de contexto.
+"""
+
+import asyncio
+from typing import Any, Dict, Optional, Set
+
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from . import config
+
+try:
+    from google.adk.sessions import DatabaseSessionService
+except ImportError:
+    # google-adk sin SQLAlchemy: solo hay sesiones en memoria
+    DatabaseSessionService = None
+
+try:
+    from google.adk.agents.context_cache_config import ContextCacheConfig
+    from google.adk.apps import App
+except ImportError:
+    # google-adk anterior a la caché de contexto: `Runner` sin `App`
+    ContextCacheConfig = None
+    App = None
+
+
+APP_NAME = "datar"
+USER_ID = "datar_api"
+
+
+class SubAgentNotFound(LookupError):
+    """No existe un sub-agente con ese nombre en el árbol de `root_agent`."""
+
+
+class SubAgentDispatcher:
+    """Resuelve sub-agentes por nombre y los ejecuta con un `Runner` por agente."""
+
+    def __init__(
+        self,
+        registry: Any,
+        timeout: float,
+        cache_stats: Optional[Any] = None,
+        session_db_url: Optional[str] = None,
+    ):
+        self.registry = registry
+        self.timeout = timeout
+        # `PromptCacheStats` donde se acumulan los tokens cacheados de cada agente
+        self.cache_stats = cache_stats
+        self.context_cache_config = (
+            ContextCacheConfig(
+                cache_intervals=config.PROMPT_CACHE_INTERVALS,
+                ttl_seconds=config.PROMPT_CACHE_TTL,
+                min_tokens=config.PROMPT_CACHE_MIN_TOKENS,
+            )
+            if config.PROMPT_CACHE_MODE != "off" and ContextCacheConfig is not None else None
+        )
+        # Un solo servicio para todos los runners; cada agente usa sus propias sesiones
+        self.shared_sessions = bool(session_db_url) and DatabaseSessionService is not None
+        if self.shared_sessions:
+            self.session_service = DatabaseSessionService(db_url=session_db_url)
+        else:
+            if session_db_url:
+                print("⚠️  DatabaseSessionService no disponible: sesiones de sub-agentes solo en memoria")
+            self.session_service = InMemorySessionService()
+        self.artifact_service = InMemoryArtifactService()
+        self._runners: Dict[str, Runner] = {}
+        # session_id de la API → agentes con sesión ADK abierta para ella
+        self._sessions: Dict[str, Set[str]] = {}
+        self.turns: Dict[str, int] = {}
+
+    async def resolve(self, name: str) -> Any:
+        """Busca `name` en cualquier nivel del árbol; la importación corre fuera del event loop."""
+        agent = await asyncio.to_thread(self.registry.find, name)
+        if agent is None:
+            raise SubAgentNotFound(f"No existe el sub-agente '{name}'")
+        return agent
+
+    async def _runner(self, name: str) -> Runner:
+        runner = self._runners.get(name)
+        if runner is None:
+            agent = await self.resolve(name)
+            if App is not None:
+                runner = Runner(
+                    app=App(
+                        name=APP_NAME,
+                        root_agent=agent,
+                        context_cache_config=self.context_cache_config,
+                    ),
+                    session_service=self.session_service,
+                    artifact_service=self.artifact_service,
+                )
+            else:
+                runner = Runner(
+                    app_name=APP_NAME,
+                    agent=agent,
+                    session_service=self.session_service,
+                    artifact_service=self.artifact_service,
+                )
+            runner = self._runners.setdefault(name, runner)
+        return runner
+
+    async def _ensure_session(self, name: str, session_id: str) -> str:
+        """Crea, si falta, la sesión ADK de `name` para `session_id` y retorna su id."""
+        adk_session_id = _adk_session_id(name, session_id)
+        session = await self.session_service.get_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=adk_session_id
+        )
+        if session is None:
+            try:
+                await self.session_service.create_session(
+                    app_name=APP_NAME, user_id=USER_ID, session_id=adk_session_id
+                )
+            except Exception:
+                # Con sesiones compartidas, otro worker pudo crearla a la vez
+                session = await self.session_service.get_session(
+                    app_name=APP_NAME, user_id=USER_ID, session_id=adk_session_id
+                )
+                if session is None:
+                    raise
+        self._sessions.setdefault(session_id, set()).add(name)
+        return adk_session_id
+
+    def forget(self, session_id: str, deleted: bool = False) -> None:
+        """
+        Descarta en segundo plano las sesiones y artifacts ADK de `session_id` en
+        todos los agentes. Con sesiones compartidas, si la sesión solo salió de la
+        caché (`deleted=False`) se conservan: otros workers pueden seguir usándolas.
+        """
+        names = self._sessions.pop(session_id, None) or set()
+        keep_sessions = self.shared_sessions and not deleted
+        if self.shared_sessions and deleted:
+            # Pudo abrirlas cualquier worker: se borran las de todos los agentes
+            names = names | set(self.registry.names())
+        if not names:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        for name in names:
+            loop.create_task(self._discard(_adk_session_id(name, session_id), keep_sessions))
+
+    async def _discard(self, adk_session_id: str, keep_session: bool = False) -> None:
+        scope = {"app_name": APP_NAME, "user_id": USER_ID, "session_id": adk_session_id}
+        try:
+            # Los artifacts siguen en memoria de cada worker
+            for filename in await self.artifact_service.list_artifact_keys(**scope):
+                await self.artifact_service.delete_artifact(filename=filename, **scope)
+            if not keep_session:
+                await self.session_service.delete_session(**scope)
+        except Exception as e:
+            print(f"⚠️  No se pudo descartar la sesión ADK {adk_session_id}: {e}")
+
+    async def run(self, name: str, session_id: str, message: str) -> str:
+        """Ejecuta un turno del sub-agente y retorna el texto de su respuesta final."""
+        runner = await self._runner(name)
+        adk_session_id = await self._ensure_session(name, session_id)
+        new_message = types.Content(role="user", parts=[types.Part(text=message)])
+
+        async def _collect() -> str:
+            final_text: Optional[str] = None
+            async for event in runner.run_async(
+                user_id=USER_ID, session_id=adk_session_id, new_message=new_message
+            ):
+                self._record_usage(event)
+                if event.is_final_response() and event.content and event.content.parts:
+                    text = "".join(part.text for part in event.content.parts if part.text)
+                    if text.strip():
+                        final_text = text
+            return (final_text or "").strip()
+
+        response_text = await asyncio.wait_for(_collect(), timeout=self.timeout)
+        self.turns[name] = self.turns.get(name, 0) + 1
+        return response_text
+
+    def _record_usage(self, event: Any) -> None:
+        """Tokens de entrada (y los servidos desde la caché) de cada respuesta del modelo, por agente."""
+        usage = getattr(event, "usage_metadata", None)
+        if self.cache_stats is None or usage is None or event.partial:
+            return
+        self.cache_stats.record(
+            event.author,
+            int(usage.prompt_token_count or 0),
+            int(usage.cached_content_token_count or 0),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Runners creados, sesiones ADK abiertas y turnos atendidos por sub-agente."""
+        return {
+            "runners": sorted(self._runners),
+            "adk_sessions": sum(len(names) for names in self._sessions.values()),
+            "shared_sessions": self.shared_sessions,
+            "turns": dict(self.turns),
+        }
+
+
+def _adk_session_id(name: str, session_id: str) -> str:
+    """Sesión ADK de un agente para una sesión de la API: cada personaje tiene su propio estado."""
+    return f"{session_id}:{name}"
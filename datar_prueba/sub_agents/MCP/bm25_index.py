@@ -0,0 +1,283 @@
+# MCP/bm25_index.py
+
+"""
+Índice de pasajes BM25 sobre la biblioteca de PDFs del servidor MCP.
+
+Cada PDF de `sub_agents/pdfs/` se parte en pasajes de unos cientos de
+caracteres (sin cruzar páginas, para poder citar la página), se construye un
+índice invertido y se guarda comprimido en disco. `buscar(tema)` devuelve los
+k pasajes con mayor puntaje BM25 para una consulta libre, de modo que el
+modelo recibe solo el contexto relevante en lugar de las primeras páginas.
+
+El índice guarda la firma (tamaño, mtime) de cada PDF y se reconstruye solo si
+la biblioteca cambió; el texto sale de la caché de `pdf_cache`. `indice()` no
+espera esa revisión: la hace un hilo aparte como mucho cada BM25_CHECK_INTERVAL
+segundos y, mientras tanto, se sigue usando el índice cargado.
+
+Cada resultado trae, además del puntaje, su `relevancia`: el puntaje dividido
+por el máximo que podría alcanzar la consulta (0 a 1). Sirve para descartar
+coincidencias de una sola palabra común sin depender de la escala de BM25.
+
+Variables de entorno: BM25_INDEX_PATH, PDFS_DIR, BM25_CHECK_INTERVAL.
+
+    python MCP/bm25_index.py "simbiosis y concepto de individuo"
+"""
+
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from pdf_cache import cache_pdf
+
+MCP_DIR = os.path.dirname(os.path.abspath(__file__))
+PDFS_DIR = os.getenv("PDFS_DIR", os.path.join(os.path.dirname(MCP_DIR), "pdfs"))
+INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(MCP_DIR, "bm25_index.json.gz"))
+INDEX_VERSION = 1
+CHECK_INTERVAL = float(os.getenv("BM25_CHECK_INTERVAL", "60"))  # Segundos entre revisiones de la biblioteca
+
+PASAJE_CHARS = 900  # Tamaño objetivo de cada pasaje
+K1 = 1.5
+B = 0.75
+
+# Palabras vacías en español e inglés (la biblioteca mezcla ambos idiomas)
+STOPWORDS = frozenset("""
+    que los las del una por con para como sus mas pero este esta estos estas
+    son ser sobre entre cada desde hasta cuando donde puede pueden tambien muy
+    sin todo toda todos todas otro otra otros otras hace tiene nos les fue han
+    hay era sino porque asi ese esa esos esas ella ellos
+    the and for are but not you all any can had her was one our out has him
+    his how its may new now see two who did get let say she too use that with
+    have this will your from they been were which their there what about would
+    these other into more some than then them when also only such
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-zñ]{3,}")
+
+
+def tokenize(texto: str) -> List[str]:
+    """Minúsculas, sin tildes (conserva la ñ), palabras de 3+ letras y sin palabras vacías."""
+    sin_tildes = "".join(
+        ch if ch in "ñÑ" else "".join(
+            parte for parte in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(parte)
+        )
+        for ch in texto.lower()
+    )
+    return [token for token in _TOKEN_RE.findall(sin_tildes) if token not in STOPWORDS]
+
+
+def pdfs_en_disco(directorio: str = PDFS_DIR) -> List[str]:
+    """Rutas de los PDFs de la biblioteca, en orden alfabético."""
+    return sorted(
+        os.path.join(directorio, nombre)
+        for nombre in os.listdir(directorio)
+        if nombre.lower().endswith(".pdf")
+    )
+
+
+def firma(ruta: str) -> List[int]:
+    estado = os.stat(ruta)
+    return [estado.st_size, estado.st_mtime_ns]
+
+
+def partir_pagina(texto: str, tamano: int = PASAJE_CHARS) -> List[str]:
+    """Agrupa las líneas de una página en pasajes de ~`tamano` caracteres."""
+    pasajes: List[str] = []
+    actual: List[str] = []
+    largo = 0
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        if not linea:
+            continue
+        actual.append(linea)
+        largo += len(linea) + 1
+        if largo >= tamano:
+            pasajes.append(" ".join(actual))
+            actual, largo = [], 0
+    if actual:
+        pasajes.append(" ".join(actual))
+    return pasajes
+
+
+def pasajes_de_pdf(ruta: str, paginas: Optional[List[str]] = None) -> List[Dict[str, object]]:
+    """Pasajes `{"pdf", "pagina", "texto"}` de un PDF (páginas numeradas desde 1)."""
+    nombre = os.path.basename(ruta)
+    if paginas is None:
+        paginas = cache_pdf().paginas(ruta)
+    return [
+        {"pdf": nombre, "pagina": numero, "texto": pasaje}
+        for numero, texto in enumerate(paginas, start=1)
+        for pasaje in partir_pagina(texto)
+    ]
+
+
+class IndiceBM25:
+    """Índice invertido de pasajes con puntaje Okapi BM25."""
+
+    def __init__(self, pasajes: List[Dict[str, object]], firmas: Optional[Dict[str, List[int]]] = None):
+        self.pasajes = pasajes
+        self.firmas = firmas or {}
+        self.longitudes: List[int] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        for pid, pasaje in enumerate(pasajes):
+            frecuencias = Counter(tokenize(str(pasaje["texto"])))
+            self.longitudes.append(sum(frecuencias.values()))
+            for termino, tf in frecuencias.items():
+                self.postings.setdefault(termino, []).append([pid, tf])
+        self._preparar()
+
+    def _preparar(self) -> None:
+        total = len(self.longitudes)
+        self.promedio = (sum(self.longitudes) / total) if total else 0.0
+        self.idf = {
+            termino: math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+            for termino, lista in self.postings.items()
+        }
+
+    def buscar(
+        self,
+        consulta: str,
+        k: int = 5,
+        pdfs: Sequence[str] = (),
+        relevancia_minima: float = 0.0,
+    ) -> List[Dict[str, object]]:
+        """
+        Los `k` pasajes con mayor puntaje para `consulta` (opcionalmente solo de
+        `pdfs` y con al menos `relevancia_minima`).
+        """
+        terminos = set(tokenize(consulta))
+        # Puntaje máximo posible: cada término con tf → ∞; los que no aparecen en la
+        # biblioteca cuentan con el idf más alto, así que también restan relevancia
+        idf_ausente = math.log(1 + (len(self.longitudes) + 0.5) / 0.5)
+        ideal = sum(self.idf.get(termino, idf_ausente) for termino in terminos) * (K1 + 1)
+
+        puntajes: Dict[int, float] = {}
+        for termino in terminos:
+            idf = self.idf.get(termino)
+            if idf is None:
+                continue
+            for pid, tf in self.postings[termino]:
+                if pdfs and self.pasajes[pid]["pdf"] not in pdfs:
+                    continue
+                norma = K1 * (1 - B + B * self.longitudes[pid] / (self.promedio or 1))
+                puntajes[pid] = puntajes.get(pid, 0.0) + idf * tf * (K1 + 1) / (tf + norma)
+
+        mejores = sorted(puntajes.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {**self.pasajes[pid], "puntaje": round(puntaje, 3), "relevancia": round(puntaje / ideal, 3)}
+            for pid, puntaje in mejores
+            if puntaje / ideal >= relevancia_minima
+        ]
+
+    def guardar(self, ruta: str = INDEX_PATH) -> None:
+        datos = {
+            "version": INDEX_VERSION,
+            "firmas": self.firmas,
+            "pasajes": self.pasajes,
+            "longitudes": self.longitudes,
+            "postings": self.postings,
+        }
+        temporal = ruta + ".tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+            json.dump(datos, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str = INDEX_PATH) -> Optional["IndiceBM25"]:
+        """Índice guardado en `ruta`, o None si no existe o es de otra versión."""
+        try:
+            with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+        if datos.get("version") != INDEX_VERSION:
+            return None
+        indice = cls.__new__(cls)
+        indice.pasajes = datos["pasajes"]
+        indice.firmas = datos["firmas"]
+        indice.longitudes = datos["longitudes"]
+        indice.postings = datos["postings"]
+        indice._preparar()
+        return indice
+
+    @classmethod
+    def construir(cls, directorio: str = PDFS_DIR) -> "IndiceBM25":
+        """Extrae, parte e indexa todos los PDFs de `directorio`."""
+        pasajes: List[Dict[str, object]] = []
+        firmas: Dict[str, List[int]] = {}
+        for ruta in pdfs_en_disco(directorio):
+            pasajes.extend(pasajes_de_pdf(ruta))
+            firmas[os.path.basename(ruta)] = firma(ruta)
+        return cls(pasajes, firmas)
+
+
+_indice: Optional[IndiceBM25] = None
+_indice_lock = threading.Lock()
+_ultima_revision = 0.0
+_revisando = False
+
+
+def precargar() -> bool:
+    """Carga el índice guardado (sin abrir PDFs) para que la primera búsqueda no espere."""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceBM25.cargar()
+        return _indice is not None
+
+
+def indice() -> IndiceBM25:
+    """
+    Índice vigente, sin esperar a revisar la biblioteca.
+
+    Si ya toca, lanza la revisión en un hilo aparte; sin ningún índice cargado
+    retorna uno vacío hasta que ese hilo termine de construirlo.
+    """
+    global _indice, _revisando
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceBM25.cargar()
+        if not _revisando and time.monotonic() - _ultima_revision >= CHECK_INTERVAL:
+            _revisando = True
+            threading.Thread(target=_revisar, name="bm25-revision", daemon=True).start()
+        return _indice if _indice is not None else IndiceBM25([])
+
+
+def _revisar() -> None:
+    """Reconstruye y guarda el índice si la biblioteca cambió (corre en su propio hilo)."""
+    global _ultima_revision, _revisando
+    try:
+        indice_actualizado()
+    except Exception as error:
+        # stderr: el servidor MCP usa stdout como canal del protocolo
+        print(f"⚠️ No se pudo revisar el índice BM25: {error}", file=sys.stderr)
+    finally:
+        with _indice_lock:
+            _ultima_revision = time.monotonic()
+            _revisando = False
+
+
+def indice_actualizado() -> IndiceBM25:
+    """Índice vigente tras revisar la biblioteca ahora mismo; si cambió, se reconstruye y guarda."""
+    global _indice
+    actuales = {os.path.basename(ruta): firma(ruta) for ruta in pdfs_en_disco()}
+    with _indice_lock:
+        actual = _indice if _indice is not None else IndiceBM25.cargar()
+    if actual is None or actual.firmas != actuales:
+        actual = IndiceBM25.construir()
+        actual.guardar()
+    with _indice_lock:
+        _indice = actual
+    return actual
+
+
+if __name__ == "__main__":
+    for resultado in indice_actualizado().buscar(" ".join(sys.argv[1:]) or "simbiosis"):
+        print(f"{resultado['puntaje']:>7.3f} ({resultado['relevancia']:.2f})  {resultado['pdf']} p.{resultado['pagina']}: {str(resultado['texto'])[:120]}")
@@ -0,0 +1,182 @@
+# MCP/corpus.py
+
+"""
+Manifiesto de la biblioteca de PDFs e ingesta en paralelo.
+
+El manifiesto (`corpus_manifest.json`) se genera recorriendo `sub_agents/pdfs/`:
+por cada PDF guarda su hash SHA-256, tamaño, páginas, pasajes y los temas con
+los que `explorar_pdf` lo reconoce. El servidor MCP lo lee al arrancar en vez
+de mantener un diccionario a mano o abrir los PDFs.
+
+La ingesta extrae, parte e indexa (BM25) solo los PDFs nuevos o cuyo hash
+cambió, repartidos en un pool de procesos con todos los núcleos:
+
+    python MCP/corpus.py                 # Ingesta incremental
+    python MCP/corpus.py --force         # Reprocesa toda la biblioteca
+    python MCP/corpus.py --workers 2
+
+Variable de entorno: CORPUS_MANIFEST_PATH (además de PDFS_DIR y BM25_INDEX_PATH).
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from bm25_index import MCP_DIR, PDFS_DIR, IndiceBM25, firma, pasajes_de_pdf, pdfs_en_disco
+from pdf_cache import cache_pdf
+
+MANIFEST_PATH = os.getenv("CORPUS_MANIFEST_PATH", os.path.join(MCP_DIR, "corpus_manifest.json"))
+MANIFEST_VERSION = 1
+
+# Temas históricos que no se derivan del nombre del archivo
+ALIAS_TEMAS = {
+    "En_un_metro_bosque.pdf": ["un bosque en un metro"],
+}
+
+
+def temas_de(nombre: str) -> List[str]:
+    """Temas de un PDF: el nombre sin extensión en minúsculas, con y sin guiones bajos, y sus alias."""
+    base = os.path.splitext(nombre)[0].lower()
+    temas = [base, base.replace("_", " ")] + ALIAS_TEMAS.get(nombre, [])
+    return list(dict.fromkeys(temas))
+
+
+def sha256(ruta: str) -> str:
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def cargar_manifest(ruta: str = MANIFEST_PATH) -> Optional[Dict[str, object]]:
+    """Manifiesto guardado, o None si no existe o es de otra versión."""
+    try:
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            manifest = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def pdfs_registrados(directorio: str = PDFS_DIR) -> Dict[str, str]:
+    """
+    Tema → ruta del PDF según el manifiesto. Sin manifiesto se derivan de los
+    nombres de archivo del directorio (sin abrir los PDFs).
+    """
+    manifest = cargar_manifest()
+    if manifest is not None:
+        documentos = manifest["pdfs"]
+    else:
+        documentos = {
+            os.path.basename(ruta): {"temas": temas_de(os.path.basename(ruta))}
+            for ruta in pdfs_en_disco(directorio)
+        }
+    return {
+        tema: os.path.join(directorio, nombre)
+        for nombre, documento in documentos.items()
+        for tema in documento["temas"]
+    }
+
+
+def _ingerir(ruta: str) -> Dict[str, object]:
+    """Trabajo de un proceso: extrae y parte un PDF (el texto queda en la caché de páginas)."""
+    inicio = time.perf_counter()
+    paginas = cache_pdf().paginas(ruta)
+    return {
+        "pdf": os.path.basename(ruta),
+        "pasajes": pasajes_de_pdf(ruta, paginas),
+        "paginas": len(paginas),
+        "ms": round((time.perf_counter() - inicio) * 1000),
+    }
+
+
+def ingerir(directorio: str = PDFS_DIR, workers: Optional[int] = None, forzar: bool = False) -> Dict[str, object]:
+    """Actualiza el índice BM25 y el manifiesto; retorna el manifiesto nuevo."""
+    anterior = None if forzar else cargar_manifest()
+    previos = anterior["pdfs"] if anterior else {}
+    indice_previo = None if forzar else IndiceBM25.cargar()
+
+    rutas = pdfs_en_disco(directorio)
+    hashes = {os.path.basename(ruta): sha256(ruta) for ruta in rutas}
+
+    # Los PDFs sin cambios reutilizan sus pasajes del índice anterior
+    pasajes_por_pdf: Dict[str, List[Dict[str, object]]] = {}
+    if indice_previo is not None:
+        for pasaje in indice_previo.pasajes:
+            pasajes_por_pdf.setdefault(str(pasaje["pdf"]), []).append(pasaje)
+
+    pendientes = [
+        ruta for ruta in rutas
+        if previos.get(os.path.basename(ruta), {}).get("sha256") != hashes[os.path.basename(ruta)]
+        or os.path.basename(ruta) not in pasajes_por_pdf
+    ]
+
+    documentos: Dict[str, Dict[str, object]] = {}
+    for ruta in rutas:
+        nombre = os.path.basename(ruta)
+        if ruta not in pendientes:
+            documentos[nombre] = previos[nombre]
+            print(f"   = {nombre:<32} sin cambios")
+
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for resultado in pool.map(_ingerir, pendientes):
+                nombre = str(resultado["pdf"])
+                pasajes_por_pdf[nombre] = resultado["pasajes"]
+                documentos[nombre] = {"paginas": resultado["paginas"]}
+                print(
+                    f"   + {nombre:<32} {resultado['paginas']:>4} páginas, "
+                    f"{len(resultado['pasajes']):>5} pasajes en {resultado['ms']} ms"
+                )
+
+    pasajes: List[Dict[str, object]] = []
+    firmas: Dict[str, List[int]] = {}
+    for ruta in rutas:
+        nombre = os.path.basename(ruta)
+        pasajes.extend(pasajes_por_pdf[nombre])
+        firmas[nombre] = firma(ruta)
+        documentos[nombre] = {
+            **documentos[nombre],
+            "ruta": os.path.relpath(ruta, os.path.dirname(MCP_DIR)),
+            "sha256": hashes[nombre],
+            "tamano": firmas[nombre][0],
+            "pasajes": len(pasajes_por_pdf[nombre]),
+            "temas": temas_de(nombre),
+        }
+
+    if pendientes or indice_previo is None or indice_previo.firmas != firmas:
+        IndiceBM25(pasajes, firmas).guardar()
+
+    manifest = {"version": MANIFEST_VERSION, "pdfs": documentos}
+    temporal = MANIFEST_PATH + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(manifest, archivo, ensure_ascii=False, indent=2)
+    os.replace(temporal, MANIFEST_PATH)
+    return manifest
+
+
+def _main() -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingesta incremental de la biblioteca de PDFs.")
+    parser.add_argument("--pdfs", default=PDFS_DIR, help="Directorio con los PDFs")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--force", action="store_true", help="Reprocesa todos los PDFs")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    print(f"📚 Ingesta de {args.pdfs}")
+    manifest = ingerir(args.pdfs, workers=args.workers, forzar=args.force)
+    print(
+        f"✅ {len(manifest['pdfs'])} PDFs en {MANIFEST_PATH} "
+        f"({time.perf_counter() - inicio:.1f} s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
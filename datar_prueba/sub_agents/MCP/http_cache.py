@@ -0,0 +1,226 @@
+# MCP/http_cache.py
+
+"""
+Cliente HTTP con caché en disco para las herramientas del servidor MCP.
+
+- Un `requests.Session` compartido (pool keep-alive) con timeouts de conexión
+  y de lectura: una fuente lenta no bloquea la herramienta indefinidamente.
+- Caché en SQLite con el HTML (comprimido) y el texto ya extraído. Respeta
+  `Cache-Control: max-age` / `no-cache` / `no-store` y `Expires`; al vencer
+  revalida con `If-None-Match` (ETag) y `If-Modified-Since` (Last-Modified).
+- Si el origen falla o no responde a tiempo se sirve la copia vencida.
+
+Variables de entorno: HTTP_CACHE_PATH, HTTP_CACHE_DEFAULT_TTL,
+HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache.db"),
+)
+# Frescura cuando el origen no envía max-age, Expires ni Last-Modified
+DEFAULT_TTL = int(os.getenv("HTTP_CACHE_DEFAULT_TTL", "600"))        # Segundos
+# Tope de la frescura heurística (10% de la edad de Last-Modified, RFC 9111 §4.2.2)
+HEURISTIC_MAX_TTL = 24 * 3600
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))      # Segundos
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))           # Segundos
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))                  # Conexiones por host
+
+USER_AGENT = "datar-mcp-bosque/1.0 (+https://github.com/MangleRojo/adk-prueba)"
+
+_MAX_AGE_RE = re.compile(r"max-age\s*=\s*\"?(\d+)")
+
+
+@dataclass
+class Pagina:
+    """Texto de una página y de dónde salió: "cache", "revalidada", "red" o "vencida"."""
+
+    url: str
+    texto: str
+    origen: str
+    status: int
+    ms: float
+
+
+def extraer_texto(html: str) -> str:
+    """Texto visible del HTML, una línea por bloque."""
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text(separator="\n", strip=True)
+
+
+def frescura(headers, ahora: float) -> Optional[int]:
+    """Segundos que la respuesta sigue fresca según sus cabeceras; None = no almacenar."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    max_age = _MAX_AGE_RE.search(cache_control)
+    if max_age:
+        return int(max_age.group(1))
+
+    try:
+        if headers.get("Expires"):
+            return max(0, int(parsedate_to_datetime(headers["Expires"]).timestamp() - ahora))
+        if headers.get("Last-Modified"):
+            edad = ahora - parsedate_to_datetime(headers["Last-Modified"]).timestamp()
+            return int(min(max(edad, 0) * 0.1, HEURISTIC_MAX_TTL))
+    except (TypeError, ValueError):
+        # Fecha mal formada: el origen no dio una frescura utilizable
+        return 0
+    return DEFAULT_TTL
+
+
+class CachedHttpClient:
+    """GET con pool de conexiones, timeouts y caché HTTP condicional en disco."""
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        pool_size: int = POOL_SIZE,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS paginas (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                max_age INTEGER NOT NULL,
+                html BLOB NOT NULL,
+                texto TEXT NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    def _leer(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT status, etag, last_modified, fetched_at, max_age, texto FROM paginas WHERE url = ?",
+                (url,),
+            )
+            return cursor.fetchone()
+
+    def _guardar(self, url: str, resp: requests.Response, max_age: int, texto: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    resp.status_code,
+                    resp.headers.get("ETag"),
+                    resp.headers.get("Last-Modified"),
+                    time.time(),
+                    max_age,
+                    zlib.compress(resp.text.encode("utf-8")),
+                    texto,
+                ),
+            )
+            self._db.commit()
+
+    def _renovar(self, url: str, resp: requests.Response, max_age: Optional[int]) -> None:
+        """Tras un 304: la copia guardada vuelve a estar fresca (y puede traer ETag nuevo)."""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE paginas SET fetched_at = ?, max_age = ?,
+                    etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                WHERE url = ?
+                """,
+                (
+                    time.time(),
+                    max_age or 0,
+                    resp.headers.get("ETag"),
+                    resp.headers.get("Last-Modified"),
+                    url,
+                ),
+            )
+            self._db.commit()
+
+    def html(self, url: str) -> Optional[str]:
+        """HTML crudo guardado para `url`, si lo hay."""
+        with self._lock:
+            fila = self._db.execute("SELECT html FROM paginas WHERE url = ?", (url,)).fetchone()
+        return zlib.decompress(fila[0]).decode("utf-8") if fila else None
+
+    def get(self, url: str) -> Pagina:
+        """Texto de `url` desde la caché si está fresco; si no, lo revalida o lo descarga."""
+        inicio = time.perf_counter()
+
+        def _pagina(texto: str, origen: str, status: int) -> Pagina:
+            return Pagina(url, texto, origen, status, round((time.perf_counter() - inicio) * 1000, 1))
+
+        guardada = self._leer(url)
+        ahora = time.time()
+        if guardada is not None:
+            status, etag, last_modified, fetched_at, max_age, texto = guardada
+            if ahora - fetched_at < max_age:
+                return _pagina(texto, "cache", status)
+
+        headers = {}
+        if guardada is not None:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            if guardada is not None:
+                return _pagina(texto, "vencida", status)
+            raise
+
+        if resp.status_code == 304 and guardada is not None:
+            self._renovar(url, resp, frescura(resp.headers, ahora))
+            return _pagina(texto, "revalidada", status)
+
+        if resp.status_code >= 500 and guardada is not None:
+            return _pagina(texto, "vencida", status)
+
+        texto = extraer_texto(resp.text)
+        max_age = frescura(resp.headers, ahora)
+        if resp.ok and max_age is not None:
+            self._guardar(url, resp, max_age, texto)
+        return _pagina(texto, "red", resp.status_code)
+
+
+_cliente: Optional[CachedHttpClient] = None
+_cliente_lock = threading.Lock()
+
+
+def cliente() -> CachedHttpClient:
+    """Cliente compartido por todas las herramientas del proceso."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = CachedHttpClient()
+        return _cliente
@@ -1,16 +1,21 @@
 # MCP/mcp_server_bosque.py
 
 from mcp.server.fastmcp import FastMCP
-import requests
-from bs4 import BeautifulSoup
-import fitz  # PyMuPDF
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 try:
     import google.generativeai as genai
 except Exception:  # ImportError or module not available in this env
     genai = None
 
+from http_cache import cliente as cliente_http
+from pdf_cache import cache_pdf
+from bm25_index import indice, precargar
+from corpus import MANIFEST_PATH, pdfs_registrados
+
 # Inicializa el servidor
 mcp = FastMCP("servidor_bosque")
 
@@ -21,13 +26,11 @@ if genai is not None:
         # fallthrough: keep genai enabled but configuration failed; model calls will handle errors
         pass
 
-PDFS = {
-    "filosofia_fungi": "pdfs/Filosofia_fungi.pdf",
-    "margullis": "pdfs/Margullis.pdf",
-    "hongo_planta": "pdfs/Hongo_planta.pdf",
-    "donna": "pdfs/donna.pdf",
-    "un bosque en un metro": "pdfs/Un_bosque_en_un_metro.pdf",
-}
+# Tema → PDF, desde el manifiesto que genera `python MCP/corpus.py`
+PDFS = pdfs_registrados()
+if not precargar():
+    # stderr: stdout es el canal stdio del protocolo MCP
+    print(f"⚠️ Sin índice de pasajes precalculado ({MANIFEST_PATH}): ejecuta `python MCP/corpus.py`", file=sys.stderr)
 
 # Fuentes fijas
 FUENTES = {
@@ -37,19 +40,45 @@ FUENTES = {
     "briofitas": "https://stri.si.edu/es/noticia/briofitas",
 }
 
+# Pasajes que `explorar_pdf` envía al modelo (los de mayor puntaje BM25)
+PASAJES_K = int(os.getenv("PASAJES_K", "5"))
+
+# Relevancia BM25 (0 a 1) que debe tener el mejor pasaje para que `explorar`
+# consulte los PDFs con un tema libre; por debajo, la coincidencia es casual
+RELEVANCIA_MINIMA = float(os.getenv("PASAJES_RELEVANCIA_MINIMA", "0.35"))
+
+# Plazo total de `explorar`; lo que no llegue a tiempo se marca como omitido
+EXPLORAR_DEADLINE = float(os.getenv("EXPLORAR_DEADLINE", "20"))  # Segundos
+
+# Hilos compartidos por las llamadas a `explorar` (PDF + una por fuente web)
+_pool_fuentes = ThreadPoolExecutor(max_workers=len(FUENTES) + 2, thread_name_prefix="explorar")
+
+# Los registros van a stderr: stdout es el canal stdio del protocolo MCP
+
 def log_uso(fuente, tipo):
     """Guarda registro de cada fuente usada."""
+    log_evento(f"Usando {tipo}: {fuente}")
+
+def log_evento(mensaje):
+    """Registro con marca de tiempo para latencias y plazos vencidos."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] Usando {tipo}: {fuente}", flush=True)
+    # Una sola escritura por línea: varios hilos registran a la vez
+    print(f"[{timestamp}] {mensaje}\n", end="", file=sys.stderr, flush=True)
+
+def _medir(etiqueta, funcion, *args):
+    """Ejecuta `funcion` y registra su latencia (también si termina después del plazo)."""
+    inicio = time.perf_counter()
+    try:
+        return funcion(*args)
+    finally:
+        log_evento(f"Latencia de {etiqueta}: {(time.perf_counter() - inicio) * 1000:.0f} ms")
 
 @mcp.tool()
 def leer_pagina(url: str) -> str:
     """Lee y devuelve texto de una página web."""
-    log_uso(url, "página web")
-    resp = requests.get(url)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    text = soup.get_text(separator="\n", strip=True)
-    return text[:4000]
+    pagina = cliente_http().get(url)
+    log_uso(f"{url} ({pagina.origen}, {pagina.ms} ms)", "página web")
+    return pagina.texto[:4000]
 
 @mcp.tool()
 def explorar_pdf(tema: str) -> str:
@@ -57,24 +86,28 @@ def explorar_pdf(tema: str) -> str:
     Explora un los archivos que estan en PDFS, busca los temas asociados y genera
     un conjunto de preguntas reflexivas basadas en filosofía de la biología, simbiosis,
     concepto de individuo y asociaciones.Usa el modelo Gemini para formularlas.
+    El tema puede ser libre: se buscan los pasajes más relevantes de toda la biblioteca.
     """
     tema = tema.lower().strip()
-    if tema not in PDFS:
-        return f"No hay un PDF registrado para el tema '{tema}'."
 
-    ruta_pdf = PDFS[tema]
-    if not os.path.exists(ruta_pdf):
+    # Un tema registrado en PDFS limita la búsqueda a su archivo
+    ruta_pdf = PDFS.get(tema)
+    if ruta_pdf is not None and not os.path.exists(ruta_pdf):
         return f"No se encontró el archivo: {ruta_pdf}"
 
-    log_uso(ruta_pdf, "PDF")
-
-    # Extraer texto del PDF
-    texto = ""
-    with fitz.open(ruta_pdf) as doc:
-        for pagina in doc:
-            texto += pagina.get_text()
+    pdfs = (os.path.basename(ruta_pdf),) if ruta_pdf else ()
+    pasajes = indice().buscar(tema, k=PASAJES_K, pdfs=pdfs)
+    if pasajes:
+        fuente = ", ".join(dict.fromkeys(f"{p['pdf']} p. {p['pagina']}" for p in pasajes))
+        texto_corto = "\n\n".join(f"[{p['pdf']}, p. {p['pagina']}] {p['texto']}" for p in pasajes)
+    elif ruta_pdf is not None:
+        # Ningún pasaje coincide con el nombre del tema: el inicio del documento
+        fuente = os.path.basename(ruta_pdf)
+        texto_corto = cache_pdf().texto(ruta_pdf, 6000)  # limitar el texto para el modelo
+    else:
+        return f"No encontré pasajes sobre '{tema}' en la biblioteca de PDFs."
 
-    texto_corto = texto[:6000]  # limitar el texto para el modelo
+    log_uso(fuente, "PDF")
 
     # Crear prompt reflexivo
     prompt = f"""
@@ -101,7 +134,7 @@ def explorar_pdf(tema: str) -> str:
         salida = f"Error al generar preguntas con Gemini: {e}"
 
     resultado = (
-        f"📄 Fuente PDF: {ruta_pdf}\n\n"
+        f"📄 Fuente PDF: {fuente}\n\n"
         f"💬 Resultado generado por IA:\n\n{salida}"
     )
     return resultado
@@ -110,23 +143,37 @@ def explorar_pdf(tema: str) -> str:
 def explorar(tema: str) -> str:
     """
     Busca información sobre un tema combinando PDFs y fuentes web.
+    Las fuentes se consultan en paralelo con un plazo común (EXPLORAR_DEADLINE).
     """
     tema = tema.lower().strip()
     respuesta = ""
 
-    # Intentar con PDF
-    if tema in PDFS:
-        respuesta += explorar_pdf(tema) + "\n\n"
-
-    # Buscar fuente web
+    # Cada fuente: (etiqueta, futuro que produce su bloque de texto)
+    fuentes = []
+    if tema in PDFS or indice().buscar(tema, k=1, relevancia_minima=RELEVANCIA_MINIMA):
+        etiqueta_pdf = f"PDF {os.path.basename(PDFS.get(tema, 'biblioteca'))}"
+        fuentes.append((etiqueta_pdf, _pool_fuentes.submit(
+            _medir, etiqueta_pdf, lambda: explorar_pdf(tema) + "\n\n"
+        )))
     for clave, link in FUENTES.items():
         if clave in tema:
             log_uso(link, "fuente web")
-            resp = requests.get(link)
-            soup = BeautifulSoup(resp.text, "html.parser")
-            text = soup.get_text(separator="\n", strip=True)
-            resumen = text[:1500]
-            respuesta += f"🌐 Fuente web: {link}\n\n{resumen}\n\n"
+            fuentes.append((link, _pool_fuentes.submit(
+                _medir, link,
+                lambda link=link: f"🌐 Fuente web: {link}\n\n{cliente_http().get(link).texto[:1500]}\n\n",
+            )))
+
+    wait([futuro for _, futuro in fuentes], timeout=EXPLORAR_DEADLINE)
+
+    # En el orden de siempre: PDF primero y luego las fuentes web
+    for etiqueta, futuro in fuentes:
+        if not futuro.done():
+            log_evento(f"Plazo vencido ({EXPLORAR_DEADLINE:g} s): {etiqueta}")
+            respuesta += f"⏱️ {etiqueta}: sin respuesta tras {EXPLORAR_DEADLINE:g} s, se omitió.\n\n"
+        elif futuro.exception() is not None:
+            respuesta += f"⚠️ {etiqueta}: no se pudo consultar ({futuro.exception()}).\n\n"
+        else:
+            respuesta += futuro.result()
 
     if not respuesta.strip():
         respuesta = f"No encontré información registrada para el tema '{tema}'."
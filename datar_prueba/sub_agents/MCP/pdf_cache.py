@@ -0,0 +1,159 @@
+# MCP/pdf_cache.py
+
+"""
+Caché del texto extraído de los PDFs del servidor MCP.
+
+El texto de cada página se guarda en SQLite (comprimido) con la clave
+(ruta, tamaño, mtime): si el archivo cambia en disco se vuelve a extraer.
+La extracción es incremental y se detiene en cuanto se alcanza el
+presupuesto de caracteres pedido; una llamada posterior con un presupuesto
+mayor continúa desde la última página guardada. Las llamadas que caben en lo
+ya extraído no abren PyMuPDF.
+
+Variable de entorno: PDF_CACHE_PATH.
+"""
+
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+CACHE_PATH = os.getenv(
+    "PDF_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_cache.db"),
+)
+
+
+class PdfTextCache:
+    """Texto por página de cada PDF, persistente entre llamadas y reinicios."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self._lock = threading.Lock()
+        # Un lock por PDF: dos llamadas simultáneas no extraen las mismas páginas
+        self._extracciones: dict = {}
+        # La ingesta escribe desde varios procesos a la vez: esperar el lock en vez de fallar
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documentos (
+                ruta TEXT PRIMARY KEY,
+                tamano INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                paginas_total INTEGER NOT NULL,
+                paginas_hechas INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS paginas (
+                ruta TEXT NOT NULL,
+                numero INTEGER NOT NULL,
+                texto BLOB NOT NULL,
+                PRIMARY KEY (ruta, numero)
+            );
+            """
+        )
+        self._db.commit()
+
+    def _lock_de(self, ruta: str) -> threading.Lock:
+        with self._lock:
+            return self._extracciones.setdefault(ruta, threading.Lock())
+
+    def _documento(self, ruta: str, tamano: int, mtime_ns: int) -> Optional[Tuple[int, int]]:
+        """(páginas totales, páginas ya extraídas) si la copia corresponde al archivo actual."""
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT tamano, mtime_ns, paginas_total, paginas_hechas FROM documentos WHERE ruta = ?",
+                (ruta,),
+            ).fetchone()
+            if fila is None:
+                return None
+            if (fila[0], fila[1]) != (tamano, mtime_ns):
+                # El PDF cambió: se descarta lo extraído
+                self._db.execute("DELETE FROM paginas WHERE ruta = ?", (ruta,))
+                self._db.execute("DELETE FROM documentos WHERE ruta = ?", (ruta,))
+                self._db.commit()
+                return None
+            return fila[2], fila[3]
+
+    def _guardadas(self, ruta: str) -> Iterator[str]:
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT texto FROM paginas WHERE ruta = ? ORDER BY numero", (ruta,)
+            ).fetchall()
+        for (texto,) in filas:
+            yield zlib.decompress(texto).decode("utf-8")
+
+    def _guardar(
+        self, ruta: str, tamano: int, mtime_ns: int, total: int, desde: int, textos: List[str]
+    ) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO paginas VALUES (?, ?, ?)",
+                [
+                    (ruta, desde + i, zlib.compress(texto.encode("utf-8")))
+                    for i, texto in enumerate(textos)
+                ],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO documentos VALUES (?, ?, ?, ?, ?)",
+                (ruta, tamano, mtime_ns, total, desde + len(textos)),
+            )
+            self._db.commit()
+
+    def paginas(self, ruta_pdf: str, max_chars: Optional[int] = None) -> List[str]:
+        """
+        Texto de las páginas de `ruta_pdf` en orden, hasta cubrir `max_chars`
+        caracteres (None = todas). Solo extrae con PyMuPDF lo que falte.
+        """
+        ruta = os.path.abspath(ruta_pdf)
+        estado = os.stat(ruta)
+        tamano, mtime_ns = estado.st_size, estado.st_mtime_ns
+
+        textos: List[str] = []
+        acumulado = 0
+
+        def _basta() -> bool:
+            return max_chars is not None and acumulado >= max_chars
+
+        with self._lock_de(ruta):
+            documento = self._documento(ruta, tamano, mtime_ns)
+            if documento is not None:
+                for texto in self._guardadas(ruta):
+                    textos.append(texto)
+                    acumulado += len(texto)
+                    if _basta():
+                        return textos
+                total, hechas = documento
+                if hechas >= total:
+                    return textos
+
+            import fitz  # PyMuPDF, solo si hay páginas por extraer
+
+            nuevas: List[str] = []
+            with fitz.open(ruta) as doc:
+                total = doc.page_count
+                for numero in range(len(textos), total):
+                    texto = doc[numero].get_text()
+                    nuevas.append(texto)
+                    acumulado += len(texto)
+                    if _basta():
+                        break
+            self._guardar(ruta, tamano, mtime_ns, total, len(textos), nuevas)
+            return textos + nuevas
+
+    def texto(self, ruta_pdf: str, max_chars: int) -> str:
+        """Los primeros `max_chars` caracteres del PDF."""
+        return "".join(self.paginas(ruta_pdf, max_chars))[:max_chars]
+
+
+_cache: Optional[PdfTextCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache_pdf() -> PdfTextCache:
+    """Caché compartida por todas las herramientas del proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PdfTextCache()
+        return _cache
@@ -3,8 +3,16 @@
 Script de ejecución del API DATAR
 ==================================
 Inicia el servidor FastAPI con root_agent configurado correctamente.
+
+    python run_api.py                 # Desarrollo: un solo proceso
+    python run_api.py --prod          # Producción: un worker por núcleo disponible
+    python run_api.py --workers 4     # Número de workers explícito
+
+Con más de un worker se activa `SHARED_STATE`: sesiones, buckets del rate
+limit y caché de respuestas pasan a SQLite en disco local (ver config.py).
 """
 
+import argparse
 import os
 import sys
 import uvicorn
@@ -12,36 +20,89 @@ import uvicorn
 # Agregar el directorio raíz al path para importaciones correctas
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+
+def available_cores() -> int:
+    """Núcleos utilizables por este proceso: afinidad de CPU y cuota del cgroup (contenedores)."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" (sin límite) o "200000 100000" (2 CPUs)
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r", encoding="utf-8") as cpu_max:
+            quota, period = cpu_max.read().split()[:2]
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inicia el API DATAR.")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        help="Modo producción: API_WORKERS workers (0 = uno por núcleo disponible)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Número de workers (anula --prod)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.workers is not None:
+        workers = max(1, args.workers)
+    elif args.prod:
+        workers = int(os.getenv("API_WORKERS", "0")) or available_cores()
+    else:
+        workers = 1
+
+    if workers > 1:
+        # Los workers heredan el entorno: todos leen config.py con el estado compartido activo
+        os.environ["SHARED_STATE"] = "True"
+
     print("=" * 70)
     print("🌱 INICIANDO DATAR - Sistema Agéntico Ambiental")
     print("=" * 70)
-    
+
     # Verificar que root_agent está configurado
     try:
+        from datar_prueba import config
         from datar_prueba.api import app, root_agent
-        
+        from datar_prueba.agent import SUB_AGENTS
+
         print(f"✅ API importado correctamente")
         print(f"✅ root_agent: {root_agent.name}")
         print(f"✅ Descripción: {root_agent.description}")
-        print(f"✅ Sub-agentes: {len(root_agent.sub_agents) if hasattr(root_agent, 'sub_agents') else 0}")
-        
+        print(f"✅ Sub-agentes: {len(SUB_AGENTS.names())} declarados, {len(SUB_AGENTS.pending())} por cargar")
+
     except Exception as e:
         print(f"❌ Error al importar API: {e}")
         sys.exit(1)
-    
+
+    if workers > 1 and not config.validate_config():
+        print("❌ Configuración inválida para varios workers")
+        sys.exit(1)
+
     print("\n" + "=" * 70)
     print("🔗 Iniciando servidor...")
     print("=" * 70)
-    print(f"📍 Escuchando en: http://0.0.0.0:8000")
-    print(f"📚 Documentación: http://localhost:8000/docs")
-    print(f"🤖 root_agent status: http://localhost:8000/root_agent/status")
+    print(f"📍 Escuchando en: http://{args.host}:{args.port}")
+    print(f"👷 Workers: {workers}" + (f" (estado compartido en {config.SHARED_STATE_DB_PATH})" if workers > 1 else ""))
+    print(f"📚 Documentación: http://localhost:{args.port}/docs")
+    print(f"🤖 root_agent status: http://localhost:{args.port}/root_agent/status")
     print("=" * 70 + "\n")
-    
+
     uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
+        # Con varios workers uvicorn necesita la ruta de importación para lanzar cada proceso
+        "datar_prueba.api:app" if workers > 1 else app,
+        host=args.host,
+        port=args.port,
+        workers=workers,
         reload=False,
         log_level="info"
     )
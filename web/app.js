@@ -1,6 +1,8 @@
 const STORAGE_KEYS = {
   baseUrl: 'datar:baseUrl',
   sessionId: 'datar:sessionId',
+  // 'sse' desactiva el WebSocket y usa POST /chat/stream en cada mensaje
+  transport: 'datar:transport',
 };
 
 const DEFAULT_BASE_URL = 'http://localhost:8000';
@@ -15,6 +17,7 @@ const elements = {
   refreshAgent: $('#refresh-agent'),
   sessionSelect: $('#session-select'),
   refreshSessions: $('#refresh-sessions'),
+  moreSessions: $('#more-sessions'),
   newSession: $('#new-session'),
   chatHistory: $('#chat-history'),
   chatForm: $('#chat-form'),
@@ -30,10 +33,29 @@ const state = {
   baseUrl: '',
   sessionId: null,
   sessions: [],
+  // Cabecera `X-Next-Cursor` de la última página de GET /sessions (null si no hay más)
+  sessionsCursor: null,
   messages: [],
+  // Sincronización incremental del historial: mensajes confirmados por el servidor
+  syncedCount: 0,
+  lastSeq: 0,
   isSending: false,
+  // Canal persistente /ws/chat (kioscos): una conexión para todos los turnos de la sesión
+  useSocket: 'WebSocket' in window,
+  socket: null,
+  socketReady: null,
+  socketSessionId: null,
+  socketTurns: new Map(),
+  socketRetries: 0,
+  socketLastFrameAt: 0,
+  socketTurnSeq: 0,
 };
 
+const HISTORY_PAGE_SIZE = 200;
+// Sin tramas del servidor (que hace ping cada ~25 s) durante este tiempo, se reconecta
+const SOCKET_IDLE_MS = 60000;
+const SOCKET_RETRY_MAX_MS = 15000;
+
 const normalizeAgentResponse = (rawText, originalMessage) => {
   const result = {
     text: '',
@@ -127,7 +149,7 @@ const logEvent = (type, message) => {
   elements.logs.scrollTop = 0;
 };
 
-const apiFetch = async (path, options = {}) => {
+const apiRequest = async (path, options = {}) => {
   if (!state.baseUrl) {
     throw new Error('Configura la URL del API antes de continuar');
   }
@@ -157,9 +179,219 @@ const apiFetch = async (path, options = {}) => {
     throw new Error(typeof detail === 'string' ? detail : JSON.stringify(detail));
   }
 
-  return payload;
+  return { payload, headers: response.headers };
+};
+
+const apiFetch = async (path, options = {}) => (await apiRequest(path, options)).payload;
+
+const parseSseBlock = (block) => {
+  let event = 'message';
+  const dataLines = [];
+  block.split('\n').forEach((line) => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trimStart());
+    }
+  });
+  if (dataLines.length === 0) return null;
+  try {
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+  } catch (error) {
+    return null;
+  }
+};
+
+const streamChat = async (payload, { onToken, onFallback } = {}) => {
+  if (!state.baseUrl) {
+    throw new Error('Configura la URL del API antes de continuar');
+  }
+
+  const response = await fetch(`${state.baseUrl}/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify(payload),
+  });
+
+  if (!response.ok || !response.body) {
+    const raw = await response.text();
+    let detail = raw;
+    try {
+      detail = JSON.parse(raw).detail || raw;
+    } catch (error) {
+      // La respuesta no era JSON; se usa el texto tal cual
+    }
+    throw new Error(typeof detail === 'string' && detail ? detail : response.statusText);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const parsed = parseSseBlock(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      if (!parsed) continue;
+
+      if (parsed.event === 'token') {
+        onToken?.(parsed.data.text || '');
+      } else if (parsed.event === 'fallback') {
+        onFallback?.(parsed.data.text || '');
+      } else if (parsed.event === 'done') {
+        result = parsed.data;
+      }
+    }
+  }
+
+  if (!result) {
+    throw new Error('El stream terminó sin respuesta final del agente');
+  }
+  return result;
+};
+
+const socketUrl = (sessionId, afterSeq) => {
+  const url = new URL('/ws/chat', state.baseUrl);
+  url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+  if (sessionId) {
+    url.searchParams.set('session_id', sessionId);
+    url.searchParams.set('after_seq', String(afterSeq || 0));
+  }
+  return url.toString();
+};
+
+const closeSocket = () => {
+  if (state.socket) {
+    state.socket.onclose = null;
+    state.socket.close();
+  }
+  state.socket = null;
+  state.socketReady = null;
+  state.socketSessionId = null;
+  state.socketTurns.forEach(({ reject }) => reject(new Error('Conexión cerrada')));
+  state.socketTurns.clear();
+};
+
+const handleSocketFrame = (frame) => {
+  state.socketLastFrameAt = Date.now();
+
+  if (frame.type === 'ping') {
+    state.socket?.send(JSON.stringify({ type: 'pong', ts: frame.ts }));
+    return;
+  }
+  if (frame.type === 'sync') {
+    // Reanudación: mensajes que llegaron mientras no había conexión
+    const missed = Array.isArray(frame.messages) ? frame.messages : [];
+    if (missed.length > 0 && frame.session_id === state.sessionId && !state.isSending) {
+      applyHistory(missed.map((msg) => withNormalizedAssistant(msg)), frame.last_seq, true);
+      logEvent('ok', `Sesión reanudada (${missed.length} mensajes recuperados)`);
+    }
+    return;
+  }
+
+  const turn = state.socketTurns.get(frame.id);
+  if (!turn) return;
+  if (frame.session_id) {
+    state.socketSessionId = frame.session_id;
+  }
+  if (frame.type === 'token') {
+    turn.onToken?.(frame.text || '');
+  } else if (frame.type === 'fallback') {
+    turn.onFallback?.(frame.text || '');
+  } else if (frame.type === 'done') {
+    state.socketTurns.delete(frame.id);
+    turn.resolve(frame);
+  } else if (frame.type === 'error') {
+    state.socketTurns.delete(frame.id);
+    turn.reject(new Error(frame.detail || 'Error del canal de chat'));
+  }
+};
+
+const scheduleReconnect = () => {
+  // Solo vale la pena reconectar si hay una conversación que reanudar
+  if (!state.sessionId || !state.useSocket) return;
+  const delay = Math.min(SOCKET_RETRY_MAX_MS, 500 * 2 ** state.socketRetries);
+  state.socketRetries += 1;
+  setTimeout(() => {
+    if (!state.socket && state.sessionId && state.useSocket) {
+      openSocket(state.sessionId).catch(() => {});
+    }
+  }, delay);
+};
+
+const openSocket = (sessionId) => {
+  closeSocket();
+  state.socketReady = new Promise((resolve, reject) => {
+    const socket = new WebSocket(socketUrl(sessionId, state.lastSeq));
+    state.socket = socket;
+    state.socketSessionId = sessionId || null;
+
+    socket.onopen = () => {
+      state.socketRetries = 0;
+      state.socketLastFrameAt = Date.now();
+      resolve(socket);
+    };
+    socket.onmessage = (event) => {
+      try {
+        handleSocketFrame(JSON.parse(event.data));
+      } catch (error) {
+        logEvent('warn', `Trama inválida del WebSocket: ${error.message}`);
+      }
+    };
+    socket.onerror = () => reject(new Error('No fue posible abrir el WebSocket'));
+    socket.onclose = () => {
+      reject(new Error('WebSocket cerrado'));
+      state.socket = null;
+      state.socketReady = null;
+      state.socketTurns.forEach((turn) => turn.reject(
+        new Error('Conexión perdida; la respuesta se recuperará al reconectar'),
+      ));
+      state.socketTurns.clear();
+      scheduleReconnect();
+    };
+  });
+  return state.socketReady;
+};
+
+const socketChat = async (payload, { onToken, onFallback } = {}) => {
+  const sessionId = payload.session_id || null;
+  try {
+    if (!state.socket || state.socketSessionId !== sessionId) {
+      // La conexión queda ligada a una sesión: cambiar de sesión abre otra
+      await openSocket(sessionId);
+    } else {
+      await state.socketReady;
+    }
+  } catch (error) {
+    error.connectFailed = true;
+    throw error;
+  }
+
+  const id = `t${(state.socketTurnSeq += 1)}`;
+  return new Promise((resolve, reject) => {
+    state.socketTurns.set(id, { onToken, onFallback, resolve, reject });
+    state.socket.send(JSON.stringify({ type: 'message', id, ...payload }));
+  });
 };
 
+// Vigilancia del latido: una conexión muda (p. ej. tras suspender el equipo) se reabre
+setInterval(() => {
+  if (state.socket && Date.now() - state.socketLastFrameAt > SOCKET_IDLE_MS) {
+    logEvent('warn', 'Sin latido del servidor; reconectando…');
+    state.socket.close();
+  }
+}, SOCKET_IDLE_MS / 4);
+
 const renderAgentInfo = (info) => {
   const container = elements.agentInfo;
   if (!container) return;
@@ -297,10 +529,24 @@ const loadAgentInfo = async () => {
   }
 };
 
-const loadSessions = async () => {
+const loadSessions = async ({ more = false } = {}) => {
   try {
-    const sessions = await apiFetch('/sessions');
-    state.sessions = Array.isArray(sessions) ? sessions : [];
+    // "Cargar más" continúa desde el cursor de la página anterior
+    const cursor = more ? state.sessionsCursor : null;
+    const { payload, headers } = await apiRequest(
+      cursor ? `/sessions?cursor=${encodeURIComponent(cursor)}` : '/sessions',
+    );
+    const page = Array.isArray(payload) ? payload : [];
+    if (more) {
+      const known = new Set(state.sessions.map((item) => item.session_id));
+      state.sessions = state.sessions.concat(page.filter((item) => !known.has(item.session_id)));
+    } else {
+      state.sessions = page;
+    }
+    state.sessionsCursor = headers.get('X-Next-Cursor');
+    if (elements.moreSessions) {
+      elements.moreSessions.hidden = !state.sessionsCursor;
+    }
 
     if (state.sessionId && !state.sessions.find((item) => item.session_id === state.sessionId)) {
       // Mantener la sesión local aunque no esté en el backend (posible expiración)
@@ -320,19 +566,48 @@ const loadSessions = async () => {
   }
 };
 
-const loadSessionHistory = async (sessionId) => {
+const resetHistory = () => {
+  state.messages = [];
+  state.syncedCount = 0;
+  state.lastSeq = 0;
+};
+
+const applyHistory = (fetched, lastSeq, incremental) => {
+  // Los mensajes locales aún no confirmados se reemplazan por los del servidor
+  const synced = incremental ? state.messages.slice(0, state.syncedCount) : [];
+  state.messages = synced.concat(fetched);
+  state.syncedCount = state.messages.length;
+  state.lastSeq = lastSeq;
+  renderMessages();
+};
+
+const loadSessionHistory = async (sessionId, { incremental = false } = {}) => {
   if (!sessionId) {
-    state.messages = [];
+    resetHistory();
     renderMessages();
     return;
   }
 
   try {
-    const history = await apiFetch(`/sessions/${sessionId}`);
-    const rawMessages = Array.isArray(history?.messages) ? history.messages : [];
-    state.messages = rawMessages.map((msg) => withNormalizedAssistant(msg));
-    renderMessages();
-    logEvent('ok', `Historial cargado para la sesión ${sessionId}`);
+    // Solo se piden los mensajes posteriores al último `seq` ya sincronizado
+    const afterSeq = incremental ? state.lastSeq : 0;
+    let lastSeq = afterSeq;
+    const fetched = [];
+    let hasMore = true;
+    while (hasMore) {
+      const history = await apiFetch(
+        `/sessions/${sessionId}?after_seq=${lastSeq}&limit=${HISTORY_PAGE_SIZE}`,
+      );
+      const rawMessages = Array.isArray(history?.messages) ? history.messages : [];
+      fetched.push(...rawMessages.map((msg) => withNormalizedAssistant(msg)));
+      hasMore = Boolean(history?.has_more) && rawMessages.length > 0;
+      lastSeq = history?.last_seq ?? lastSeq;
+    }
+
+    applyHistory(fetched, lastSeq, incremental);
+    logEvent('ok', incremental
+      ? `Historial sincronizado (${fetched.length} mensajes nuevos)`
+      : `Historial cargado para la sesión ${sessionId}`);
   } catch (error) {
     logEvent('error', `No se pudo obtener el historial: ${error.message}`);
   }
@@ -361,31 +636,89 @@ const sendMessage = async (message) => {
     payload.session_id = state.sessionId;
   }
 
+  const assistantMessage = {
+    role: 'assistant',
+    content: '',
+    timestamp: new Date().toISOString(),
+    type: 'normal',
+  };
+
   try {
     logEvent('warn', 'Enviando mensaje al agente…');
-    const response = await apiFetch('/chat', {
-      method: 'POST',
-      body: JSON.stringify(payload),
-    });
+    state.messages.push(assistantMessage);
+    renderMessages();
+    const contentNodes = elements.chatHistory.querySelectorAll('.message .content');
+    const streamingNode = contentNodes[contentNodes.length - 1];
+
+    const updateStreamingNode = () => {
+      if (streamingNode) {
+        streamingNode.textContent = assistantMessage.content;
+      }
+      elements.chatHistory.scrollTop = elements.chatHistory.scrollHeight;
+    };
+
+    const handlers = {
+      onToken: (text) => {
+        assistantMessage.content += text;
+        updateStreamingNode();
+      },
+      onFallback: (text) => {
+        assistantMessage.content = text;
+        updateStreamingNode();
+      },
+    };
+
+    let response;
+    if (state.useSocket) {
+      try {
+        response = await socketChat(payload, handlers);
+      } catch (error) {
+        if (!error.connectFailed) throw error;
+        // No se pudo abrir el WebSocket (proxy sin soporte, servidor antiguo): SSE
+        logEvent('warn', `WebSocket no disponible (${error.message}); se usa /chat/stream`);
+        state.useSocket = false;
+        response = await streamChat(payload, handlers);
+      }
+    } else {
+      response = await streamChat(payload, handlers);
+    }
 
+    const isNewSession = response.session_id !== state.sessionId;
+    if (isNewSession) {
+      // Sesión nueva: aún no hay mensajes sincronizados con el servidor
+      state.syncedCount = 0;
+      state.lastSeq = 0;
+    }
     setSessionId(response.session_id);
 
     const agentAnswer = normalizeAgentResponse(response.response, trimmedMessage);
 
-    state.messages.push({
-      role: 'assistant',
-      content: agentAnswer.text,
-      timestamp: response.timestamp || new Date().toISOString(),
-      type: agentAnswer.isEcho ? 'echo' : 'normal',
-    });
+    assistantMessage.content = agentAnswer.text;
+    assistantMessage.timestamp = response.timestamp || assistantMessage.timestamp;
+    assistantMessage.type = agentAnswer.isEcho ? 'echo' : 'normal';
     renderMessages();
 
-    await loadSessions();
-    await loadSessionHistory(response.session_id);
+    if (isNewSession) {
+      await loadSessions();
+    }
+    if (response.last_seq === state.lastSeq + 2 && state.messages.length === state.syncedCount + 2) {
+      // El servidor guardó exactamente el turno que ya se muestra: no hace falta pedir el historial
+      state.syncedCount = state.messages.length;
+      state.lastSeq = response.last_seq;
+    } else {
+      await loadSessionHistory(response.session_id, { incremental: true });
+    }
 
+    const firstToken = response.timing?.time_to_first_token_ms;
+    if (firstToken != null) {
+      logEvent('ok', `Primer token en ${Math.round(firstToken)} ms · total ${Math.round(response.timing.total_ms)} ms`);
+    }
     logEvent('ok', 'Respuesta recibida del agente');
   } catch (error) {
     logEvent('error', `Error al enviar mensaje: ${error.message}`);
+    if (!assistantMessage.content) {
+      state.messages = state.messages.filter((msg) => msg !== assistantMessage);
+    }
     state.messages.push({
       role: 'error',
       content: error.message,
@@ -419,6 +752,7 @@ const clearLogs = () => {
 const registerEvents = () => {
   elements.baseUrlInput?.addEventListener('change', (event) => {
     setBaseUrl(event.target.value || DEFAULT_BASE_URL);
+    closeSocket();
   });
 
   elements.pingBtn?.addEventListener('click', () => {
@@ -433,9 +767,13 @@ const registerEvents = () => {
     loadSessions();
   });
 
+  elements.moreSessions?.addEventListener('click', () => {
+    loadSessions({ more: true });
+  });
+
   elements.newSession?.addEventListener('click', () => {
     setSessionId(null);
-    state.messages = [];
+    resetHistory();
     renderMessages();
     logEvent('warn', 'Se iniciará una nueva sesión en el próximo mensaje.');
   });
@@ -444,7 +782,7 @@ const registerEvents = () => {
     const selected = event.target.value;
     if (!selected) {
       setSessionId(null);
-      state.messages = [];
+      resetHistory();
       renderMessages();
       return;
     }
@@ -467,6 +805,9 @@ const registerEvents = () => {
 const bootstrap = async () => {
   const storedUrl = localStorage.getItem(STORAGE_KEYS.baseUrl) || DEFAULT_BASE_URL;
   setBaseUrl(storedUrl);
+  if (localStorage.getItem(STORAGE_KEYS.transport) === 'sse') {
+    state.useSocket = false;
+  }
 
   const storedSession = localStorage.getItem(STORAGE_KEYS.sessionId);
   if (storedSession) {